@@ -0,0 +1,63 @@
+"""
+	Measures how long a fresh interpreter takes to import openet_client and create a client, and which heavy
+	modules that pulls in. Each run is a separate subprocess so nothing is already imported.
+
+	python -m benchmarks.bench_import --runs 10 --max-ms 300
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ("pandas", "geopandas", "fiona", "shapely", "numpy", "rasterio", "arrow")
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import openet_client
+client = openet_client.OpenETClient(token="benchmark")
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "loaded": [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_startup(runs=5):
+	"""
+		Runs the startup script in fresh interpreters
+	:return: dictionary with the median and each individual time in ms, and the heavy modules that were loaded
+	"""
+	times = []
+	loaded = set()
+	with tempfile.TemporaryDirectory() as home:
+		env = dict(os.environ, HOME=home, USERPROFILE=home)  # keep the client from touching the real cache folder
+		for _ in range(runs):
+			output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, capture_output=True, text=True, check=True)
+			result = json.loads(output.stdout.strip().splitlines()[-1])
+			times.append(result["ms"])
+			loaded.update(result["loaded"])
+			cache_created = os.path.exists(os.path.join(home, ".openet_client"))
+
+	return {"median_ms": statistics.median(times), "times_ms": times, "heavy_modules_loaded": sorted(loaded), "cache_created": cache_created}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark openet_client import and client startup time")
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--max-ms", type=float, default=None, help="Exit with an error if the median startup time exceeds this")
+	args = parser.parse_args()
+
+	result = measure_startup(args.runs)
+	print(json.dumps(result, indent=2))
+
+	if args.max_ms is not None and result["median_ms"] > args.max_ms:
+		sys.exit(f"Median startup time {result['median_ms']:.1f} ms is over the limit of {args.max_ms} ms")
+	if result["heavy_modules_loaded"]:
+		sys.exit(f"Startup loaded heavy modules: {result['heavy_modules_loaded']}")
+
+
+if __name__ == "__main__":
+	main()
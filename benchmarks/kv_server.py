@@ -0,0 +1,183 @@
+"""
+	A small in-process stand-in for a Redis-protocol key-value store, so KeyValueStoreCache can be tested and
+	benchmarked without running Redis. Supports just the commands the cache uses (plus a few for inspection): PING,
+	AUTH, SELECT, GET, SET (with EX), DEL, EXISTS, EXPIRE, HSET, HGETALL, HMGET, RPUSH, LTRIM, LRANGE, LLEN and FLUSHALL.
+
+	with KeyValueStoreServer() as server:
+		cache = KeyValueStoreCache(host=server.host, port=server.port)
+"""
+
+import socketserver
+import threading
+import time
+
+
+class KeyValueStoreServer(socketserver.ThreadingTCPServer):
+	"""
+	:param password: if set, clients must AUTH with it before other commands
+	:param latency: seconds every command takes before responding, to simulate a store across the network
+
+	Set drop_replies to a number of commands to run but then close the connection instead of replying to, like a
+	connection lost after the store received a command.
+	"""
+
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, host="127.0.0.1", port=0, password=None, latency=0):
+		super().__init__((host, port), KeyValueStoreHandler)
+		self.password = password
+		self.latency = latency
+		self.data = {}
+		self.expires = {}
+		self.command_count = 0
+		self.drop_replies = 0
+		self._lock = threading.Lock()
+		self._thread = None
+
+	@property
+	def host(self):
+		return self.server_address[0]
+
+	@property
+	def port(self):
+		return self.server_address[1]
+
+	def start(self):
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+	def _live(self, key):
+		expires = self.expires.get(key)
+		if expires is not None and time.monotonic() >= expires:
+			self.data.pop(key, None)
+			self.expires.pop(key, None)
+		return self.data.get(key)
+
+	def execute(self, name, args):
+		"""
+			Runs a command against the store and returns the reply - an Exception instance is sent as an error reply
+		"""
+		with self._lock:
+			self.command_count += 1
+			if name == "PING":
+				return "PONG"
+			if name == "SELECT":
+				return "OK"
+			if name == "FLUSHALL":
+				self.data, self.expires = {}, {}
+				return "OK"
+			if name == "GET":
+				return self._live(args[0])
+			if name == "SET":
+				self.data[args[0]] = args[1]
+				self.expires.pop(args[0], None)
+				if len(args) >= 4 and args[2].upper() == b"EX":
+					self.expires[args[0]] = time.monotonic() + int(args[3])
+				return "OK"
+			if name == "DEL":
+				return sum(self.data.pop(key, None) is not None for key in args)
+			if name == "EXISTS":
+				return sum(self._live(key) is not None for key in args)
+			if name == "EXPIRE":
+				if self._live(args[0]) is None:
+					return 0
+				self.expires[args[0]] = time.monotonic() + int(args[1])
+				return 1
+			if name == "HSET":
+				values = self._live(args[0]) or {}
+				added = 0
+				for field, value in zip(args[1::2], args[2::2]):
+					added += field not in values
+					values[field] = value
+				self.data[args[0]] = values
+				return added
+			if name == "HGETALL":
+				values = self._live(args[0]) or {}
+				return [item for pair in values.items() for item in pair]
+			if name == "HMGET":
+				values = self._live(args[0]) or {}
+				return [values.get(field) for field in args[1:]]
+			if name == "RPUSH":
+				values = self._live(args[0]) or []
+				values.extend(args[1:])
+				self.data[args[0]] = values
+				return len(values)
+			if name in ("LTRIM", "LRANGE"):
+				values = self._live(args[0]) or []
+				start, stop = int(args[1]), int(args[2])
+				stop = len(values) + stop if stop < 0 else stop
+				selected = values[max(len(values) + start, 0) if start < 0 else start:stop + 1]
+				if name == "LRANGE":
+					return selected
+				self.data[args[0]] = selected
+				return "OK"
+			if name == "LLEN":
+				return len(self._live(args[0]) or [])
+			return ValueError(f"ERR unknown command '{name}'")
+
+
+class KeyValueStoreHandler(socketserver.StreamRequestHandler):
+
+	def handle(self):
+		authenticated = self.server.password is None
+		while True:
+			try:
+				command = self._read_command()
+			except (ConnectionError, ValueError):
+				return
+			if command is None:
+				return
+			name, args = command[0].decode("utf-8").upper(), command[1:]
+
+			time.sleep(self.server.latency)
+			if name == "AUTH":
+				authenticated = args[-1].decode("utf-8") == self.server.password
+				reply = "OK" if authenticated else ValueError("WRONGPASS invalid password")
+			elif not authenticated:
+				reply = ValueError("NOAUTH Authentication required")
+			else:
+				reply = self.server.execute(name, args)
+			with self.server._lock:
+				dropped = self.server.drop_replies > 0
+				self.server.drop_replies -= dropped
+			if dropped:
+				return
+			self.wfile.write(_encode(reply))
+
+	def _read_command(self):
+		line = self.rfile.readline()
+		if not line:
+			return None
+		if not line.startswith(b"*"):
+			raise ValueError("Only array commands are supported")
+		args = []
+		for _ in range(int(line[1:-2])):
+			length = int(self.rfile.readline()[1:-2])
+			args.append(self.rfile.read(length + 2)[:-2])
+		return args
+
+
+def _encode(reply):
+	if isinstance(reply, Exception):
+		return f"-{reply}\r\n".encode("utf-8")
+	if reply is None:
+		return b"$-1\r\n"
+	if isinstance(reply, str):
+		return f"+{reply}\r\n".encode("utf-8")
+	if isinstance(reply, int):
+		return f":{reply}\r\n".encode("utf-8")
+	if isinstance(reply, bytes):
+		return f"${len(reply)}\r\n".encode("utf-8") + reply + b"\r\n"
+	return f"*{len(reply)}\r\n".encode("utf-8") + b"".join(_encode(item) for item in reply)
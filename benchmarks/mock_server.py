@@ -0,0 +1,313 @@
+"""
+	A local stand-in for the OpenET API, for tests and benchmarks that shouldn't need a token or use quota.
+
+	Emulates the endpoints the client uses - feature_ids_list, timeseries/features/stats/*, raster/export,
+	raster/export/all_files, raster/timeseries/point - and hosts the exported "rasters" itself. Latency, rate limiting,
+	the delay before exported files become downloadable (they return 403 until then) and error injection are all
+	configurable. Values are generated deterministically from the request, so repeated requests return the same data.
+
+	with MockOpenETServer(latency=0.01) as server:
+		client = openet_client.OpenETClient(token="anything")
+		client._base_url = server.base_url
+		...
+		print(server.request_count)
+"""
+
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RATE_LIMIT_MESSAGE = "You have reached your maximum rate limit for this endpoint"
+
+# smallest valid little-endian TIFF header - enough for the client's download handling, which doesn't read the data
+TIFF_BYTES = b"II*\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def _stable_number(*parts, low=0, high=250):
+	digest = hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+	return low + (int(digest[:8], 16) / 0xFFFFFFFF) * (high - low)
+
+
+FIELD_SIZE = 0.01  # degrees
+
+
+def _field_id(longitude, latitude, tile_size=FIELD_SIZE):
+	"""
+		Fields in the mock are a grid of tile_size degree squares - any point in a square gets that square's ID
+	"""
+	column = int(float(longitude) // tile_size)
+	row = int(float(latitude) // tile_size)
+	return f"MOCK{column:+07d}{row:+07d}"
+
+
+def _region_fields(coordinates, tile_size=FIELD_SIZE):
+	"""
+		Returns (field ID, GeoJSON polygon) for every field that intersects the bounding box of a region given as a
+		"lon,lat,lon,lat,..." string
+	"""
+	values = [float(value) for value in coordinates.split(",")]
+	longitudes, latitudes = values[::2], values[1::2]
+	fields = []
+	for column in range(int(min(longitudes) // tile_size), int(max(longitudes) // tile_size) + 1):
+		for row in range(int(min(latitudes) // tile_size), int(max(latitudes) // tile_size) + 1):
+			west, south = column * tile_size, row * tile_size
+			ring = [[west, south], [west + tile_size, south], [west + tile_size, south + tile_size], [west, south + tile_size], [west, south]]
+			fields.append((f"MOCK{column:+07d}{row:+07d}", {"type": "Polygon", "coordinates": [ring]}))
+	return fields
+
+
+def _periods(start, end, interval):
+	start = datetime.date.fromisoformat(str(start)[:10]) if len(str(start)) > 4 else datetime.date(int(start), 1, 1)
+	end = datetime.date.fromisoformat(str(end)[:10]) if len(str(end)) > 4 else datetime.date(int(end), 12, 31)
+	if interval == "monthly":
+		period = start.replace(day=1)
+	elif interval in ("annual", "yearly"):
+		period = start.replace(month=1, day=1)
+	else:
+		period = start
+
+	while period <= end:
+		yield period
+		if interval == "monthly":
+			period = (period.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+		elif interval in ("annual", "yearly"):
+			period = period.replace(year=period.year + 1)
+		else:
+			period = period + datetime.timedelta(days=1)
+
+
+class MockOpenETServer(ThreadingHTTPServer):
+	"""
+	:param latency: seconds every request takes before responding
+	:param latency_per_record: additional seconds per feature ID in a feature stats request
+	:param rate_limit: maximum requests per second before responding with a rate limit error. None to disable
+	:param rate_limit_status: the status code to send rate limit errors with. The OpenET API sends 500 with a rate limit
+							message in the description, but 429 is useful to test Retry-After handling
+	:param retry_after: when set, rate limit responses include a Retry-After header with this many seconds
+	:param export_delay: seconds after an export request before the raster shows up in all_files
+	:param permission_delay: seconds after a raster shows up in all_files before downloading it stops returning 403
+	:param error_rate: fraction of API requests (not file downloads) that randomly fail
+	:param error_status: status code for randomly failed requests
+	:param max_batch: feature stats requests with more field IDs than this fail with a 500, like a server side timeout
+	:param region_geometries: whether feature_ids_list requests for a region (a polygon rather than a point) include
+							the fields' geometries as a list of GeoJSON "features" alongside their IDs
+	:param time_suffix: appended to each point timeseries "time" - eg "T00:00:00" for full timestamps
+	:param seed: seed for the error injection random number generator
+	"""
+
+	daemon_threads = True
+
+	def __init__(self, host="127.0.0.1", port=0, latency=0, latency_per_record=0, rate_limit=None, rate_limit_status=500,
+				retry_after=None, export_delay=0, permission_delay=0, error_rate=0, error_status=502, max_batch=None,
+				region_geometries=True, time_suffix="", seed=0):
+		super().__init__((host, port), MockOpenETHandler)
+		self.latency = latency
+		self.latency_per_record = latency_per_record
+		self.rate_limit = rate_limit
+		self.rate_limit_status = rate_limit_status
+		self.retry_after = retry_after
+		self.export_delay = export_delay
+		self.permission_delay = permission_delay
+		self.error_rate = error_rate
+		self.error_status = error_status
+		self.max_batch = max_batch
+		self.region_geometries = region_geometries
+		self.time_suffix = time_suffix
+
+		self.request_log = []  # (method, path, params) for every API request
+		self.exports = {}  # file name -> time the export was requested
+		self._random = random.Random(seed)
+		self._lock = threading.Lock()
+		self._recent_requests = []
+		self._forced_errors = []
+		self._thread = None
+
+	@property
+	def base_url(self):
+		return f"http://{self.server_address[0]}:{self.server_address[1]}/"
+
+	@property
+	def request_count(self):
+		return len(self.request_log)
+
+	def fail_next(self, count=1, status=502, body=None, headers=None):
+		"""
+			Makes the next count API requests fail with the given status (and optional JSON body and headers)
+		"""
+		with self._lock:
+			self._forced_errors.extend([(status, body, headers)] * count)
+
+	def mark_ready(self, name_part=""):
+		"""
+			Makes the exported rasters whose file names include name_part (or all of them) show up in all_files and
+			download right away, whatever export_delay and permission_delay are
+		"""
+		with self._lock:
+			for name in self.exports:
+				if name_part in name:
+					self.exports[name] = float("-inf")
+
+	def start(self):
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+	def _check_injected_errors(self):
+		"""
+			Returns (status, body, headers) for a request that should fail, or None if it should go through
+		"""
+		with self._lock:
+			if self._forced_errors:
+				status, body, headers = self._forced_errors.pop(0)
+				return status, body or {"description": "Injected error"}, headers or {}
+
+			if self.rate_limit is not None:
+				now = time.monotonic()
+				self._recent_requests = [moment for moment in self._recent_requests if now - moment < 1]
+				if len(self._recent_requests) >= self.rate_limit:
+					headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+					return self.rate_limit_status, {"description": RATE_LIMIT_MESSAGE}, headers
+				self._recent_requests.append(now)
+
+			if self.error_rate and self._random.random() < self.error_rate:
+				return self.error_status, {"description": "Injected error"}, {}
+		return None
+
+
+class MockOpenETHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, format, *args):  # keep test and benchmark output quiet
+		pass
+
+	def do_GET(self):
+		parsed = urllib.parse.urlparse(self.path)
+		if parsed.path.startswith("/files/"):
+			return self._send_file(parsed.path[len("/files/"):])
+		params = {key: values[-1] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+		self._handle_api("get", parsed.path.strip("/"), params)
+
+	def do_POST(self):
+		parsed = urllib.parse.urlparse(self.path)
+		length = int(self.headers.get("Content-Length", 0))
+		body = self.rfile.read(length) if length else b""
+		params = json.loads(body) if body else {}
+		self._handle_api("post", parsed.path.strip("/"), params)
+
+	def _send_json(self, status, data, headers=None):
+		payload = json.dumps(data).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(payload)))
+		for key, value in (headers or {}).items():
+			self.send_header(key, value)
+		self.end_headers()
+		self.wfile.write(payload)
+
+	def _handle_api(self, method, endpoint, params):
+		server = self.server
+		with server._lock:
+			server.request_log.append((method, endpoint, params))
+
+		if not self.headers.get("Authorization"):
+			return self._send_json(401, {"detail": "Invalid API token"})
+
+		time.sleep(server.latency)
+
+		error = server._check_injected_errors()
+		if error is not None:
+			return self._send_json(*error)
+
+		if endpoint == "metadata/openet/region_of_interest/feature_ids_list":
+			return self._feature_ids_list(params)
+		if endpoint.startswith("timeseries/features/stats/"):
+			return self._feature_stats(endpoint.split("/")[-1], params)
+		if endpoint == "raster/export/all_files":
+			return self._all_files()
+		if endpoint == "raster/export":
+			return self._export(params)
+		if endpoint == "raster/timeseries/point":
+			return self._point_timeseries(params)
+		return self._send_json(404, {"description": f"Unknown endpoint {endpoint}"})
+
+	def _feature_ids_list(self, params):
+		if "coordinates" not in params:
+			return self._send_json(422, {"description": "coordinates are required"})
+		if "," in params["coordinates"]:  # a region
+			fields = _region_fields(params["coordinates"])
+			response = {"feature_unique_ids": [field_id for field_id, _ in fields]}
+			if self.server.region_geometries:
+				response["features"] = [{"type": "Feature", "properties": {"feature_unique_id": field_id}, "geometry": geometry}
+										for field_id, geometry in fields]
+			return self._send_json(200, response)
+		longitude, latitude = params["coordinates"].split(" ")
+		return self._send_json(200, {"feature_unique_ids": [_field_id(longitude, latitude)]})
+
+	def _feature_stats(self, interval, params):
+		field_ids = json.loads(params.get("field_ids", "[]"))
+		if self.server.max_batch is not None and len(field_ids) > self.server.max_batch:
+			return self._send_json(500, {"description": "Request timed out"})
+		time.sleep(self.server.latency_per_record * len(field_ids))
+
+		aggregation = params.get("aggregation", "data_value")
+		records = []
+		for field_id in field_ids:
+			for period in _periods(params.get("start_date", 2018), params.get("end_date", 2018), interval):
+				records.append({
+					"feature_unique_id": field_id,
+					"time": period.isoformat(),
+					aggregation: round(_stable_number(field_id, period, params.get("variable", "et")), 3),
+				})
+		return self._send_json(200, records)
+
+	def _export(self, params):
+		name = f"{uuid.uuid4().hex}{params.get('filename_suffix', '')}.tif"
+		with self.server._lock:
+			self.server.exports[name] = time.monotonic()
+		return self._send_json(200, {"destination": [self.server.base_url + "files/" + name], "state": "READY"})
+
+	def _all_files(self):
+		now = time.monotonic()
+		with self.server._lock:
+			ready = [self.server.base_url + "files/" + name for name, requested in self.server.exports.items()
+						if now - requested >= self.server.export_delay]
+		return self._send_json(200, {"rasters": ready})
+
+	def _point_timeseries(self, params):
+		variable = params.get("variable", "et")
+		lon, lat = params.get("lon"), params.get("lat")
+		records = [{"time": period.isoformat() + self.server.time_suffix, variable: round(_stable_number(lon, lat, period, variable))}
+					for period in _periods(params["start_date"], params["end_date"], params.get("interval", "monthly"))]
+		return self._send_json(200, records)
+
+	def _send_file(self, name):
+		with self.server._lock:
+			requested = self.server.exports.get(name)
+		if requested is None:
+			return self._send_json(404, {"description": "Not found"})
+
+		ready_at = requested + self.server.export_delay + self.server.permission_delay
+		if time.monotonic() < ready_at:
+			return self._send_json(403, {"description": "Access denied"})
+
+		self.send_response(200)
+		self.send_header("Content-Type", "image/tiff")
+		self.send_header("Content-Length", str(len(TIFF_BYTES)))
+		self.end_headers()
+		self.wfile.write(TIFF_BYTES)
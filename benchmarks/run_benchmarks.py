@@ -0,0 +1,130 @@
+"""
+	Runs the client's main pipelines against the local mock OpenET server at several input sizes and reports
+	requests per second, wall time, CPU time and peak Python memory for each.
+
+	python -m benchmarks.run_benchmarks --sizes 10,100,1000 --latency 0.005 --json results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .mock_server import MockOpenETServer
+
+PIPELINES = ("point_sample_many", "features", "raster_export")
+
+
+def make_client(server):
+	import openet_client
+	client = openet_client.OpenETClient(token="benchmark")
+	client._base_url = server.base_url
+	client.raster.wait_interval = 0.05
+	return client
+
+
+def run_point_sample_many(client, size):
+	rng = random.Random(size)
+	points = [(rng.uniform(-121, -119), rng.uniform(36, 38)) for _ in range(size)]
+	client.raster.timeseries.point_sample_many(points, "2018-01-01", "2018-12-31", max_workers=8, use_cache=False)
+
+
+def run_features(client, size):
+	import geopandas
+	from shapely.geometry import box
+
+	rng = random.Random(size)
+	boxes = []
+	for _ in range(size):
+		x, y = rng.uniform(-121, -119), rng.uniform(36, 38)
+		boxes.append(box(x, y, x + 0.001, y + 0.001))
+	features = geopandas.GeoDataFrame({"name": range(size)}, geometry=boxes, crs=4326)
+	client.geodatabase.get_et_for_features(
+		params={"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2018, "end_date": 2018},
+		features=features,
+		feature_type="geopandas",
+		output_field="et",
+		wait_time=0,
+	)
+
+
+def run_raster_export(client, size):
+	for index in range(size):
+		client.raster.export(params={"geometry": "-119.39,36.19,-119.35,36.19,-119.35,36.16", "start_date": "2018-01-01",
+									"end_date": "2018-12-31", "filename_suffix": f"bench_{index}"})
+	client.raster.wait_for_rasters()
+
+
+RUNNERS = {
+	"point_sample_many": run_point_sample_many,
+	"features": run_features,
+	"raster_export": run_raster_export,
+}
+
+
+def benchmark(pipeline, size, **server_options):
+	"""
+		Runs one pipeline at one input size against a fresh mock server and client
+	:return: dictionary of measurements
+	"""
+	with MockOpenETServer(**server_options) as server:
+		client = make_client(server)
+
+		tracemalloc.start()
+		cpu_start = time.process_time()
+		wall_start = time.perf_counter()
+		RUNNERS[pipeline](client, size)
+		wall = time.perf_counter() - wall_start
+		cpu = time.process_time() - cpu_start
+		_, peak_memory = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+		return {
+			"pipeline": pipeline,
+			"size": size,
+			"requests": server.request_count,
+			"requests_per_second": server.request_count / wall if wall > 0 else 0,
+			"wall_seconds": wall,
+			"cpu_seconds": cpu,
+			"peak_memory_mb": peak_memory / 1024 / 1024,
+		}
+
+
+def main(args=None):
+	parser = argparse.ArgumentParser(description="Benchmark openet_client pipelines against a local mock OpenET server")
+	parser.add_argument("--pipelines", default=",".join(PIPELINES), help=f"Comma separated subset of {PIPELINES}")
+	parser.add_argument("--sizes", default="10,100", help="Comma separated input sizes to run each pipeline at")
+	parser.add_argument("--latency", type=float, default=0.005, help="Seconds the mock server takes per request")
+	parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests the mock server fails")
+	parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+	args = parser.parse_args(args)
+
+	# keep the benchmark's cache away from the real one so every run starts cold
+	cache_home = tempfile.mkdtemp(prefix="openet_bench_")
+	os.environ["HOME"] = cache_home
+	os.environ["USERPROFILE"] = cache_home
+
+	results = []
+	header = f"{'pipeline':<20}{'size':>8}{'requests':>10}{'req/s':>10}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}"
+	print(header)
+	print("-" * len(header))
+	for pipeline in args.pipelines.split(","):
+		for size in [int(size) for size in args.sizes.split(",")]:
+			result = benchmark(pipeline, size, latency=args.latency, error_rate=args.error_rate)
+			results.append(result)
+			print(f"{pipeline:<20}{size:>8}{result['requests']:>10}{result['requests_per_second']:>10.1f}"
+				f"{result['wall_seconds']:>10.2f}{result['cpu_seconds']:>10.2f}{result['peak_memory_mb']:>10.1f}")
+			sys.stdout.flush()
+
+	if args.json:
+		with open(args.json, 'w') as output:
+			json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+	main()
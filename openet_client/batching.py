@@ -0,0 +1,95 @@
+"""
+	Adaptive batch sizes for feature stats requests. How many feature IDs fit in a request before it times out depends
+	on the endpoint, the date range and the interval - forty fields of monthly data over several years can time out
+	where hundreds of fields of annual data come back quickly - so rather than one fixed size, BatchSizer adjusts the
+	size as responses come back, and the client remembers the size that worked for each kind of request in its cache.
+"""
+
+import datetime
+import json
+
+DEFAULT_BATCH_SIZE = 40  # the size to start with when there's nothing remembered for a kind of request
+
+
+def parse_request_date(value, end=False):
+	"""
+		Parses a start_date or end_date parameter - a year, or a date string - to a date. Years parse to their first day,
+		or their last day when end is True
+	"""
+	value = str(value)
+	if len(value) == 4:  # just a year
+		return datetime.date(int(value), 12, 31) if end else datetime.date(int(value), 1, 1)
+	return datetime.date.fromisoformat(value[:10])
+
+
+def batch_shape_key(endpoint, params):
+	"""
+		Describes the kind of request - the endpoint, every parameter except the field IDs and dates, and roughly how
+		many months the dates span - so that requests expected to behave alike share a remembered batch size
+	"""
+	shape = {key: value for key, value in params.items() if key not in ("field_ids", "start_date", "end_date")}
+	try:
+		span = parse_request_date(params["end_date"], end=True) - parse_request_date(params["start_date"])
+		shape["months"] = round(span.days / 30.4)
+	except (KeyError, ValueError):
+		pass
+	return f"{endpoint}|{json.dumps(shape, sort_keys=True, default=str)}"
+
+
+class BatchSizer(object):
+	"""
+		Chooses how many feature IDs to send in each request, growing the batch while responses come back quickly and
+		shrinking it when they're slow, large or fail:
+
+		* A failed batch halves the size, and the size won't grow past the failed size again for the rest of the run
+		* A batch slower than target_seconds, or with a response larger than max_response_bytes, scales the size down
+		  so the next batch should land on target
+		* A full size batch under target grows the size by up to growth times, in proportion to the headroom left
+
+	:param initial: The size to start with, such as a size remembered from an earlier run
+	:param minimum: The smallest size to shrink to
+	:param maximum: The largest size to grow to
+	:param target_seconds: How long a request should ideally take
+	:param max_response_bytes: The largest response a request should ideally return
+	:param growth: The most the size can grow by after a single fast batch
+	:param backoff: What the size is multiplied by after a failed batch
+	"""
+
+	def __init__(self, initial=DEFAULT_BATCH_SIZE, minimum=1, maximum=500, target_seconds=15,
+					max_response_bytes=20 * 1024 * 1024, growth=1.5, backoff=0.5):
+		self.minimum = minimum
+		self.maximum = maximum
+		self.target_seconds = target_seconds
+		self.max_response_bytes = max_response_bytes
+		self.growth = growth
+		self.backoff = backoff
+		self.successes = 0
+		self.failures = 0
+		self._ceiling = maximum
+		self._size = float(max(minimum, min(maximum, initial)))
+
+	@property
+	def size(self):
+		return int(self._size)
+
+	def _set(self, size):
+		self._size = float(max(self.minimum, min(self._ceiling, self.maximum, size)))
+
+	def record_success(self, count, seconds, response_bytes=0):
+		"""
+			Updates the size after a batch of count feature IDs succeeded, taking the given time and response size
+		"""
+		self.successes += 1
+		load = max(seconds / self.target_seconds, response_bytes / self.max_response_bytes)
+		if load > 1:
+			self._set(count / load)
+		elif count >= self.size:  # only grow on full batches - a short final batch says little about larger ones
+			self._set(self._size * (min(self.growth, 1 / load) if load > 0 else self.growth))
+
+	def record_failure(self, count):
+		"""
+			Updates the size after a batch of count feature IDs failed, such as with a server side timeout
+		"""
+		self.failures += 1
+		self._ceiling = max(self.minimum, count - 1)
+		self._set(min(self._size, count) * self.backoff)
@@ -1,103 +1,769 @@
+import abc
+import collections
+import hashlib
 import pathlib
 import os
 import platform
+import socket
 import sqlite3
+import threading
+import time
+import random
+import weakref
 
+import json
 import shelve
 import tempfile
 import datetime
 
+from .exceptions import CacheError
 
-class Cacher(object):
-	def __init__(self):
-		make_new = False
-		if not self.cache_db_path.exists():
-			make_new = True
+CACHE_PATH_ENVIRONMENT_VARIABLE = "OPENET_CLIENT_CACHE_PATH"
+SQLITE_MAX_PARAMETERS = 900  # stays under SQLite's default limit of 999 bound parameters per statement
+CACHE_TABLES = {
+	"geodatabase": "CREATE TABLE IF NOT EXISTS geodatabase (location text NOT NULL UNIQUE, openet_id text)",
+	"requests": "CREATE TABLE IF NOT EXISTS requests (url text NOT NULL, body text, response_code text, response_body text, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)",
+	"timeseries": "CREATE TABLE IF NOT EXISTS timeseries (series_key text NOT NULL, time text NOT NULL, record text, PRIMARY KEY (series_key, time))",
+	"batch_sizes": "CREATE TABLE IF NOT EXISTS batch_sizes (shape_key text NOT NULL PRIMARY KEY, batch_size integer)",
+	"feature_results": "CREATE TABLE IF NOT EXISTS feature_results (result_key text NOT NULL, feature_id text NOT NULL, records text, cached_at real, PRIMARY KEY (result_key, feature_id))",
+}
 
-		self.connection = sqlite3.connect(str(self.cache_db_path))
 
-		if not make_new:  # if we don't already need to make the cache, then check to make sure it's up to date
-			make_new = not self._check_cache_version()  # invert its logic since "check" would imply "make sure it's OK" so a result of True means it's fine
+class CacheBackend(abc.ABC):
+	"""
+		The interface the client uses to cache feature IDs, timeseries data and a log of requests. Pass any backend
+		to :code:`OpenETClient(cache=...)` - :code:`Cacher` (SQLite, the default), :code:`MemoryCache`,
+		:code:`FilesystemCache` or :code:`KeyValueStoreCache` - or subclass this to write your own. Subclasses must
+		implement the abstract methods; the batch size and feature result methods are optional.
 
-		if make_new:
-			self.connection.close()
-			os.unlink(self.cache_db_path)  # make sure it doesn't exist before creating it -we might just have an out of date cache
-			self.connection = sqlite3.connect(str(self.cache_db_path))
-			self.create_tables()
+		Feature ID lookups return False when the key isn't cached at all, and None when it's cached as having no
+		feature, so the client doesn't look up empty locations again.
+	"""
 
-	def _check_cache_version(self):
-		cursor = self.connection.cursor()
+	@abc.abstractmethod
+	def check_gdb_cache(self, key):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def cache_gdb_item(self, key, value):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def cache_request(self, url, body, response_code, response_json):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def check_timeseries_cache(self, series_key, start, end):
+		"""
+			Returns the cached timesteps for a series between start and end (inclusive, as YYYY-MM-DD strings)
+		:return: dictionary of time value to the record the API returned for that timestep. Empty if nothing is cached
+		"""
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def cache_timeseries_items(self, series_key, items):
+		"""
+			Saves each timestep record (a dictionary with a "time" key, as returned by the API) for the series, keyed
+			by its timeseries_period
+		"""
+		raise NotImplementedError
+
+	def check_batch_size(self, shape_key):
+		"""
+			Returns the batch size remembered for a kind of feature stats request (see batching.batch_shape_key), or
+			None if there isn't one. Optional for custom backends - by default nothing is remembered
+		"""
+		return None
+
+	def cache_batch_size(self, shape_key, batch_size):
+		pass
+
+	def check_feature_results(self, result_key, feature_ids, max_age=None):
+		"""
+			Returns the cached results for each of the feature IDs for one endpoint and set of params (see
+			geodatabase.feature_result_key). Optional for custom backends - by default nothing is cached
+		:param max_age: Ignore results cached more than this many seconds ago. None to accept any age
+		:return: dictionary of feature ID to the list of records the API returned for it. Feature IDs that aren't
+				cached are left out. An empty list means the API returned nothing for that feature
+		"""
+		return {}
+
+	def cache_feature_results(self, result_key, results):
+		"""
+			Saves results - a dictionary of feature ID to the list of records the API returned for it
+		"""
+		pass
+
+	def close(self):
+		pass
+
+	def save_shelf(self, data_structure):
+		"""
+			A way to cache larger data structures (just indexed by time in the shelf) before
+			doing challenging work on them that might break
+		:param data_structure:
+		:return:
+		"""
+		shelf_file = tempfile.mktemp(prefix="et_data_", suffix=".shelf")
+		shelf = shelve.open(shelf_file)
+		shelf["data"] = data_structure
+		shelf.sync()
+		shelf.close()
+
+
+def timeseries_period(item):
+	"""
+		The YYYY-MM-DD timestep a timeseries record is cached under. The API may add a time of day to its "time"
+		values, so they're cut down to the date to match the periods the client asks for
+	"""
+	return item["time"][:10]
+
+
+def _default_cache_folder():
+	cache_folder = pathlib.Path.home()
+	if platform.system() == "Windows":
+		return cache_folder / "AppData" / "Local" / ".openet_client"
+	return cache_folder / ".openet_client"
+
+
+class Cacher(CacheBackend):
+	"""
+		The SQLite cache for feature IDs, timeseries data and a log of requests and responses.
+
+		Safe to share between threads and between processes. Each thread gets its own connection, the database uses
+		write-ahead logging so readers don't block the writer, and writes that still find the database locked
+		(e.g. many processes writing at once) wait up to busy_timeout seconds and then retry a few more times before
+		giving up.
+
+	:param path: Path to the cache database file. Defaults to the OPENET_CLIENT_CACHE_PATH environment variable if
+				it's set, otherwise openet_client_cache.db in a .openet_client folder in your home folder (in
+				AppData/Local on Windows). Point multiple workers at the same file to share one cache.
+	:param busy_timeout: How long in seconds SQLite waits on a locked database before raising an error
+	:param lock_retries: How many more times to retry an operation that still failed because the database was locked
+	"""
+	def __init__(self, path=None, busy_timeout=30, lock_retries=5):
+		if path is None:
+			path = os.environ.get(CACHE_PATH_ENVIRONMENT_VARIABLE)
+		self._path = pathlib.Path(path) if path is not None else None
+		self.busy_timeout = busy_timeout
+		self.lock_retries = lock_retries
+
+		self._local = threading.local()  # connections are opened per thread the first time each thread needs one
+		self._lock = threading.Lock()
+		self._connections = weakref.WeakSet()  # the holder of each open connection, which goes away with its thread
+		self._initialized = False
+
+	def __getstate__(self):
+		# connections can't move between processes - a copy sent to another process (e.g. a worker in a process pool)
+		# opens its own connections to the same database file
+		state = self.__dict__.copy()
+		state["_path"] = self.cache_db_path
+		for attribute in ("_local", "_lock", "_connections", "_initialized"):
+			del state[attribute]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._connections = weakref.WeakSet()
+		self._initialized = False
+
+	@property
+	def connection(self):
+		"""
+			The calling thread's connection to the cache database
+		"""
+		holder = getattr(self._local, "holder", None)
+		if holder is None:
+			holder = self._connect()
+			self._local.holder = holder
+		return holder.connection
+
+	def _connect(self):
+		"""
+			Opens a connection for the calling thread, in a holder that's only referenced from that thread's local
+			storage - when the thread exits, the holder is freed and its connection closed, so pools of short lived
+			threads don't leave connections open behind them
+		"""
+		# connections are only used by the thread that opened them, but may be closed from another one by close()
+		connection = sqlite3.connect(str(self.cache_db_path), timeout=self.busy_timeout, check_same_thread=False)
+		connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+		holder = _ConnectionHolder(connection)
+		weakref.finalize(holder, connection.close)
+		with self._lock:
+			self._connections.add(holder)
+			if not self._initialized:
+				self._retry_on_lock(lambda: self._initialize(connection))
+				self._initialized = True
+		return holder
+
+	def _initialize(self, connection):
+		connection.execute("PRAGMA journal_mode=WAL")
+		if not self._check_cache_version(connection):
+			self.create_tables(connection)
+
+	def _check_cache_version(self, connection):
+		cursor = connection.cursor()
 		cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
 		tables = cursor.fetchall()
+		cursor.close()
 
-		if len(list({"geodatabase", "requests"} - set([table[0] for table in tables]))) > 0:  # if not all tables in the cache exist
-			cursor.close()
-			self.connection.close()
-			return False
+		return len(set(CACHE_TABLES) - set([table[0] for table in tables])) == 0  # if all tables in the cache exist
 
-		return True
+	def close(self):
+		"""
+			Closes every connection this cache has opened. The next use opens new ones.
+		"""
+		with self._lock:
+			for holder in list(self._connections):
+				holder.connection.close()
+			self._connections = weakref.WeakSet()
+		self._local = threading.local()
 
 	@property
 	def cache_folder(self):
-		home_folder = pathlib.Path.home()
-		cache_folder = home_folder
-		if platform.system() == "Windows":
-			cache_folder = cache_folder / "AppData" / "Local" / ".openet_client"
+		if self._path is not None:
+			cache_folder = self._path.parent
 		else:
-			cache_folder = cache_folder /".openet_client"
+			cache_folder = _default_cache_folder()
 
 		if not cache_folder.exists():
-			os.makedirs(str(cache_folder))
+			os.makedirs(str(cache_folder), exist_ok=True)  # another process may make it at the same time
 
 		return cache_folder
 
 	@property
 	def cache_db_path(self):
+		if self._path is not None:
+			self.cache_folder  # make sure the folder exists
+			return self._path
 		return self.cache_folder / "openet_client_cache.db"
 
-	def create_tables(self):
-		cursor = self.connection.cursor()
-		cursor.execute("CREATE TABLE geodatabase (location text NOT NULL UNIQUE, openet_id text)")
-		cursor.execute("CREATE TABLE requests (url text NOT NULL, body text, response_code text, response_body text, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
-		self.connection.commit()
+	def create_tables(self, connection=None):
+		"""
+			Creates any cache tables that don't exist yet. Tables that exist already, and their data, are left alone,
+			since another process may be using them.
+		"""
+		connection = connection if connection is not None else self.connection
+		cursor = connection.cursor()
+		for statement in CACHE_TABLES.values():
+			cursor.execute(statement)
+		connection.commit()
 		cursor.close()
 
+	def _retry_on_lock(self, operation):
+		"""
+			Runs operation, retrying with a short randomized wait if SQLite reports the database is locked or busy
+			even after its own busy timeout
+		"""
+		for attempt in range(self.lock_retries + 1):
+			try:
+				return operation()
+			except sqlite3.OperationalError as e:
+				message = str(e).lower()
+				if ("locked" not in message and "busy" not in message) or attempt == self.lock_retries:
+					raise
+				time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+	def _write(self, statement, parameters, many=False):
+		def operation():
+			connection = self.connection
+			try:
+				if many:
+					connection.executemany(statement, parameters)
+				else:
+					connection.execute(statement, parameters)
+				connection.commit()
+			except sqlite3.OperationalError:
+				connection.rollback()
+				raise
+		self._retry_on_lock(operation)
+
+	def _read(self, statement, parameters):
+		return self._retry_on_lock(lambda: self.connection.execute(statement, parameters).fetchall())
+
 	def cache_gdb_item(self, key, value):
-		try:
-			cursor = self.connection.cursor()
-			cursor.execute("INSERT INTO geodatabase (location, openet_id) VALUES (?, ?)", (key, value))
-			self.connection.commit()
-			cursor.close()
-		except sqlite3.IntegrityError:
-			pass # theoretically we've already cached it then, but it's weird that it tried to retrieve it if we checked beforehand?
+		# OR IGNORE - theoretically we've already cached it then, but it's weird that it tried to retrieve it if we checked
+		# beforehand? (Or another worker looked up the same location at the same time)
+		self._write("INSERT OR IGNORE INTO geodatabase (location, openet_id) VALUES (?, ?)", (key, value))
 
 	def check_gdb_cache(self, key):
-		cursor = self.connection.cursor()
-		cursor.execute("SELECT openet_id from geodatabase where location=:location_key", {"location_key": key})
-		for record in cursor.fetchall():
+		for record in self._read("SELECT openet_id from geodatabase where location=:location_key", {"location_key": key}):
 			value = record[0]  # since we're only selection openet_id and the location key is unique, it'll be the first item in the only tuple returned
 			break
 		else:
 			value = False  # return False if we didn't find something - None will be used for items that exist but are Null
-		cursor.close()
 		return value
 
 	def cache_request(self, url, body, response_code, response_json):
-		cursor = self.connection.cursor()
-		cursor.execute("INSERT INTO requests (url, body, response_code, response_body) VALUES (?, ?, ?, ?)", (url, str(body), str(response_code), response_json))
-		self.connection.commit()
-		cursor.close()
+		self._write("INSERT INTO requests (url, body, response_code, response_body) VALUES (?, ?, ?, ?)", (url, str(body), str(response_code), response_json))
 
-	def save_shelf(self, data_structure):
+	def check_batch_size(self, shape_key):
+		for record in self._read("SELECT batch_size from batch_sizes where shape_key=?", (shape_key,)):
+			return record[0]
+		return None
+
+	def cache_batch_size(self, shape_key, batch_size):
+		self._write("INSERT OR REPLACE INTO batch_sizes (shape_key, batch_size) VALUES (?, ?)", (shape_key, batch_size))
+
+	def check_feature_results(self, result_key, feature_ids, max_age=None):
+		oldest = time.time() - max_age if max_age is not None else 0
+		results = {}
+		feature_ids = list(feature_ids)
+		for start in range(0, len(feature_ids), SQLITE_MAX_PARAMETERS):
+			chunk = feature_ids[start:start + SQLITE_MAX_PARAMETERS]
+			records = self._read(f"SELECT feature_id, records from feature_results where result_key=? and cached_at >= ? and feature_id in ({','.join('?' * len(chunk))})",
+									[result_key, oldest] + chunk)
+			results.update((feature_id, json.loads(record)) for feature_id, record in records)
+		return results
+
+	def cache_feature_results(self, result_key, results):
+		cached_at = time.time()
+		self._write("INSERT OR REPLACE INTO feature_results (result_key, feature_id, records, cached_at) VALUES (?, ?, ?, ?)",
+					[(result_key, feature_id, json.dumps(records), cached_at) for feature_id, records in results.items()], many=True)
+
+	def check_timeseries_cache(self, series_key, start, end):
+		records = self._read("SELECT time, record from timeseries where series_key=? and time >= ? and time <= ?", (series_key, start, end))
+		return {period: json.loads(record) for period, record in records}
+
+	def cache_timeseries_items(self, series_key, items):
+		self._write("INSERT OR REPLACE INTO timeseries (series_key, time, record) VALUES (?, ?, ?)",
+					[(series_key, timeseries_period(item), json.dumps(item)) for item in items], many=True)
+
+
+SQLiteCache = Cacher
+
+
+class _ConnectionHolder(object):
+	"""
+		Holds one thread's SQLite connection for Cacher - a connection can't be weakly referenced itself
+	"""
+	__slots__ = ("connection", "__weakref__")
+
+	def __init__(self, connection):
+		self.connection = connection
+
+
+class MemoryCache(CacheBackend):
+	"""
+		An in-memory cache for a single process. Feature IDs and timeseries are each kept in a least recently used
+		structure, so a long run's memory use stays bounded, and only the most recent requests are logged.
+
+	:param max_items: How many feature IDs, and separately how many timeseries, to keep before dropping the least recently used
+	:param max_requests: How many of the most recent requests to keep in the request log
+	"""
+	def __init__(self, max_items=100000, max_requests=1000):
+		self.max_items = max_items
+		self.requests = collections.deque(maxlen=max_requests)
+		self._gdb = collections.OrderedDict()
+		self._timeseries = collections.OrderedDict()  # series key -> {time: JSON of the record}
+		self._batch_sizes = {}
+		self._feature_results = collections.OrderedDict()  # (result key, feature ID) -> (cached at, JSON of the records)
+		self._lock = threading.Lock()
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state["_lock"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def _get(self, items, key):
+		items.move_to_end(key)
+		return items[key]
+
+	def _put(self, items, key, value):
+		items[key] = value
+		items.move_to_end(key)
+		while len(items) > self.max_items:
+			items.popitem(last=False)
+
+	def check_gdb_cache(self, key):
+		with self._lock:
+			if key not in self._gdb:
+				return False
+			return self._get(self._gdb, key)
+
+	def cache_gdb_item(self, key, value):
+		with self._lock:
+			self._put(self._gdb, key, value)
+
+	def cache_request(self, url, body, response_code, response_json):
+		self.requests.append((url, str(body), str(response_code), response_json))
+
+	def check_batch_size(self, shape_key):
+		return self._batch_sizes.get(shape_key)
+
+	def cache_batch_size(self, shape_key, batch_size):
+		self._batch_sizes[shape_key] = batch_size
+
+	def check_feature_results(self, result_key, feature_ids, max_age=None):
+		oldest = time.time() - max_age if max_age is not None else 0
+		results = {}
+		with self._lock:
+			for feature_id in feature_ids:
+				key = (result_key, feature_id)
+				if key in self._feature_results:
+					cached_at, records = self._get(self._feature_results, key)
+					if cached_at >= oldest:
+						results[feature_id] = json.loads(records)  # a fresh copy, since callers modify the records
+		return results
+
+	def cache_feature_results(self, result_key, results):
+		cached_at = time.time()
+		with self._lock:
+			for feature_id, records in results.items():
+				self._put(self._feature_results, (result_key, feature_id), (cached_at, json.dumps(records)))
+
+	def check_timeseries_cache(self, series_key, start, end):
+		with self._lock:
+			if series_key not in self._timeseries:
+				return {}
+			series = self._get(self._timeseries, series_key)
+			# fresh copies, so callers changing the records they get back don't change the cache
+			return {period: json.loads(record) for period, record in series.items() if start <= period <= end}
+
+	def cache_timeseries_items(self, series_key, items):
+		with self._lock:
+			series = self._timeseries.get(series_key, {})
+			series.update((timeseries_period(item), json.dumps(item)) for item in items)
+			self._put(self._timeseries, series_key, series)
+
+
+class FilesystemCache(CacheBackend):
+	"""
+		Caches each item as a small JSON file, spread across subfolders by a hash of its key so no one folder gets
+		huge. Files are written to a temporary name and then renamed into place, so it can be shared by many threads,
+		processes or machines through a network drive without any locking.
+
+	:param path: Folder to keep the cache in. Defaults to a filesystem_cache folder in the default cache folder
+	:param shard_depth: How many levels of subfolders to spread items across - each level has up to 256 folders
+	"""
+	def __init__(self, path=None, shard_depth=2):
+		self.path = pathlib.Path(path) if path is not None else _default_cache_folder() / "filesystem_cache"
+		self.shard_depth = shard_depth
+
+	def _shard(self, category, key):
+		digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+		folder = self.path / category
+		for level in range(self.shard_depth):
+			folder = folder / digest[level * 2:level * 2 + 2]
+		return folder, digest
+
+	def _write_json(self, path, value):
+		os.makedirs(str(path.parent), exist_ok=True)
+		temporary_path = path.parent / f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+		with open(temporary_path, 'w') as output:
+			json.dump(value, output)
+		os.replace(str(temporary_path), str(path))
+
+	def check_gdb_cache(self, key):
+		folder, digest = self._shard("geodatabase", key)
+		try:
+			with open(folder / f"{digest}.json", 'r') as item:
+				return json.load(item)["value"]
+		except FileNotFoundError:
+			return False
+
+	def cache_gdb_item(self, key, value):
+		folder, digest = self._shard("geodatabase", key)
+		self._write_json(folder / f"{digest}.json", {"key": key, "value": value})
+
+	def cache_request(self, url, body, response_code, response_json):
+		# each process appends to its own log so that writes from different processes never interleave
+		os.makedirs(str(self.path / "requests"), exist_ok=True)
+		record = {"url": url, "body": str(body), "response_code": str(response_code), "response_body": response_json,
+					"timestamp": datetime.datetime.utcnow().isoformat()}
+		with open(self.path / "requests" / f"{platform.node()}_{os.getpid()}.jsonl", 'a') as log:
+			log.write(json.dumps(record) + "\n")
+
+	def check_batch_size(self, shape_key):
+		folder, digest = self._shard("batch_sizes", shape_key)
+		try:
+			with open(folder / f"{digest}.json", 'r') as item:
+				return json.load(item)["value"]
+		except FileNotFoundError:
+			return None
+
+	def cache_batch_size(self, shape_key, batch_size):
+		folder, digest = self._shard("batch_sizes", shape_key)
+		self._write_json(folder / f"{digest}.json", {"key": shape_key, "value": batch_size})
+
+	def check_feature_results(self, result_key, feature_ids, max_age=None):
+		oldest = time.time() - max_age if max_age is not None else 0
+		results = {}
+		for feature_id in feature_ids:
+			folder, digest = self._shard("feature_results", f"{result_key}|{feature_id}")
+			try:
+				with open(folder / f"{digest}.json", 'r') as item:
+					cached = json.load(item)
+			except FileNotFoundError:
+				continue
+			if cached["cached_at"] >= oldest:
+				results[feature_id] = cached["records"]
+		return results
+
+	def cache_feature_results(self, result_key, results):
+		cached_at = time.time()
+		for feature_id, records in results.items():
+			folder, digest = self._shard("feature_results", f"{result_key}|{feature_id}")
+			self._write_json(folder / f"{digest}.json", {"key": result_key, "feature_id": feature_id, "cached_at": cached_at, "records": records})
+
+	def check_timeseries_cache(self, series_key, start, end):
+		folder, digest = self._shard("timeseries", series_key)
+		folder = folder / digest
+		if not folder.exists():
+			return {}
+
+		records = {}
+		for item_path in folder.glob("*.json"):
+			period = item_path.stem
+			if start <= period <= end:
+				try:
+					with open(item_path, 'r') as item:
+						records[period] = json.load(item)
+				except FileNotFoundError:  # replaced between listing and reading
+					continue
+		return records
+
+	def cache_timeseries_items(self, series_key, items):
+		folder, digest = self._shard("timeseries", series_key)
+		for item in items:
+			self._write_json(folder / digest / f"{timeseries_period(item)}.json", item)
+
+
+class KeyValueStoreCache(CacheBackend):
+	"""
+		Caches items in a shared key-value store that speaks the Redis protocol (RESP) - Redis, Valkey, KeyDB and
+		similar - so that every node in a cluster shares one warm cache. Needs nothing beyond the standard library.
+
+		Feature IDs are stored as plain keys, each timeseries as a hash of time to record, each set of feature results
+		as a hash of feature ID to records, and the request log as a
+		list trimmed to the most recent max_requests entries. Each thread keeps its own connection to the store.
+
+	:param host: Host the store is running on
+	:param port: Port the store is listening on
+	:param prefix: Prepended to every key, so several caches (or other applications) can share a store
+	:param password: Password to authenticate with, if the store requires one
+	:param db: Database number to select
+	:param ttl: Seconds before feature IDs and timeseries expire from the store. None to keep them until evicted
+	:param max_requests: How many of the most recent requests to keep in the log. 0 to not log requests
+	:param timeout: Seconds to wait to connect to or hear back from the store
+	"""
+	def __init__(self, host="localhost", port=6379, prefix="openet_client:", password=None, db=0, ttl=None,
+					max_requests=1000, timeout=10):
+		self.host = host
+		self.port = port
+		self.prefix = prefix
+		self.password = password
+		self.db = db
+		self.ttl = ttl
+		self.max_requests = max_requests
+		self.timeout = timeout
+		self._local = threading.local()
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state["_local"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._local = threading.local()
+
+	def _connection(self):
+		connection = getattr(self._local, "connection", None)
+		if connection is None:
+			connection = _RESPConnection(self.host, self.port, self.timeout)
+			if self.password is not None:
+				connection.command("AUTH", self.password)
+			if self.db:
+				connection.command("SELECT", self.db)
+			self._local.connection = connection
+		return connection
+
+	def command(self, *args, idempotent=True):
 		"""
-			A way to cache larger data structures (just indexed by time in the shelf) before
-			doing challenging work on them that might break
-		:param data_structure:
-		:return:
+			Sends a single command to the store and returns its reply. Reconnects and sends the command again once if
+			the connection was dropped - unless the command had already been sent and isn't idempotent (eg RPUSH),
+			since the store may have run it before the connection failed
 		"""
-		shelf_file = tempfile.mktemp(prefix="et_data_", suffix=".shelf")
-		shelf = shelve.open(shelf_file)
-		shelf["data"] = data_structure
-		shelf.sync()
-		shelf.close()
+		try:
+			return self._connection().command(*args)
+		except _CommandNotSent:
+			self.close()
+		except (ConnectionError, socket.timeout):
+			self.close()
+			if not idempotent:
+				raise
+		return self._connection().command(*args)
+
+	def close(self):
+		connection = getattr(self._local, "connection", None)
+		if connection is not None:
+			connection.close()
+			self._local.connection = None
+
+	def _expiry(self):
+		return ("EX", self.ttl) if self.ttl else ()
+
+	def check_gdb_cache(self, key):
+		value = self.command("GET", f"{self.prefix}gdb:{key}")
+		if value is None:
+			return False
+		return json.loads(value)
 
+	def cache_gdb_item(self, key, value):
+		self.command("SET", f"{self.prefix}gdb:{key}", json.dumps(value), *self._expiry())
+
+	def cache_request(self, url, body, response_code, response_json):
+		if not self.max_requests:
+			return
+		record = {"url": url, "body": str(body), "response_code": str(response_code), "response_body": response_json,
+					"timestamp": datetime.datetime.utcnow().isoformat()}
+		key = f"{self.prefix}requests"
+		self.command("RPUSH", key, json.dumps(record), idempotent=False)
+		self.command("LTRIM", key, -self.max_requests, -1)
+
+	def check_batch_size(self, shape_key):
+		value = self.command("GET", f"{self.prefix}batch_size:{shape_key}")
+		return int(value) if value is not None else None
+
+	def cache_batch_size(self, shape_key, batch_size):
+		self.command("SET", f"{self.prefix}batch_size:{shape_key}", batch_size)
+
+	def check_feature_results(self, result_key, feature_ids, max_age=None):
+		feature_ids = list(feature_ids)
+		if not feature_ids:
+			return {}
+		oldest = time.time() - max_age if max_age is not None else 0
+		reply = self.command("HMGET", f"{self.prefix}feature_results:{result_key}", *feature_ids)
+		results = {}
+		for feature_id, value in zip(feature_ids, reply):
+			if value is None:
+				continue
+			cached = json.loads(value)
+			if cached["cached_at"] >= oldest:
+				results[feature_id] = cached["records"]
+		return results
+
+	def cache_feature_results(self, result_key, results):
+		if not results:
+			return
+		key = f"{self.prefix}feature_results:{result_key}"
+		cached_at = time.time()
+		fields = []
+		for feature_id, records in results.items():
+			fields.extend((feature_id, json.dumps({"cached_at": cached_at, "records": records})))
+		self.command("HSET", key, *fields)
+		if self.ttl:
+			self.command("EXPIRE", key, self.ttl)
+
+	def check_timeseries_cache(self, series_key, start, end):
+		reply = self.command("HGETALL", f"{self.prefix}timeseries:{series_key}") or []
+		records = {}
+		for period, record in zip(reply[::2], reply[1::2]):
+			period = period.decode("utf-8")
+			if start <= period <= end:
+				records[period] = json.loads(record)
+		return records
+
+	def cache_timeseries_items(self, series_key, items):
+		if not items:
+			return
+		key = f"{self.prefix}timeseries:{series_key}"
+		fields = []
+		for item in items:
+			fields.extend((timeseries_period(item), json.dumps(item)))
+		self.command("HSET", key, *fields)
+		if self.ttl:
+			self.command("EXPIRE", key, self.ttl)
+
+
+def open_cache(location):
+	"""
+		Makes a cache backend from a location string, for configuration files and the command line:
+
+		* :code:`memory://` - a MemoryCache
+		* :code:`file:///path/to/folder` - a FilesystemCache in that folder
+		* :code:`redis://[:password@]host[:port][/db]` - a KeyValueStoreCache for that store
+		* anything else - the path to a SQLite cache database (a Cacher)
+	"""
+	from urllib.parse import urlparse
+
+	if location.startswith("memory://"):
+		return MemoryCache()
+	if location.startswith("file://"):
+		return FilesystemCache(path=urlparse(location).path)
+	if location.startswith("redis://"):
+		parsed = urlparse(location)
+		return KeyValueStoreCache(host=parsed.hostname or "localhost",
+									port=parsed.port or 6379,
+									password=parsed.password,
+									db=int(parsed.path.strip("/") or 0))
+	return Cacher(path=location)
+
+
+class _CommandNotSent(ConnectionError):
+	"""
+		The connection failed before a command was sent, so it's safe to send again
+	"""
+
+
+class _RESPConnection(object):
+	"""
+		A minimal client for the Redis serialization protocol - sends commands as arrays of bulk strings and parses
+		the replies
+	"""
+	def __init__(self, host, port, timeout):
+		self._socket = socket.create_connection((host, port), timeout=timeout)
+		self._file = self._socket.makefile("rb")
+
+	def command(self, *args):
+		encoded = [str(arg).encode("utf-8") if not isinstance(arg, bytes) else arg for arg in args]
+		message = [f"*{len(encoded)}\r\n".encode("utf-8")]
+		for arg in encoded:
+			message.append(f"${len(arg)}\r\n".encode("utf-8") + arg + b"\r\n")
+		try:
+			self._socket.sendall(b"".join(message))
+		except OSError as e:
+			raise _CommandNotSent(f"Couldn't send command to the key-value store: {e}") from e
+		return self._read_reply()
+
+	def _read_line(self):
+		line = self._file.readline()
+		if not line:
+			raise ConnectionError("The key-value store closed the connection")
+		return line[:-2]
+
+	def _read_reply(self):
+		line = self._read_line()
+		kind, rest = line[:1], line[1:]
+		if kind == b"+":
+			return rest.decode("utf-8")
+		if kind == b"-":
+			raise CacheError(f"Key-value store returned an error: {rest.decode('utf-8')}")
+		if kind == b":":
+			return int(rest)
+		if kind == b"$":
+			length = int(rest)
+			if length == -1:
+				return None
+			data = self._file.read(length + 2)
+			return data[:-2]
+		if kind == b"*":
+			length = int(rest)
+			if length == -1:
+				return None
+			return [self._read_reply() for _ in range(length)]
+		raise CacheError(f"Couldn't parse reply from key-value store: {line!r}")
+
+	def close(self):
+		try:
+			self._file.close()
+			self._socket.close()
+		except OSError:
+			pass
@@ -0,0 +1,298 @@
+"""
+	The :code:`openet-client` command - runs a manifest of retrieval jobs across a pool of workers, with progress
+	reporting and the ability to resume an interrupted run. See the command line documentation for the manifest format.
+"""
+
+import argparse
+import concurrent.futures
+import copy
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from .cache import open_cache
+from .client import OpenETClient
+
+log = logging.getLogger(__name__)
+
+JOB_TYPE_FEATURES = "features"
+JOB_TYPE_RASTER = "raster"
+
+DEFAULT_WAIT_TIME = 5000  # ms - matches the geodatabase module's RATE_LIMIT
+
+
+def load_manifest(path):
+	with open(path, 'r') as manifest_file:
+		manifest = json.load(manifest_file)
+
+	if "jobs" not in manifest:
+		raise ValueError(f"Manifest {path} must have a 'jobs' key with a list of jobs to run")
+	return manifest
+
+
+def expand_jobs(manifest):
+	"""
+		Turns the manifest's jobs into the flat list of jobs to run. Values in the manifest's "defaults" are applied
+		to every job that doesn't set them itself, and a job with "date_ranges" becomes one job per range, with
+		start_date and end_date set in its params and the range appended to its name and output.
+	:param manifest: the loaded manifest dictionary
+	:return: list of job dictionaries, each with a unique "name"
+	"""
+	defaults = manifest.get("defaults", {})
+	jobs = []
+	for index, job in enumerate(manifest["jobs"]):
+		job = dict(copy.deepcopy(defaults), **job)
+		job.setdefault("name", f"job_{index}")
+		job.setdefault("params", {})
+
+		if job.get("type") not in (JOB_TYPE_FEATURES, JOB_TYPE_RASTER):
+			raise ValueError(f"Job {job['name']} has type {job.get('type')} - must be one of ('{JOB_TYPE_FEATURES}', '{JOB_TYPE_RASTER}')")
+
+		date_ranges = job.pop("date_ranges", None)
+		if not date_ranges:
+			jobs.append(job)
+			continue
+
+		for start_date, end_date in date_ranges:
+			range_job = copy.deepcopy(job)
+			range_job["name"] = f"{job['name']}_{start_date}_{end_date}"
+			range_job["params"]["start_date"] = start_date
+			range_job["params"]["end_date"] = end_date
+			if "output" in job:
+				base, extension = os.path.splitext(job["output"])
+				range_job["output"] = f"{base}_{start_date}_{end_date}{extension}"
+			jobs.append(range_job)
+
+	names = [job["name"] for job in jobs]
+	if len(names) != len(set(names)):
+		raise ValueError("Job names in the manifest must be unique - they're used to track progress for resuming")
+	return jobs
+
+
+def run_job(job, client):
+	"""
+		Runs a single job with the given client
+	:return: the path the job's output was written to
+	"""
+	if job["type"] == JOB_TYPE_FEATURES:
+		return _run_features_job(job, client)
+	return _run_raster_job(job, client)
+
+
+def _run_features_job(job, client):
+	from . import geodatabase
+	if geodatabase._load_geopandas() is False:
+		raise EnvironmentError("Feature jobs require fiona and geopandas to be installed")
+
+	features = geodatabase.geopandas.read_file(job["input"], layer=job.get("layer"))
+	result = client.geodatabase.get_et_for_features(
+		params=copy.deepcopy(job["params"]),
+		features=features,
+		feature_type=geodatabase.FEATURE_TYPE_GEOPANDAS,
+		output_field=job.get("output_field"),
+		endpoint=job.get("endpoint", "timeseries/features/stats/annual"),
+		wait_time=0,  # the client's rate limiter spaces out requests for the whole pool instead
+		batch_size=job.get("batch_size"),  # None adapts the batch size to how the API responds
+		return_type="joined",
+		join_type=job.get("join_type", "outer"),
+	)
+
+	output = job["output"]
+	if output.endswith(".csv"):
+		result.drop(columns=result.geometry.name).to_csv(output, index=False)
+	elif output.endswith(".parquet"):
+		result.to_parquet(output)
+	else:
+		result.to_file(output)
+	return output
+
+
+def _run_raster_job(job, client):
+	raster = client.raster.export(params=copy.deepcopy(job["params"]), synchronous=True, public=job.get("public", True))
+	if raster.local_file is None:
+		raise RuntimeError(f"Raster for job {job['name']} didn't finish downloading")
+
+	output = job.get("output")
+	if output is None:
+		return raster.local_file
+	if os.path.isdir(output):
+		output = os.path.join(output, os.path.basename(raster.remote_url))
+	shutil.move(raster.local_file, output)
+	return output
+
+
+# each worker process gets its own client, created once when the process starts
+_worker_client = None
+
+
+def _init_worker(token, rate_interval, cache_location):
+	global _worker_client
+	_worker_client = OpenETClient(token=token, cache=open_cache(cache_location) if cache_location else None)
+	_worker_client.rate_limiter.interval = rate_interval
+
+
+def _run_in_worker(job):
+	return run_job(job, _worker_client)
+
+
+class ProgressReporter(object):
+	"""
+		Prints a single updating line of progress - jobs completed, throughput and estimated time remaining.
+	"""
+	def __init__(self, total, stream=sys.stderr):
+		self.total = total
+		self.completed = 0
+		self.failed = 0
+		self.stream = stream
+		self._start = time.monotonic()
+
+	def update(self, succeeded=True):
+		self.completed += 1
+		if not succeeded:
+			self.failed += 1
+		self.stream.write("\r" + self.status_line())
+		if self.completed == self.total:
+			self.stream.write("\n")
+		self.stream.flush()
+
+	def status_line(self):
+		elapsed = time.monotonic() - self._start
+		rate = self.completed / elapsed if elapsed > 0 else 0
+		remaining = (self.total - self.completed) / rate if rate > 0 else float("nan")
+		return (f"{self.completed}/{self.total} jobs done ({self.failed} failed) | {rate * 60:.2f} jobs/min | "
+				f"elapsed {_format_seconds(elapsed)} | ETA {_format_seconds(remaining)}")
+
+
+def _format_seconds(seconds):
+	if seconds != seconds:  # NaN - nothing finished yet to estimate from
+		return "--:--:--"
+	seconds = int(seconds)
+	return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def read_state(state_path):
+	"""
+		Reads the names of the jobs that already completed from a state file
+	"""
+	completed = {}
+	if not os.path.exists(state_path):
+		return completed
+	with open(state_path, 'r') as state_file:
+		for line in state_file:
+			if line.strip():
+				record = json.loads(line)
+				if record["status"] == "done":
+					completed[record["name"]] = record
+	return completed
+
+
+def _record_state(state_path, record):
+	with open(state_path, 'a') as state_file:
+		state_file.write(json.dumps(record) + "\n")
+
+
+def run_manifest(manifest, token, state_path, workers=4, executor="thread", wait_time=DEFAULT_WAIT_TIME, resume=True,
+				 cache_location=None, progress_stream=sys.stderr):
+	"""
+		Runs every job in the manifest across a pool of workers. Each finished job is appended to the state file so that
+		running the same manifest again with resume=True skips anything that already finished.
+
+		All workers share one rate budget - with the thread executor, they share a single client and its rate limiter.
+		With the process executor, each process gets its own client (they still share the cache on disk) and the
+		budget is divided evenly, so each process waits :code:`wait_time * workers` between its own requests.
+	:param manifest: the loaded manifest dictionary
+	:param token: OpenET API token
+	:param state_path: path to the file to record progress in
+	:param workers: how many jobs to run at the same time
+	:param executor: "thread" or "process"
+	:param wait_time: time in ms to leave between the start of requests across all workers
+	:param resume: skip jobs the state file says have already finished
+	:param cache_location: the cache all workers should share - a SQLite database path or a location :code:`cache.open_cache`
+						understands, such as redis://host:port. Defaults to the client's default SQLite cache. A memory://
+						cache only lives in one process, so it can't be used with the process executor
+	:return: dictionary of job name to the error it raised, for jobs that failed. Empty if everything succeeded
+	"""
+	if executor == "process" and cache_location and cache_location.startswith("memory://"):
+		raise ValueError("A memory:// cache can't be shared between processes - use a SQLite path, file:/// or redis:// cache with the process executor")
+
+	jobs = expand_jobs(manifest)
+	if resume:
+		completed = read_state(state_path)
+		jobs = [job for job in jobs if job["name"] not in completed]
+		if completed:
+			log.info(f"Skipping {len(completed)} jobs that already completed")
+
+	if executor == "process":
+		pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(token, wait_time * workers, cache_location))
+		submit = lambda job: pool.submit(_run_in_worker, job)
+	elif executor == "thread":
+		client = OpenETClient(token=token, cache=open_cache(cache_location) if cache_location else None)
+		client.rate_limiter.interval = wait_time
+		pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+		submit = lambda job: pool.submit(run_job, job, client)
+	else:
+		raise ValueError("executor must be one of ('thread', 'process')")
+
+	progress = ProgressReporter(len(jobs), stream=progress_stream)
+	failures = {}
+	with pool:
+		futures = {submit(job): job for job in jobs}
+		for future in concurrent.futures.as_completed(futures):
+			job = futures[future]
+			try:
+				output = future.result()
+			except Exception as e:
+				log.error(f"Job {job['name']} failed: {e}")
+				failures[job["name"]] = e
+				_record_state(state_path, {"name": job["name"], "status": "failed", "error": str(e)})
+				progress.update(succeeded=False)
+				continue
+
+			_record_state(state_path, {"name": job["name"], "status": "done", "output": output})
+			progress.update()
+
+	return failures
+
+
+def main(args=None):
+	parser = argparse.ArgumentParser(prog="openet-client", description="Run a manifest of OpenET retrieval jobs")
+	parser.add_argument("manifest", help="Path to a JSON manifest of jobs to run")
+	parser.add_argument("--token", default=os.environ.get("OPENET_TOKEN"), help="OpenET API token. Defaults to the OPENET_TOKEN environment variable")
+	parser.add_argument("--workers", type=int, default=4, help="How many jobs to run at once (default 4)")
+	parser.add_argument("--executor", choices=("thread", "process"), default="thread", help="Run jobs in threads (default) or processes")
+	parser.add_argument("--wait-time", type=int, default=None, help=f"Milliseconds between requests across all workers (default {DEFAULT_WAIT_TIME}, or the manifest's wait_time)")
+	parser.add_argument("--state", default=None, help="File to record progress in. Defaults to the manifest path plus .state.jsonl")
+	parser.add_argument("--cache", default=None, help="Cache to share between workers - a SQLite database path, file:///folder, redis://host:port, or memory:// (thread executor only). Defaults to the client's usual cache")
+	parser.add_argument("--restart", action="store_true", help="Ignore recorded progress and run every job again")
+	parser.add_argument("--verbose", action="store_true")
+	args = parser.parse_args(args)
+
+	logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+	if args.token is None:
+		parser.error("An OpenET token is required - pass --token or set the OPENET_TOKEN environment variable")
+
+	manifest = load_manifest(args.manifest)
+	state_path = args.state or args.manifest + ".state.jsonl"
+	wait_time = args.wait_time if args.wait_time is not None else manifest.get("wait_time", DEFAULT_WAIT_TIME)
+
+	if args.executor == "process" and args.cache and args.cache.startswith("memory://"):
+		parser.error("--cache memory:// can't be shared between processes - use it with --executor thread, or pick another cache")
+
+	failures = run_manifest(manifest, args.token, state_path,
+							workers=args.workers,
+							executor=args.executor,
+							wait_time=wait_time,
+							resume=not args.restart,
+							cache_location=args.cache)
+	if failures:
+		print(f"{len(failures)} jobs failed - rerun the same command to retry them", file=sys.stderr)
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
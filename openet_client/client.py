@@ -1,4 +1,6 @@
 import logging
+import threading
+import time
 
 import requests
 import json
@@ -10,31 +12,90 @@ from .raster import RasterManager
 from .geodatabase import Geodatabase
 from .exceptions import AuthenticationError, RateLimitError, BadRequestError
 from .cache import Cacher
+from .rate_limit import RateLimiter
+from .retry import RetryPolicy
+from .singleflight import SingleFlight
+from . import metrics
+
+# endpoints that start a job on the server rather than reading data - they're only retried when the server rejected
+# the request (see RetryPolicy.should_retry), and identical concurrent requests to them are each sent
+JOB_ENDPOINTS = ("raster/export",)
+SINGLE_FLIGHT_EXCLUDED_ENDPOINTS = JOB_ENDPOINTS
 
 
 class OpenETClient(object):
+    """
+        The entry point for the API - raster exports are on :code:`client.raster` and feature data on
+        :code:`client.geodatabase`.
+
+        A single client can be shared by many threads at once - for example, one client for a whole pool of workers,
+        so they share one rate limiter, cache and set of metrics. Each request's response is checked on the thread that
+        sent it, and each thread sends its requests through its own pooled HTTP session. Settings such as
+        :code:`force_raise_request_errors`, :code:`retry_policy` and :code:`raster.wait_interval` belong to each client,
+        so changing them on one client doesn't affect any other - change them before handing the client to other
+        threads. A client can't be pickled to send to another process - make one client in each process instead.
+    """
     token = None
     _base_url = "https://openet.dri.edu/"
     _validate_ssl = False
-    force_raise_request_errors = True # raises errors for all request errors before sending data for processing. Default is False to let calling code receive and handle errors, but can be set to True here to catch all errors labeled HTTP 400 - 599 regardless of if we handle them. Need to change how geodatabase code handles rate limiting before can change to True
 
-    def __init__(self, token=None):
+    def __init__(self, token=None, cache_path=None, cache=None):
         self.token = token
+        self.force_raise_request_errors = True  # raises errors for all request errors before sending data for processing. Default is False to let calling code receive and handle errors, but can be set to True here to catch all errors labeled HTTP 400 - 599 regardless of if we handle them. Need to change how geodatabase code handles rate limiting before can change to True
         self.raster = RasterManager(client=self)
         self.geodatabase = Geodatabase(client=self)
-        self.cache = Cacher()
-        self._last_request = None  # just for debugging
+        # any cache.CacheBackend - defaults to SQLite, which is safe to share between threads, and between processes pointed at the same cache_path
+        self.cache = cache if cache is not None else Cacher(path=cache_path)
+        self.rate_limiter = RateLimiter()  # set client.rate_limiter.interval (ms) to space out all requests this client sends
+        self.metrics = metrics.Metrics()  # request, cache and sleep metrics - see client.metrics.snapshot() and .to_prometheus()
+        self.retry_policy = RetryPolicy()  # which failed requests to retry and how long to wait - RetryPolicy(max_attempts=1) disables retries
+        self.deduplicate_requests = True  # identical requests sent at the same time from different threads share one call to the API
+        self._single_flight = SingleFlight()
+        self._local = threading.local()  # each thread's HTTP session and last response
+        self._sessions_lock = threading.Lock()
+        self._sessions = []
 
+    @property
+    def _last_request(self):
+        """
+            The last response this thread received - just for debugging
+        """
+        return getattr(self._local, "last_request", None)
+
+    def _session(self):
+        """
+            Returns this thread's requests.Session, so that each thread reuses its own pooled connections
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        """
+            Closes the HTTP sessions every thread has opened. The next request opens a new one.
+        """
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
 
     def _check_token(self):
         if self.token is None:
             raise AuthenticationError("Token missing/undefined - you must set the value of your token before proceeding")
 
-    def _check_status(self):
-        if self._last_request.status_code >= 200 and self._last_request.status_code < 400:
+    def _check_status(self, response):
+        """
+            Raises the matching error if the response says the request failed
+        """
+        if response.status_code >= 200 and response.status_code < 400:
             return
 
-        r = self._last_request
+        r = response
         try:
             text = r.json()
         except json.decoder.JSONDecodeError:
@@ -60,6 +121,50 @@ class OpenETClient(object):
                 print(f"Warning: Received an HTTP 400 or 500 status code from the API - proceeding in case we can handle it"
                       f"but if you get a crash, the API API Reported HTTP {r.status_code} and text information of {text}")
 
+    def _send_once(self, requester, url, endpoint, method, send_kwargs, extra_kwargs):
+        """
+            Sends a single attempt of a request and records its metrics
+        :return: tuple of the requests.Response and the body that was sent
+        """
+        self.metrics.record_sleep(self.rate_limiter.wait(), reason="rate_limit")
+        start = time.perf_counter()
+        try:
+            if method == "post":
+                body = json.dumps(send_kwargs)
+                result = requester(url, headers={"Authorization": self.token}, data=body, **extra_kwargs)
+            else:
+                body = send_kwargs
+                result = requester(url, headers={"Authorization": self.token}, params=body, **extra_kwargs)
+        except requests.RequestException as e:
+            self.metrics.increment(metrics.REQUEST_ERRORS, endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            self.metrics.observe(metrics.REQUEST_SECONDS, time.perf_counter() - start, endpoint=endpoint)
+
+        self.metrics.increment(metrics.REQUESTS, endpoint=endpoint, status=str(result.status_code))
+        self.metrics.increment(metrics.RESPONSE_BYTES, len(result.content), endpoint=endpoint)
+        return result, body
+
+    def _retry(self, endpoint, attempt, response=None, error=None):
+        """
+            Checks the retry policy for a failed attempt and, if it should be retried, waits out the backoff.
+            Responses that say we're going too fast also slow down the rate limiter for every later request.
+        :return: True if the request should be sent again
+        """
+        throttled = isinstance(error, RateLimitError) or (response is not None and response.status_code == 429)
+        if throttled:
+            self.rate_limiter.slow_down()
+
+        if not self.retry_policy.should_retry(attempt, response=response, error=error, idempotent=endpoint not in JOB_ENDPOINTS):
+            return False
+
+        reason = type(error).__name__ if error is not None else str(response.status_code)
+        self.metrics.increment(metrics.RETRIES, endpoint=endpoint, reason=reason)
+        wait = self.retry_policy.backoff(attempt, response=response)
+        logging.warning(f"Request to {endpoint} failed ({reason}) - retrying in {wait:.1f} seconds")
+        self.metrics.sleep(wait, reason="retry_backoff")
+        return True
+
     def send_request(self, endpoint, method="get", disable_encoding=False, **kwargs):
         """
             Handles sending most requests to the API - they provide the endpoint and the args.
@@ -69,11 +174,33 @@ class OpenETClient(object):
         :param method: "get" or "post" (case sensitive) - should match what the API supports for the endpoint
         :param kwargs: The arguments to send (via get or post) to the API
         :return: requests.Response object of the results.
+
+        Failed requests are retried according to :code:`client.retry_policy` (see openet_client.retry.RetryPolicy) -
+        by default, connection errors, timeouts, rate limit responses and HTTP 429, 502, 503 and 504 are retried up to
+        three times with jittered exponential backoff.
+
+        When another thread is already sending an identical request (same method, endpoint and arguments), this waits
+        for that request and returns the same response instead of sending another one, unless
+        :code:`client.deduplicate_requests` is False. Raster exports are always sent.
         """
 
         self._check_token()
 
-        requester = getattr(requests, method)
+        if not self.deduplicate_requests or endpoint in SINGLE_FLIGHT_EXCLUDED_ENDPOINTS:
+            return self._send_request(endpoint, method, disable_encoding, kwargs)
+
+        key = (method, endpoint, disable_encoding, json.dumps(kwargs, sort_keys=True, default=str))
+        result, shared = self._single_flight.do(key, lambda: self._send_request(endpoint, method, disable_encoding, kwargs))
+        if shared:
+            self.metrics.increment(metrics.DEDUPLICATED_REQUESTS, endpoint=endpoint)
+        return result
+
+    def _send_request(self, endpoint, method, disable_encoding, kwargs):
+        """
+            Sends a request, retrying it according to the retry policy - see send_request
+        """
+
+        requester = getattr(self._session(), method)
         send_kwargs = kwargs
         # they're not currently switching between post args and get args - it's just a get request that we POST instead...
         # send_kwargs = {}
@@ -87,7 +214,6 @@ class OpenETClient(object):
         url = self._base_url + endpoint
         logging.info(f"Connecting to {url}")
         logging.info(f"Sending params {kwargs}")
-        logging.info(f"Sending token in header{self.token}")
 
         extra_kwargs = {}
         if self._validate_ssl != True:
@@ -96,15 +222,35 @@ class OpenETClient(object):
         if disable_encoding and method == "get":  # the API doesn't always like certain things URL-encoded, so don't
             send_kwargs = "&".join("%s=%s" % (k, v) for k, v in send_kwargs.items())
 
-        if method == "post":
-            body = json.dumps(send_kwargs)
-            result = requester(url, headers={"Authorization": self.token}, data=body, **extra_kwargs)
-        else:
-            body = send_kwargs
-            result = requester(url, headers={"Authorization": self.token}, params=body, **extra_kwargs)
-        self._last_request = result
+        attempt = 0
+        while True:
+            try:
+                result, body = self._send_once(requester, url, endpoint, method, send_kwargs, extra_kwargs)
+            except requests.RequestException as e:
+                if not self._retry(endpoint, attempt, error=e):
+                    raise
+                attempt += 1
+                continue
+
+            if result.status_code in self.retry_policy.statuses and self._retry(endpoint, attempt, response=result):
+                attempt += 1
+                continue
+
+            self._local.last_request = result
+            try:
+                self._check_status(result)
+            except RateLimitError as e:
+                self.metrics.increment(metrics.REQUEST_ERRORS, endpoint=endpoint, error=type(e).__name__)
+                if not self._retry(endpoint, attempt, response=result, error=e):
+                    raise
+                attempt += 1
+                continue
+            except Exception as e:
+                self.metrics.increment(metrics.REQUEST_ERRORS, endpoint=endpoint, error=type(e).__name__)
+                raise
+            break
 
-        self._check_status()
+        self.rate_limiter.speed_up()
 
         # cache the request and response so that if anything goes wrong, we've saved the data
         self.cache.cache_request(url, body, result.status_code, json.dumps(result.json()))
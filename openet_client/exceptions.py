@@ -22,4 +22,7 @@ class RateLimitError(DataProcessingError):
     pass
 
 class FileRetrievalError(RuntimeError):
-    pass
\ No newline at end of file
+    pass
+
+class CacheError(RuntimeError):
+    pass
@@ -1,19 +1,47 @@
+import concurrent.futures
+import datetime
+import json
 import tempfile
-import time
 import logging
+import math
+import os
+import pathlib
 from collections import OrderedDict
 
-from .exceptions import RateLimitError
+import requests
 
-try:
-	import fiona  # try importing fiona directly, because otherwise geopandas defers errors to later on when it actually needs to use it
-	import geopandas
-	GEOPANDAS_AVAILABLE = True
-except ImportError:
-	GEOPANDAS_AVAILABLE = False
-	logging.warning("Can't load fiona or geopandas - will not be able to undertake spatial operations")
+from .exceptions import BadRequestError, RateLimitError
+from .batching import BatchSizer, batch_shape_key, parse_request_date
+from .timeseries import _shift_date, _to_date
+from . import metrics
 
-import pandas
+# fiona, geopandas and pandas are slow to import, so they're loaded the first time something in this module needs them
+# rather than when openet_client is imported - workers that only use the raster or timeseries APIs never load them.
+geopandas = None
+pandas = None
+GEOPANDAS_AVAILABLE = None  # None until we've tried loading geopandas, then True or False
+
+
+def _load_pandas():
+	global pandas
+	if pandas is None:
+		import pandas as pandas_module
+		pandas = pandas_module
+	return pandas
+
+
+def _load_geopandas():
+	global geopandas, GEOPANDAS_AVAILABLE
+	if GEOPANDAS_AVAILABLE is None:
+		try:
+			import fiona  # try importing fiona directly, because otherwise geopandas defers errors to later on when it actually needs to use it
+			import geopandas as geopandas_module
+			geopandas = geopandas_module
+			GEOPANDAS_AVAILABLE = True
+		except ImportError:
+			GEOPANDAS_AVAILABLE = False
+			logging.warning("Can't load fiona or geopandas - will not be able to undertake spatial operations")
+	return GEOPANDAS_AVAILABLE
 
 MAX_FEATURE_IDS_LIST_LENGTH = 40
 RATE_LIMIT = 5000  # ms
@@ -21,12 +49,36 @@ RATE_LIMIT = 5000  # ms
 FEATURE_TYPE_GEOPANDAS = "geopandas"
 FEATURE_TYPE_GEOJSON = "geojson"
 FEATURE_TYPE_ARCPY = "arcpy"
-FEATURE_TYPE_SHAPEPLY = "shapely"
+FEATURE_TYPE_SHAPELY = "shapely"
+FEATURE_TYPE_SHAPEPLY = FEATURE_TYPE_SHAPELY  # original misspelling, kept so existing code keeps working
+FEATURE_TYPE_ARROW = "arrow"
+FEATURE_TYPES = (FEATURE_TYPE_GEOPANDAS, FEATURE_TYPE_GEOJSON, FEATURE_TYPE_SHAPELY, FEATURE_TYPE_ARROW, FEATURE_TYPE_ARCPY)
+
+# feature types that are read and joined back in their own format, without building a GeoDataFrame
+NATIVE_FEATURE_TYPES = (FEATURE_TYPE_GEOJSON, FEATURE_TYPE_SHAPELY, FEATURE_TYPE_ARROW, FEATURE_TYPE_ARCPY)
+
+# region lookups - tiles with fewer uncached locations than this are looked up point by point instead
+PREFETCH_MIN_POINTS = 3
+# sent with each region's polygon to feature_ids_list when prefetching. Prefetching assigns locations to fields using
+# the field geometries in the response's "features" - if the API doesn't include them, the tile's locations are looked
+# up point by point as usual
+REGION_LOOKUP_PARAMS = {"spatial_join_type": "intersect", "override": "False"}
+
+# the interval of each feature stats endpoint, as timeseries._shift_date names them
+ENDPOINT_INTERVALS = {"annual": "yearly", "monthly": "monthly", "daily": "daily"}
+
+# how pandas join types map to Arrow's
+ARROW_JOIN_TYPES = {"outer": "full outer", "left": "left outer", "right": "right outer", "inner": "inner"}
+
+
+def _centroid_key(x, y):
+	# the same format _prepare_features uses for GeoDataFrames, so cached feature IDs are shared between input types
+	return f'{round(float(x), 7)} {round(float(y), 7)}'
 
 
 def get_coords_shapely(geometry):
-	coords = geometry.centroid.coords
-	return (coords.x, coords.y)
+	centroid = geometry.centroid
+	return (centroid.x, centroid.y)
 
 
 def get_coords_arcpy(geometry):
@@ -34,10 +86,147 @@ def get_coords_arcpy(geometry):
 	return (centroid.X, centroid.Y)
 
 
+def iter_feature_chunks(features, chunk_size=1000, layer=None):
+	"""
+		Yields GeoDataFrames of at most chunk_size features from a larger input without loading all of it at once.
+	:param features: A path to any file fiona can read (streamed a chunk at a time), a GeoDataFrame (sliced), or an
+					iterable of GeoJSON-like features or of GeoDataFrames, such as a generator reading from a database
+	:param chunk_size: The largest number of features in a chunk
+	:param layer: The layer to read when features is a path to a multi-layer file, such as a geopackage
+	"""
+	_load_geopandas()
+	if isinstance(features, (str, pathlib.Path)):
+		import fiona
+		with fiona.open(str(features), layer=layer) as source:
+			crs = source.crs_wkt or None
+			chunk = []
+			for record in source:
+				chunk.append(record)
+				if len(chunk) == chunk_size:
+					yield geopandas.GeoDataFrame.from_features(chunk, crs=crs)
+					chunk = []
+			if chunk:
+				yield geopandas.GeoDataFrame.from_features(chunk, crs=crs)
+		return
+
+	if isinstance(features, geopandas.GeoDataFrame):
+		for start in range(0, len(features), chunk_size):
+			yield features.iloc[start:start + chunk_size]
+		return
+
+	chunk = []
+	for item in features:
+		if isinstance(item, geopandas.GeoDataFrame):  # already chunked - split up any that are too big
+			yield from iter_feature_chunks(item, chunk_size)
+			continue
+		chunk.append(item)
+		if len(chunk) == chunk_size:
+			yield geopandas.GeoDataFrame.from_features(chunk, crs=4326)
+			chunk = []
+	if chunk:
+		yield geopandas.GeoDataFrame.from_features(chunk, crs=4326)
+
+
+def feature_result_key(endpoint, params):
+	"""
+		Identifies a set of results for a feature - the endpoint plus every param except the field IDs, in a canonical
+		form so that the same request written differently (e.g. a year as 2018 or "2018") shares cached results
+	"""
+	canonical = {key: str(value) for key, value in params.items() if key != "field_ids"}
+	return f"{endpoint}|{json.dumps(canonical, sort_keys=True)}"
+
+
+def _reaches_present(params):
+	"""
+		Whether a request's dates run up to or past today, in which case its results may still change
+	"""
+	try:
+		return parse_request_date(params["end_date"], end=True) >= datetime.date.today()
+	except (KeyError, ValueError):
+		return True  # without an end date, we can't tell whether the results are final
+
+
+class _ChunkWriter(object):
+	"""
+		Writes each chunk of results out as it finishes - to a CSV (without geometries), a folder of parquet files
+		(one per chunk, readable together as a single dataset), any vector format geopandas can append to, or by
+		calling a function with each chunk
+	"""
+	def __init__(self, output, layer=None):
+		self.output = output
+		self.layer = layer
+		self.chunks = 0
+		self.rows = 0
+
+	def write(self, frame):
+		if callable(self.output):
+			self.output(frame)
+		elif str(self.output).endswith(".csv"):
+			frame.drop(columns=frame.geometry.name).to_csv(self.output, mode="w" if self.chunks == 0 else "a",
+															header=self.chunks == 0, index=False)
+		elif str(self.output).endswith(".parquet"):
+			if self.chunks == 0:
+				os.makedirs(str(self.output), exist_ok=True)
+				for old_part in pathlib.Path(self.output).glob("part-*.parquet"):  # from a previous run
+					old_part.unlink()
+			frame.to_parquet(os.path.join(str(self.output), f"part-{self.chunks:05d}.parquet"))
+		else:
+			frame.to_file(self.output, layer=self.layer, mode="w" if self.chunks == 0 else "a")
+
+		self.chunks += 1
+		self.rows += len(frame)
+
+
+# each worker process for get_et_for_features_chunked gets its own client, created once when the process starts
+_chunk_worker_client = None
+
+
+def _chunk_worker_settings(client, workers):
+	"""
+		The settings each chunk worker's client copies from the client that started the run
+	"""
+	return {
+		"token": client.token,
+		"base_url": client._base_url,
+		"cache": client.cache,
+		"rate_interval": client.rate_limiter.interval * workers,
+		"retry_policy": client.retry_policy,
+		"force_raise_request_errors": client.force_raise_request_errors,
+		"validate_ssl": client._validate_ssl,
+		"deduplicate_requests": client.deduplicate_requests,
+		"prefetch_tile_size": client.geodatabase.prefetch_tile_size,
+	}
+
+
+def _init_chunk_worker(settings):
+	from .client import OpenETClient  # imported here because the client module imports this one
+
+	global _chunk_worker_client
+	_chunk_worker_client = OpenETClient(token=settings["token"], cache=settings["cache"])
+	_chunk_worker_client._base_url = settings["base_url"]
+	_chunk_worker_client._validate_ssl = settings["validate_ssl"]
+	_chunk_worker_client.rate_limiter.interval = settings["rate_interval"]
+	_chunk_worker_client.retry_policy = settings["retry_policy"]
+	_chunk_worker_client.force_raise_request_errors = settings["force_raise_request_errors"]
+	_chunk_worker_client.deduplicate_requests = settings["deduplicate_requests"]
+	_chunk_worker_client.geodatabase.prefetch_tile_size = settings["prefetch_tile_size"]
+
+
+def _run_chunk_in_worker(chunk, options):
+	"""
+		Runs a chunk and returns its results along with the metrics recorded while running it, to merge into the
+		metrics of the client that started the run
+	"""
+	result = _chunk_worker_client.geodatabase._get_et_for_chunk(chunk, **options)
+	return result, _chunk_worker_client.metrics.drain()
+
+
 class Geodatabase(object):
 
 	def __init__(self, client):
 		self.client = client
+		# when set, get_feature_ids looks up the fields in each tile_size degree square of locations with one request - see prefetch_feature_ids
+		self.prefetch_tile_size = None
 
 	def get_et_for_features(self,
 							params,
@@ -47,17 +236,33 @@ class Geodatabase(object):
 							geometry_field="geometry",
 							endpoint="timeseries/features/stats/annual",
 							wait_time=RATE_LIMIT,
-							batch_size=MAX_FEATURE_IDS_LIST_LENGTH,
+							batch_size=None,
 							return_type="joined",
-							join_type="outer"):
+							join_type="outer",
+							dry_run=False):
 		"""
 			Takes one of multiple data formats (user specified, we're not inspecting it - options are
-			geopandas, geojson) and gets its
+			geopandas, geojson, shapely, arrow and arcpy) and gets its
 			coordinate values, then gets the field IDs in OpenET for the coordinate pair, retrieves the ET data
-			and returns it as a geopandas data frame with the results in the specified output_field
+			and returns it joined to the input with the results in the specified output_field.
+
+			Inputs other than geopandas are read directly, without building a GeoDataFrame, and "joined" results come
+			back in the same format as the input:
+
+			* geojson - a FeatureCollection or list of features (WGS 84, per the GeoJSON spec). Returns the same, with
+			  the results added to each feature's properties
+			* shapely - a list or array of shapely geometries in WGS 84. Returns a list of dictionaries with the
+			  input_index and geometry of the input plus the results
+			* arrow - a pyarrow Table or the path to a GeoParquet file, with WKB or WKT geometries in geometry_field.
+			  Geometries are reprojected from the GeoParquet metadata's CRS if needed. Returns a pyarrow Table
+			* arcpy - the path to a feature class, or a layer. The results are written into output_field (and
+			  openet_feature_id) on the feature class, and its path is returned. Needs one result per feature, such as
+			  a single year of annual data
 		:param params:
 		:param features:
 		:param endpoint: which features endpoint should it use?
+		:param batch_size: How many feature IDs to send in each ET request. The default of None adapts the size to how
+						quickly the API responds and remembers what worked - see get_et_for_openet_feature_list
 		:param return_type: How should we return the data? Options are "raw" to return just the JSON from OpenET,
 							"list" to return a list of dictionaries with the OpenET data, "pandas" to return a pandas
 							 data frame of the results, or "joined" to return the
@@ -67,14 +272,11 @@ class Geodatabase(object):
 						we have multiple timeseries records, such as for monthly results, but it can duplicate input
 						records (not always desirable). To change the behavior, change this to any value supported
 						by pandas.merge or change the return_type so no join occurs.
+		:param dry_run: When True, doesn't send anything to the API and instead returns the plan for the run from
+						:code:`plan_et_for_features` - how many requests it would take and how long it should run.
 		:return:
 		"""
 
-		if GEOPANDAS_AVAILABLE is False:
-			# we'll check it this way because that way we can let people who don't want to get a working fiona/geopandas environment
-			# use the application without it confusingly failing on them at runtime.
-			raise EnvironmentError("Fiona or Geopandas is unavailable - check that Fiona and Geopandas are both installed and that importing Fiona works - cannot proceed without a working installation with fiona and geopandas")
-
 		if endpoint.startswith("timeseries/"):  # strip it off the front if they included it
 			endpoint.replace("timeseries/", "")
 
@@ -84,11 +286,322 @@ class Geodatabase(object):
 		if return_type not in ("joined", "pandas", "list", "raw"):
 			raise ValueError("return_type must be one of ('joined', 'list', 'raw', 'pandas')")
 
-		if feature_type not in (FEATURE_TYPE_GEOPANDAS, FEATURE_TYPE_GEOJSON):
-			raise ValueError(f"Feature type must be in ({FEATURE_TYPE_GEOPANDAS}, {FEATURE_TYPE_GEOJSON}) to get geometries and retrieve ET. CHeck that the feature_type parameter is specified correctly")
+		if feature_type in NATIVE_FEATURE_TYPES:
+			return self._get_et_for_native_features(params, features, feature_type, output_field, geometry_field,
+													endpoint, wait_time, batch_size, return_type, join_type, dry_run)
+
+		_load_pandas()
+		if _load_geopandas() is False:
+			# we'll check it this way because that way we can let people who don't want to get a working fiona/geopandas environment
+			# use the application without it confusingly failing on them at runtime.
+			raise EnvironmentError("Fiona or Geopandas is unavailable - check that Fiona and Geopandas are both installed and that importing Fiona works - cannot proceed without a working installation with fiona and geopandas")
+
+		features_wgs = self._prepare_features(features, feature_type, geometry_field)
+
+		if dry_run:
+			return self.plan_et_for_features(features_wgs, wait_time=wait_time,
+												batch_size=batch_size or self.initial_batch_size(endpoint, params),
+												endpoint=endpoint, params=params)
+
+		# we're going to have to get the feature IDs one by one if we want a reliable mapping of polygons to openET features
+		# which isn't ideal and we'll want to rate limit it to make sure we don't abuse the API too heavily
+		# we'll probably also want to do some form of caching or saving the feature IDs to the geopandas dfs so that
+		# we don't have to go back and get it again if we already got it.
+
+		# only get the feature IDs if they aren't already there to save time and
+		# avoid a column naming conflict if they run the same data through multiple times
+		if not "openet_feature_id" in list(features_wgs.columns):
+			openet_feature_ids = self.get_feature_ids(features_wgs, field="centroid", wait_time=wait_time)
+			#temp_feature_outputs = tempfile.mktemp(suffix=".csv", prefix="openet_client")
+			#openet_feature_ids.to_csv(temp_feature_outputs)
+
+			features_wgs = features_wgs.merge(openet_feature_ids, on="centroid")
+
+		feature_ids = features_wgs["openet_feature_id"].tolist()
+
+		results = self.get_et_for_openet_feature_list(feature_ids, endpoint, params, wait_time, batch_size)
+
+		self.client.cache.save_shelf(results)  # save out the current data structure for results before proceeding and possibly breaking things
+
+		return self._process_results(results, return_type, output_field, features_wgs, join_type)
+
+	def get_et_for_features_chunked(self,
+									params,
+									features,
+									output,
+									output_field,
+									chunk_size=1000,
+									layer=None,
+									output_layer=None,
+									geometry_field="geometry",
+									endpoint="timeseries/features/stats/annual",
+									wait_time=RATE_LIMIT,
+									batch_size=None,
+									join_type="outer",
+									workers=1,
+									progress_callback=None):
+		"""
+			Like :code:`get_et_for_features` with return_type "joined", but for inputs too large to hold in memory. Reads
+			the features a chunk at a time, then reprojects, looks up feature IDs, retrieves ET and writes out the
+			joined results for each chunk before moving on to the next, so memory use depends on chunk_size rather
+			than on the size of the input.
+
+			If a chunk fails, the error is raised, but the chunks that finished before it are already in the output,
+			and their feature IDs are in the cache, so running again is much quicker.
+		:param params: The parameters for the ET requests, as for get_et_for_features
+		:param features: A path to any file fiona can read, a GeoDataFrame, or an iterable of GeoJSON-like features or
+						of GeoDataFrames - see :code:`iter_feature_chunks`
+		:param output: Where to write results. A .csv path (written without geometries), a .parquet path (written as a
+						folder with one file per chunk, which pandas and geopandas read as one dataset), a path to any
+						other vector format geopandas can append to, such as a geopackage, or a function that's called
+						with each chunk of results
+		:param output_field: The field to put the ET values in
+		:param chunk_size: How many features to process at a time
+		:param layer: The layer to read when features is a path to a multi-layer file
+		:param output_layer: The layer to write to when output is a multi-layer format, such as a geopackage
+		:param workers: How many processes to run chunks in. The default of 1 runs everything in this process. With
+						more than one, each process waits :code:`wait_time * workers` between its requests, so the
+						total request rate stays the same, and at most two chunks per worker are read ahead. Each
+						process's client copies this client's settings (retry policy, error handling and so on), and
+						the metrics it records are added to this client's metrics as each chunk finishes. A retry
+						budget is copied to each process rather than shared between them
+		:param progress_callback: Called as :code:`progress_callback(chunks_done, features_done)` after each chunk is written
+		:return: dictionary with the number of "chunks" and "features" processed, "rows" written and the "output"
+		"""
+		if _load_geopandas() is False:
+			raise EnvironmentError("Fiona or Geopandas is unavailable - check that Fiona and Geopandas are both installed and that importing Fiona works - cannot proceed without a working installation with fiona and geopandas")
+
+		writer = _ChunkWriter(output, layer=output_layer)
+		options = {"params": params, "output_field": output_field, "geometry_field": geometry_field,
+					"endpoint": endpoint, "wait_time": wait_time, "batch_size": batch_size, "join_type": join_type}
+		feature_count = 0
+
+		def finish_in_worker(chunk_features, result_and_metrics):
+			result, worker_metrics = result_and_metrics
+			self.client.metrics.merge(worker_metrics)
+			finish(chunk_features, result)
+
+		def finish(chunk_features, result):
+			nonlocal feature_count
+			feature_count += chunk_features
+			writer.write(result)
+			if progress_callback:
+				progress_callback(writer.chunks, feature_count)
+
+		chunks = iter_feature_chunks(features, chunk_size=chunk_size, layer=layer)
+		if workers <= 1:
+			for chunk in chunks:
+				finish(len(chunk), self._get_et_for_chunk(chunk, **options))
+		else:
+			options["wait_time"] = wait_time * workers
+			initargs = (_chunk_worker_settings(self.client, workers),)
+			with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_chunk_worker, initargs=initargs) as pool:
+				pending = {}
+				for chunk in chunks:
+					pending[pool.submit(_run_chunk_in_worker, chunk, options)] = len(chunk)
+					if len(pending) >= workers * 2:  # don't read further ahead than the workers can keep up with
+						done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+						for future in done:
+							finish_in_worker(pending.pop(future), future.result())
+				for future in concurrent.futures.as_completed(pending):
+					finish_in_worker(pending[future], future.result())
+
+		return {"chunks": writer.chunks, "features": feature_count, "rows": writer.rows, "output": output}
+
+	def _get_et_for_chunk(self, chunk, params, output_field, geometry_field, endpoint, wait_time, batch_size, join_type):
+		"""
+			Runs a single chunk of get_et_for_features_chunked and returns its joined results
+		"""
+		_load_pandas()
+		features_wgs = self._prepare_features(chunk, FEATURE_TYPE_GEOPANDAS, geometry_field)
+		if "openet_feature_id" not in list(features_wgs.columns):
+			openet_feature_ids = self.get_feature_ids(features_wgs, field="centroid", wait_time=wait_time)
+			features_wgs = features_wgs.merge(openet_feature_ids, on="centroid")
+
+		feature_ids = features_wgs["openet_feature_id"].tolist()
+		results = self.get_et_for_openet_feature_list(feature_ids, endpoint, dict(params), wait_time, batch_size)
+		if len(results) == 0:  # nothing in this chunk matched an OpenET field - still write its features out
+			features_wgs[output_field] = None
+			return features_wgs
+
+		return self._process_results(results, "joined", output_field, features_wgs, join_type)
+
+	def refresh_et(self,
+					previous,
+					params,
+					endpoint="timeseries/features/stats/monthly",
+					output_field=None,
+					wait_time=RATE_LIMIT,
+					batch_size=None):
+		"""
+			Extends results retrieved earlier up to a new end date, requesting only the periods that aren't in them yet.
+			For each field, works out the period after the latest one it has results for and requests from there to
+			params["end_date"], so refreshing a long history with another month of data only costs that month.
+			Fields with no results at all are requested from params["start_date"].
+
+			The new results are appended in the same form as the previous ones, so run this with the same endpoint,
+			output_field and other params (apart from the dates) that produced them.
+		:param previous: The earlier results - a list of records ("raw" or "list" results from get_et_for_features or
+						get_et_for_openet_feature_list), a DataFrame or GeoDataFrame ("pandas" or "joined" results), or
+						the path to a parquet file or folder of parquet files (such as get_et_for_features_chunked
+						writes). A file is rewritten with the new rows added, and a folder gets a new part file
+		:param params: The parameters for the ET requests, with the end_date to extend the results to
+		:param endpoint: The features endpoint the previous results came from - annual, monthly or daily
+		:param output_field: The output_field the previous results were retrieved with, if any
+		:return: The previous results with the new ones appended, or for a parquet path, a dictionary with the number
+				of "features" refreshed, new "rows" written and the "output" path
+		"""
+		interval = ENDPOINT_INTERVALS.get(endpoint.rstrip("/").split("/")[-1])
+		if interval is None:
+			raise ValueError(f"Can't refresh results from {endpoint} - must be one of the annual, monthly or daily features endpoints")
+		if "end_date" not in params:
+			raise ValueError("params must include the end_date to refresh the results to")
+
+		if isinstance(previous, (str, pathlib.Path)):
+			return self._refresh_parquet(previous, params, endpoint, interval, output_field, wait_time, batch_size)
+
+		_load_pandas()
+		if isinstance(previous, pandas.DataFrame):
+			id_field = "openet_feature_id" if "openet_feature_id" in previous.columns else "feature_unique_id"
+			latest = previous.groupby(id_field)["time"].max().to_dict() if "time" in previous.columns else \
+				dict.fromkeys(previous[id_field].dropna())
+		else:
+			id_field = "openet_feature_id" if previous and "openet_feature_id" in previous[0] else "feature_unique_id"
+			latest = {}
+			for record in previous:
+				feature_id, time = record.get(id_field), record.get("time")
+				if feature_id is None:
+					continue
+				if feature_id not in latest or (time is not None and (latest[feature_id] is None or time > latest[feature_id])):
+					latest[feature_id] = time
+
+		results = self._get_et_since(latest, params, endpoint, interval, wait_time, batch_size)
+		if id_field == "openet_feature_id" and results:
+			results = self._process_results(results, "list", output_field, None, None)
+
+		if not isinstance(previous, pandas.DataFrame):
+			return list(previous) + results
+		return pandas.concat([previous, self._refreshed_rows(previous, id_field, results)], ignore_index=True)
+
+	def _get_et_since(self, latest, params, endpoint, interval, wait_time, batch_size):
+		"""
+			Requests results for each feature ID from the period after its latest time (feature ID -> time, or None to
+			start from params["start_date"]) to params["end_date"], grouping feature IDs that start from the same period
+		"""
+		end = parse_request_date(params["end_date"], end=True)
+		starts = OrderedDict()
+		for feature_id, time in latest.items():
+			if time is None or time != time:  # no results yet (None or NaN)
+				start = params.get("start_date")
+			else:
+				start = _shift_date(_to_date(time if not isinstance(time, str) else time[:10]), interval, 1).isoformat()
+			if start is not None and parse_request_date(start) <= end:
+				starts.setdefault(start, []).append(feature_id)
+
+		results = []
+		for start, feature_ids in starts.items():
+			window = dict(params, start_date=start)
+			results.extend(self.get_et_for_openet_feature_list(feature_ids, endpoint, window, wait_time, batch_size))
+		return results
+
+	def _refreshed_rows(self, previous, id_field, records):
+		"""
+			Builds the rows to append to a previous DataFrame from new records - for joined results, each feature's
+			other columns (its geometry and attributes) are copied from its latest previous row
+		"""
+		if not records:
+			return previous.iloc[0:0]
+		new_rows = pandas.DataFrame(records)
+		attribute_fields = [field for field in previous.columns if field not in new_rows.columns]
+		if attribute_fields:
+			# several features can share a field, so copy every row from each field's latest period, not just one
+			attributes = previous[previous[id_field].notna()]
+			if "time" in previous.columns:
+				latest = attributes.groupby(id_field)["time"].transform("max")
+				attributes = attributes[(attributes["time"] == latest) | latest.isna()]
+			attributes = attributes[[id_field] + attribute_fields]
+			new_rows = attributes.merge(new_rows, on=id_field, how="inner")
+		return new_rows[[field for field in previous.columns if field in new_rows.columns] +
+						[field for field in new_rows.columns if field not in previous.columns]]
+
+	def _refresh_parquet(self, path, params, endpoint, interval, output_field, wait_time, batch_size):
+		"""
+			refresh_et for results stored in parquet - appends a new part to a folder, or rewrites a single file
+		"""
+		_load_pandas()
+		path = pathlib.Path(path)
+		previous = None
+		if _load_geopandas():
+			try:
+				previous = geopandas.read_parquet(path)
+			except ValueError:  # no geometry metadata - a plain table
+				pass
+		if previous is None:
+			previous = pandas.read_parquet(path)
+
+		refreshed = self.refresh_et(previous, params, endpoint, output_field, wait_time, batch_size)
+		new_rows = refreshed.iloc[len(previous):]
+		if len(new_rows) > 0:
+			if path.is_dir():
+				new_rows.to_parquet(path / f"part-refresh-{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}.parquet")
+			else:
+				temporary_path = path.parent / f".{path.name}.{os.getpid()}.tmp"
+				refreshed.to_parquet(temporary_path)
+				os.replace(str(temporary_path), str(path))
+
+		id_field = "openet_feature_id" if "openet_feature_id" in new_rows.columns else "feature_unique_id"
+		return {"features": new_rows[id_field].nunique() if len(new_rows) > 0 else 0, "rows": len(new_rows), "output": str(path)}
 
+	def _get_et_for_native_features(self, params, features, feature_type, output_field, geometry_field, endpoint,
+									wait_time, batch_size, return_type, join_type, dry_run):
+		"""
+			get_et_for_features for inputs that are read and joined back in their own format - see its documentation
+		"""
+		if feature_type == FEATURE_TYPE_ARROW:
+			features = _read_arrow(features)
+			keys = _arrow_centroid_keys(features, geometry_field)
+		elif feature_type == FEATURE_TYPE_ARCPY:
+			object_ids, keys = _arcpy_centroid_keys(features)
+		elif feature_type == FEATURE_TYPE_GEOJSON:
+			keys = _geojson_centroid_keys(_geojson_features(features))
+		else:
+			keys = _shapely_centroid_keys(features)
+
+		if dry_run:
+			return self.plan_et_for_features(_load_pandas().DataFrame({"centroid": keys}), wait_time=wait_time,
+												batch_size=batch_size or self.initial_batch_size(endpoint, params),
+												endpoint=endpoint, params=params)
+
+		openet_ids = self.get_feature_ids(list(OrderedDict.fromkeys(keys)), wait_time=wait_time)
+		feature_ids = [openet_ids[key] for key in keys]
+
+		# each field only needs to be requested once, however many features share it
+		unique_feature_ids = [feature_id for feature_id in OrderedDict.fromkeys(feature_ids) if feature_id is not None]
+		results = self.get_et_for_openet_feature_list(unique_feature_ids, endpoint, params, wait_time, batch_size)
+
+		self.client.cache.save_shelf(results)
+
+		if return_type != "joined":
+			return self._process_results(results, return_type, output_field, None, join_type)
+
+		records = self._process_results(results, "list", output_field, None, join_type) if results else []
+		matches = list(_match_records(feature_ids, records, join_type))
 		if feature_type == FEATURE_TYPE_GEOJSON:
-			features = geopandas.GeoDataFrame.from_features(features)
+			return _join_geojson(features, keys, feature_ids, matches, output_field)
+		if feature_type == FEATURE_TYPE_ARROW:
+			return _join_arrow(features, keys, feature_ids, matches, output_field)
+		if feature_type == FEATURE_TYPE_ARCPY:
+			return _join_arcpy(features, object_ids, feature_ids, matches, output_field)
+		return [dict(record or {output_field: None}, input_index=index, geometry=features[index], centroid=keys[index],
+						openet_feature_id=feature_ids[index]) for index, record in matches]
+
+	def _prepare_features(self, features, feature_type, geometry_field="geometry"):
+		"""
+			Validates the feature type, reprojects the features to WGS 84 and adds the "centroid" key column
+			used to look up and cache OpenET feature IDs
+		"""
+		if feature_type != FEATURE_TYPE_GEOPANDAS:
+			raise ValueError(f"Feature type must be in {FEATURE_TYPES} to get geometries and retrieve ET. Check that the feature_type parameter is specified correctly")
 
 		features_wgs = features.to_crs(4326)
 		features_wgs.loc[:, "centroid_geom"] = features_wgs[geometry_field].centroid
@@ -105,31 +618,101 @@ class Geodatabase(object):
 		features_wgs = features_wgs.apply(set_centroid, axis=1)
 		features_wgs = features_wgs.drop(columns=["centroid_geom"])  # drop it so it doesn't create output problems later
 
-		# we're going to have to get the feature IDs one by one if we want a reliable mapping of polygons to openET features
-		# which isn't ideal and we'll want to rate limit it to make sure we don't abuse the API too heavily
-		# we'll probably also want to do some form of caching or saving the feature IDs to the geopandas dfs so that
-		# we don't have to go back and get it again if we already got it.
+		return features_wgs
 
-		# only get the feature IDs if they aren't already there to save time and
-		# avoid a column naming conflict if they run the same data through multiple times
-		if not "openet_feature_id" in list(features_wgs.columns):
-			openet_feature_ids = self.get_feature_ids(features_wgs, field="centroid")
-			#temp_feature_outputs = tempfile.mktemp(suffix=".csv", prefix="openet_client")
-			#openet_feature_ids.to_csv(temp_feature_outputs)
+	def plan_et_for_features(self, features_wgs, wait_time=RATE_LIMIT, batch_size=MAX_FEATURE_IDS_LIST_LENGTH, request_seconds=None,
+								endpoint=None, params=None):
+		"""
+			Works out what a :code:`get_et_for_features` run would cost without sending anything to the API - how many
+			feature ID lookups and ET batch requests it needs given what's already in the cache, and roughly how long it
+			should take. Usually called through :code:`get_et_for_features(..., dry_run=True)`, which prepares the
+			features first.
 
-			features_wgs = features_wgs.merge(openet_feature_ids, on="centroid")
+			The ET batch count assumes every feature that still needs a lookup will find its own OpenET field, so it's
+			an upper bound when some of them won't, or share one. Each field is only counted once, and when endpoint and
+			params are given, fields whose results are already in the cache aren't counted at all.
+		:param features_wgs: features prepared by get_et_for_features, with a "centroid" column
+		:param wait_time: The wait time in ms the run would use between requests
+		:param batch_size: The batch size the run would use for ET requests
+		:param request_seconds: How long a single request takes, in seconds. Defaults to the average latency this client
+						has seen so far, or 1 second if it hasn't sent anything yet
+		:param endpoint: The endpoint the run would use, to check the cache for results it already has
+		:param params: The params the run would use, to check the cache for results it already has
+		:return: dictionary describing the run, including "total_requests" and "estimated_seconds", plus
+				"suggested_batch_size" and "suggested_concurrency" for running it faster within the same rate limit.
+				The suggested batch size starts from the size remembered for this endpoint and kind of params (or
+				batch_size, without them) and is adjusted for request_seconds the way a :code:`batching.BatchSizer`
+				would after a batch
+		"""
+		if request_seconds is None:
+			latencies = self.client.metrics.snapshot()["histograms"].get(metrics.REQUEST_SECONDS, [])
+			count = sum(item["count"] for item in latencies)
+			request_seconds = sum(item["sum"] for item in latencies) / count if count > 0 else 1.0
 
-		feature_ids = features_wgs["openet_feature_id"].tolist()
+		if "openet_feature_id" in features_wgs.columns:  # get_et_for_features skips lookups when the IDs are already attached
+			feature_ids = features_wgs["openet_feature_id"].tolist()
+			unique_keys = cache_hits = null_ids = 0
+		else:
+			known = {}
+			for key in features_wgs["centroid"].unique():
+				known[key] = self.client.cache.check_gdb_cache(key=key)
+			unique_keys = len(known)
+			cache_hits = sum(1 for value in known.values() if value is not False)
+			null_ids = sum(1 for value in known.values() if value is None)
+			# anything we'd still need to look up gets a placeholder ID so the batch count below includes it
+			feature_ids = [known[key] if known[key] is not False else key for key in features_wgs["centroid"]]
 
-		results = self.get_et_for_openet_feature_list(feature_ids, endpoint, params, wait_time, batch_size)
+		# get_et_for_openet_feature_list requests each field once, and only if its results aren't cached yet
+		feature_ids = list(OrderedDict.fromkeys(feature_id for feature_id in feature_ids if feature_id is not None))
+		result_cache_hits = 0
+		if endpoint is not None and params is not None:
+			cached = self.client.cache.check_feature_results(feature_result_key(endpoint, params), feature_ids)
+			result_cache_hits = len(cached)
+			feature_ids = [feature_id for feature_id in feature_ids if feature_id not in cached]
 
-		self.client.cache.save_shelf(results)  # save out the current data structure for results before proceeding and possibly breaking things
+		lookup_requests = unique_keys - cache_hits
+		et_requests = math.ceil(len(feature_ids) / batch_size)
+		total_requests = lookup_requests + et_requests
 
-		return self._process_results(results, return_type, output_field, features_wgs, join_type)
+		wait_seconds = wait_time / 1000
+		# with a shared rate limiter, workers can overlap their requests with each other's waits, up to the rate limit
+		suggested_concurrency = max(1, math.ceil((request_seconds + wait_seconds) / wait_seconds)) if wait_seconds > 0 else 4
+		# start where an adaptive run would, and adjust for the latency seen so far the same way it would after a batch
+		base_batch_size = self.initial_batch_size(endpoint, params) if endpoint is not None and params is not None else batch_size
+		sizer = BatchSizer(initial=base_batch_size)
+		sizer.record_success(sizer.size, request_seconds)
+		suggested_batch_size = sizer.size
+		if wait_seconds == 0:  # without a rate limit, extra requests cost nothing, so give every worker a batch
+			suggested_batch_size = math.ceil(len(feature_ids) / suggested_concurrency)
+		suggested_batch_size = max(1, min(sizer.size, suggested_batch_size, len(feature_ids)))
+		suggested_et_requests = math.ceil(len(feature_ids) / suggested_batch_size)
+		suggested_requests = lookup_requests + suggested_et_requests
+		if wait_seconds > 0:
+			suggested_seconds = suggested_requests * max(wait_seconds, (request_seconds + wait_seconds) / suggested_concurrency)
+		else:
+			suggested_seconds = suggested_requests * request_seconds / suggested_concurrency
+
+		return {
+			"features": len(features_wgs),
+			"unique_keys": unique_keys,
+			"cache_hits": cache_hits,
+			"cached_null_ids": null_ids,
+			"result_cache_hits": result_cache_hits,
+			"lookup_requests": lookup_requests,
+			"et_requests": et_requests,
+			"total_requests": total_requests,
+			"request_seconds": request_seconds,
+			"estimated_seconds": total_requests * (request_seconds + wait_seconds),
+			"suggested_batch_size": suggested_batch_size,
+			"suggested_concurrency": suggested_concurrency,
+			"suggested_estimated_seconds": suggested_seconds,
+		}
 
 	def get_et_for_openet_feature_list(self, feature_ids, endpoint, params,
 										wait_time=RATE_LIMIT,
-										batch_size=MAX_FEATURE_IDS_LIST_LENGTH):
+										batch_size=None,
+										use_cache=True,
+										max_age=None):
 		"""
 			Retrieve ET for a list of OpenET Feature IDs and return the raw JSON data. To handle retrieving for spatial
 			data you already have, use get_et_for_features instead.
@@ -137,9 +720,60 @@ class Geodatabase(object):
 		:param endpoint: The OpenET endpoint to run the request against. No default
 		:param params: The parameters as specified in the OpenET documentation (https://open-et.github.io)
 		:param wait_time: How long to wait between requests to avoid hitting a rate limit. Defaults to 5 seconds
-		:param batch_size: How large of batches should we use by default? Defaults to 40
+		:param batch_size: How many feature IDs to send in each request. Defaults to None, which adapts the size as
+						responses come back, starting from the size that worked last time for the same endpoint and
+						kind of params - see :code:`batching.BatchSizer`
+		:param use_cache: Results are cached for each feature ID, endpoint and set of params, so a later request only
+						fetches the feature IDs that aren't cached yet. Results for date ranges that reach today
+						aren't cached, since they can still change. Set to False to fetch everything
+		:param max_age: When set, cached results older than this many seconds are fetched again
 		:return: A list of dictionaries as returned from JSON by the OpenET API
 		"""
+		params = dict(params)  # each batch sets field_ids on it, so work on a copy that isn't shared with other threads
+		feature_ids = list(OrderedDict.fromkeys(feature_id for feature_id in feature_ids if feature_id is not None))
+		result_key = feature_result_key(endpoint, params)
+
+		cached = {}
+		if use_cache:
+			cached = self.client.cache.check_feature_results(result_key, feature_ids, max_age=max_age)
+			self.client.metrics.cache_lookup("feature_results", hit=True, count=len(cached))
+			self.client.metrics.cache_lookup("feature_results", hit=False, count=len(feature_ids) - len(cached))
+		missing = [feature_id for feature_id in feature_ids if feature_id not in cached]
+		cache_key = result_key if use_cache and not _reaches_present(params) else None
+
+		try:
+			if batch_size is None:
+				fetched = self._get_et_adaptive(missing, endpoint, params, wait_time, cache_key)
+			else:
+				fetched = self._get_et_fixed(missing, endpoint, params, wait_time, batch_size, cache_key)
+		except RateLimitError as e:
+			e.data = [record for records in cached.values() for record in records] + (e.data or [])
+			raise
+
+		if not cached:
+			return fetched
+
+		by_id = dict(cached)
+		for record in fetched:
+			by_id.setdefault(record["feature_unique_id"], []).append(record)
+		return [record for feature_id in feature_ids for record in by_id.get(feature_id, [])]
+
+	def _cache_batch_results(self, cache_key, feature_ids, records):
+		"""
+			Caches a successful batch's records by feature ID. Feature IDs the API returned nothing for are cached as
+			having no results, so they aren't requested again either
+		"""
+		if cache_key is None:
+			return
+		by_id = OrderedDict((feature_id, []) for feature_id in feature_ids)
+		for record in records:
+			by_id.setdefault(record.get("feature_unique_id"), []).append(record)
+		self.client.cache.cache_feature_results(cache_key, by_id)
+
+	def _get_et_fixed(self, feature_ids, endpoint, params, wait_time, batch_size, cache_key=None):
+		"""
+			get_et_for_openet_feature_list with a fixed batch size
+		"""
 		df_length = len(feature_ids)
 		start = 0
 		end = min(batch_size, df_length)
@@ -160,7 +794,9 @@ class Geodatabase(object):
 						data=results)
 
 				if response.status_code not in (500, 422, 404):
-					results.extend(response.json())
+					records = response.json()
+					results.extend(records)
+					self._cache_batch_results(cache_key, partial_list, records)
 				else:
 					logging.warning(f"Error retrieving ET for one or more fields. Request sent was {response.url}. Got response {response.text}")
 					if batch_size == original_batch_size:  # if we're not already there, switch to slow batch mode so we go through it one by one now
@@ -169,7 +805,7 @@ class Geodatabase(object):
 						continue  # go back through the last batch one by one so we make sure we get as many as possible
 				# if we are already in slow batch mode, then basically, this record gets skipped
 
-				time.sleep(wait_time / 1000)
+				self.client.metrics.sleep(wait_time / 1000, reason="geodatabase_wait")
 
 			start += batch_size
 
@@ -182,14 +818,69 @@ class Geodatabase(object):
 			end = min(end, df_length)  # we'll only check end because we won't enter the next iteration if start < df_length
 		return results
 
+	def initial_batch_size(self, endpoint, params):
+		"""
+			The batch size adaptive requests start from - the one remembered in the cache for this endpoint and kind of
+			params, or MAX_FEATURE_IDS_LIST_LENGTH
+		"""
+		remembered = self.client.cache.check_batch_size(batch_shape_key(endpoint, params))
+		return remembered if remembered is not None else MAX_FEATURE_IDS_LIST_LENGTH
+
+	def _get_et_adaptive(self, feature_ids, endpoint, params, wait_time, cache_key=None):
+		"""
+			get_et_for_openet_feature_list with batch sizes chosen by a BatchSizer. Batches that fail, such as with a
+			server side timeout, are retried in smaller batches. If a single feature still fails, it's skipped, unless
+			nothing has succeeded yet, in which case the error is probably not about the batch size and is raised.
+		"""
+		shape_key = batch_shape_key(endpoint, params)
+		sizer = BatchSizer(initial=self.initial_batch_size(endpoint, params))
+
+		results = []
+		start = 0
+		while start < len(feature_ids):
+			partial_list = feature_ids[start:start + sizer.size]
+			params["field_ids"] = str(partial_list).replace(" ", "").replace("\'", '"')
+			try:
+				response = self.client.send_request(endpoint, method="post", disable_encoding=False, **params)
+			except RateLimitError as e:
+				raise RateLimitError(
+					str(e) + ". The retrieved data is available as an attribute '.data' on this exception, but is incomplete.",
+					data=results)
+			except (BadRequestError, requests.Timeout) as e:
+				if len(partial_list) == 1:
+					if sizer.successes == 0:
+						raise
+					logging.warning(f"Skipping field {partial_list[0]} after error: {e}")
+					start += 1
+				else:
+					logging.warning(f"Batch of {len(partial_list)} fields failed ({e}) - retrying in smaller batches")
+					sizer.record_failure(len(partial_list))
+				continue
+
+			records = response.json()
+			results.extend(records)
+			self._cache_batch_results(cache_key, partial_list, records)
+			sizer.record_success(len(partial_list), response.elapsed.total_seconds(), len(response.content))
+			start += len(partial_list)
+			if start < len(feature_ids):
+				self.client.metrics.sleep(wait_time / 1000, reason="geodatabase_wait")
+
+		if sizer.successes > 0:
+			self.client.cache.cache_batch_size(shape_key, sizer.size)
+		return results
+
 	def _process_results(self, results, return_type, output_field, features_wgs, join_type):
 		if return_type == "raw":
 			return results
+		if not results and return_type == "list":
+			return []
+
+		_load_pandas()
 	
 		# openet_output_field_name = "data_value" if "aggregation" not in params else params["aggregation"]
 
 		# figure out which keys are there using the first result - there should only be one, but this lets us make sure we get anything
-		output_field_keys = list(set(results[0].keys()).intersection(set(["data_value", "sum", "mean", "min", "max", "median"])))
+		output_field_keys = list(set(results[0].keys() if results else []).intersection(set(["data_value", "sum", "mean", "min", "max", "median"])))
 
 		results_reformed = results
 		for item in results:
@@ -209,14 +900,14 @@ class Geodatabase(object):
 		if return_type == "list":
 			return results_reformed
 
-		results_df = pandas.DataFrame(results_reformed)
+		results_df = pandas.DataFrame(results_reformed) if results_reformed else pandas.DataFrame(columns=["openet_feature_id"])
 		if return_type == "pandas":
 			return results_df
 
 		final = features_wgs.merge(results_df, on="openet_feature_id", how=join_type)
 		return final
 
-	def get_feature_ids(self, features, field=None, wait_time=RATE_LIMIT):
+	def get_feature_ids(self, features, field=None, wait_time=RATE_LIMIT, prefetch_tile_size=None):
 		"""
 			An internal method used to get a list of coordinate pairs and return the feature ID. Values come back as a dictionary
 			where the input item in the list (coordinate pair shown as DD Longitude space DD latitude)
@@ -225,8 +916,11 @@ class Geodatabase(object):
 		:param field: when field is defined, features will be a pandas data frame with a field that has the coordinate values to use.
 						In that case, results will be joined back to the data frame as the field openet_feature_id.
 		:param wait_time: how long in ms should we wait between subsequent requests?
+		:param prefetch_tile_size: When set, locations are first looked up a region at a time with prefetch_feature_ids,
+						using tiles of this many degrees. Defaults to :code:`client.geodatabase.prefetch_tile_size`
 		:return:
 		"""
+		_load_pandas()
 		if field and not isinstance(features, pandas.DataFrame):
 			raise ValueError("A field name was provided, but `features` are not a Pandas DataFrame. Must be a DataFrame to proceed, or a field name should not be provided")
 
@@ -235,10 +929,15 @@ class Geodatabase(object):
 		else:
 			inputs = features
 
+		prefetch_tile_size = prefetch_tile_size or self.prefetch_tile_size
+		if prefetch_tile_size:
+			self.prefetch_feature_ids(inputs, tile_size=prefetch_tile_size, wait_time=wait_time)
+
 		outputs = OrderedDict()
 		for item in inputs:
 			# check the cache first - we might not need an API request for their field ID
 			cached_value = self.client.cache.check_gdb_cache(key=item)
+			self.client.metrics.cache_lookup("geodatabase", hit=cached_value is not False)
 			if cached_value is False:  # False indicates no records, None indicates it's there and Null
 				params = {"coordinates": item, "spatial_join_type": "intersect", "override": "False"}
 				results = self.feature_ids_list(params)
@@ -259,7 +958,7 @@ class Geodatabase(object):
 				# save the returned value in our cache so we don't make another roundtrip if we run these
 				# same values through in the future
 				self.client.cache.cache_gdb_item(key=item, value=outputs[item])
-				time.sleep(wait_time / 1000)
+				self.client.metrics.sleep(wait_time / 1000, reason="geodatabase_wait")
 			else:
 				outputs[item] = cached_value
 				# no need to sleep when we check out own cache!
@@ -271,6 +970,71 @@ class Geodatabase(object):
 		else:
 			return outputs
 
+	def prefetch_feature_ids(self, locations, tile_size=0.05, min_points=PREFETCH_MIN_POINTS, wait_time=RATE_LIMIT):
+		"""
+			Looks up the fields for many locations with a request per region instead of a request per location. The
+			locations that aren't cached yet are grouped into tile_size degree squares, and for each square with at
+			least min_points of them, feature_ids_list is asked once for every field in the square along with the
+			fields' geometries. Each location is then assigned to the field it falls in locally, and cached, so
+			get_feature_ids finds it there. In dense agricultural areas, this takes a small fraction of the requests.
+
+			Locations in sparser tiles, and in tiles the API returns no geometries for, are left for get_feature_ids
+			to look up one at a time. Needs shapely.
+		:param locations: "longitude latitude" strings in WGS 84, as get_feature_ids takes
+		:param tile_size: The width and height of each region, in degrees
+		:param min_points: Tiles with fewer uncached locations than this are left to be looked up individually
+		:param wait_time: How long in ms to wait between requests
+		:return: The number of locations whose fields were found and cached
+		"""
+		shapely = _load_shapely()
+
+		tiles = OrderedDict()
+		for location in OrderedDict.fromkeys(locations):
+			if self.client.cache.check_gdb_cache(key=location) is not False:
+				continue
+			longitude, latitude = (float(value) for value in location.split(" "))
+			tiles.setdefault((math.floor(longitude / tile_size), math.floor(latitude / tile_size)), []).append(location)
+
+		resolved = 0
+		for (column, row), tile_locations in tiles.items():
+			if len(tile_locations) < min_points:
+				continue
+
+			west, south = column * tile_size, row * tile_size
+			region = [(west, south), (west + tile_size, south), (west + tile_size, south + tile_size), (west, south + tile_size), (west, south)]
+			params = dict(REGION_LOOKUP_PARAMS, coordinates=",".join(f"{round(x, 7)},{round(y, 7)}" for x, y in region))
+			response = self.feature_ids_list(params).json()
+			self.client.metrics.sleep(wait_time / 1000, reason="geodatabase_wait")
+			fields = response.get("features")
+			if fields is None:  # no geometries to assign locations with
+				logging.info("The region lookup didn't include field geometries - looking up its locations one at a time")
+				continue
+
+			field_ids = [_region_field_id(field) for field in fields]
+			# a location that misses every geometry only has no field if every field the response lists has a geometry -
+			# otherwise it may be in one of the others, so it's left to be looked up on its own
+			listed_ids = response.get("feature_unique_ids", response.get("field_ids"))
+			complete = listed_ids is None or set(listed_ids) <= set(field_ids)
+			matches = {}
+			point_indexes = field_indexes = ()
+			if fields:
+				tree = shapely.STRtree([shapely.geometry.shape(field["geometry"]) for field in fields])
+				points = shapely.points([[float(value) for value in location.split(" ")] for location in tile_locations])
+				point_indexes, field_indexes = (indexes.tolist() for indexes in tree.query(points, predicate="intersects"))
+			for point_index, field_index in zip(point_indexes, field_indexes):
+				if point_index not in matches or field_index < matches[point_index]:  # the first field listed, if it's on a border
+					matches[point_index] = field_index
+			for index, location in enumerate(tile_locations):
+				if index in matches:
+					self.client.cache.cache_gdb_item(key=location, value=field_ids[matches[index]])
+				elif complete:
+					self.client.cache.cache_gdb_item(key=location, value=None)
+				else:
+					continue
+				resolved += 1
+
+		return resolved
+
 	def feature_ids_list(self, params=None):
 		"""
 			The base OpenET Method - sends the supplied params to metadata/openet/region_of_interest/feature_ids_list
@@ -283,3 +1047,181 @@ class Geodatabase(object):
 			params = {}
 		results = self.client.send_request(endpoint, method="post", **params)
 		return results
+
+
+def _region_field_id(field):
+	"""
+		The field ID of a GeoJSON feature in a region lookup's response
+	"""
+	properties = field.get("properties") or {}
+	for key in ("feature_unique_id", "field_id", "id"):
+		if properties.get(key) is not None:
+			return properties[key]
+	return field.get("id")
+
+
+def _load_shapely():
+	try:
+		import shapely
+	except ImportError:
+		raise EnvironmentError("Reading shapely, GeoJSON and Arrow features needs shapely - install it with pip install shapely")
+	return shapely
+
+
+def _shapely_centroid_keys(geometries):
+	shapely = _load_shapely()
+	import numpy  # shapely depends on numpy
+
+	centroids = shapely.centroid(numpy.asarray(geometries, dtype=object))
+	return [_centroid_key(x, y) for x, y in zip(shapely.get_x(centroids), shapely.get_y(centroids))]
+
+
+def _geojson_features(features):
+	if isinstance(features, dict) and features.get("type") == "FeatureCollection":
+		return features["features"]
+	return features
+
+
+def _geojson_centroid_keys(features):
+	shapely = _load_shapely()
+	return _shapely_centroid_keys([shapely.geometry.shape(feature["geometry"]) for feature in features])
+
+
+def _read_arrow(features):
+	try:
+		import pyarrow.parquet
+	except ImportError:
+		raise EnvironmentError("Arrow inputs need pyarrow - install it with pip install pyarrow")
+
+	if isinstance(features, (str, pathlib.Path)):
+		return pyarrow.parquet.read_table(str(features))
+	return features
+
+
+def _arrow_centroid_keys(table, geometry_field):
+	"""
+		Reads the geometries straight from an Arrow table's WKB (or WKT) column, reprojecting them to WGS 84 first if the
+		GeoParquet metadata says they're in another coordinate system
+	"""
+	import pyarrow
+	shapely = _load_shapely()
+
+	column = table.column(geometry_field)
+	if pyarrow.types.is_binary(column.type) or pyarrow.types.is_large_binary(column.type):
+		geometries = shapely.from_wkb(column.to_numpy(zero_copy_only=False))
+	elif pyarrow.types.is_string(column.type) or pyarrow.types.is_large_string(column.type):
+		geometries = shapely.from_wkt(column.to_numpy(zero_copy_only=False))
+	else:
+		raise ValueError(f"Column {geometry_field} must hold WKB or WKT geometries - it has type {column.type}")
+
+	metadata = (table.schema.metadata or {}).get(b"geo")
+	crs = json.loads(metadata).get("columns", {}).get(geometry_field, {}).get("crs") if metadata else None
+	if crs is not None:  # GeoParquet uses longitude/latitude WGS 84 when there's no crs
+		import pyproj
+		source = pyproj.CRS.from_user_input(crs)
+		if not source.equals(pyproj.CRS.from_epsg(4326), ignore_axis_order=True):
+			transformer = pyproj.Transformer.from_crs(source, 4326, always_xy=True)
+			geometries = shapely.transform(geometries, lambda coordinates: _transform_coordinates(transformer, coordinates))
+
+	return _shapely_centroid_keys(geometries)
+
+
+def _transform_coordinates(transformer, coordinates):
+	import numpy
+	x, y = transformer.transform(coordinates[:, 0], coordinates[:, 1])
+	return numpy.column_stack([x, y])
+
+
+def _load_arcpy():
+	try:
+		import arcpy
+	except ImportError:
+		raise EnvironmentError("arcpy features can only be read from a Python environment with arcpy, such as ArcGIS Pro's")
+	return arcpy
+
+
+def _arcpy_centroid_keys(features):
+	"""
+		Reads each feature's centroid in WGS 84 with a search cursor
+	:return: tuple of the list of object IDs and the list of centroid keys, in the same order
+	"""
+	arcpy = _load_arcpy()
+	object_ids = []
+	keys = []
+	with arcpy.da.SearchCursor(features, ["OID@", "SHAPE@XY"], spatial_reference=arcpy.SpatialReference(4326)) as cursor:
+		for object_id, (x, y) in cursor:
+			object_ids.append(object_id)
+			keys.append(_centroid_key(x, y))
+	return object_ids, keys
+
+
+def _match_records(feature_ids, records, join_type):
+	"""
+		Pairs each input feature (by index) with its result records, like a database join. Features without results
+		are paired with None unless join_type is "inner" or "right"
+	"""
+	by_id = {}
+	for record in records:
+		by_id.setdefault(record["openet_feature_id"], []).append(record)
+
+	for index, feature_id in enumerate(feature_ids):
+		matched = by_id.get(feature_id) if feature_id is not None else None
+		if matched:
+			for record in matched:
+				yield index, record
+		elif join_type in ("outer", "left"):
+			yield index, None
+
+
+def _join_geojson(features, keys, feature_ids, matches, output_field):
+	input_features = _geojson_features(features)
+	joined = []
+	for index, record in matches:
+		feature = input_features[index]
+		properties = dict(feature.get("properties") or {}, centroid=keys[index], openet_feature_id=feature_ids[index])
+		properties.update(record if record is not None else {output_field: None})
+		joined.append(dict(feature, properties=properties))
+
+	if isinstance(features, dict) and features.get("type") == "FeatureCollection":
+		return dict(features, features=joined)
+	return joined
+
+
+def _join_arrow(table, keys, feature_ids, matches, output_field):
+	import pyarrow
+
+	indices = [index for index, _ in matches]
+	record_fields = list(OrderedDict.fromkeys(key for _, record in matches if record is not None for key in record))
+	record_fields = [field for field in record_fields if field != "openet_feature_id"] or [output_field]
+
+	joined = table.take(pyarrow.array(indices, type=pyarrow.int64()))  # only copies the rows, not per value work
+	joined = joined.append_column("centroid", pyarrow.array([keys[index] for index in indices], type=pyarrow.string()))
+	joined = joined.append_column("openet_feature_id", pyarrow.array([feature_ids[index] for index in indices], type=pyarrow.string()))
+	for field in record_fields:
+		joined = joined.append_column(field, pyarrow.array([record.get(field) if record is not None else None for _, record in matches]))
+	return joined
+
+
+def _join_arcpy(features, object_ids, feature_ids, matches, output_field):
+	arcpy = _load_arcpy()
+
+	values = {}
+	for index, record in matches:
+		if record is None:
+			continue
+		if object_ids[index] in values:
+			raise ValueError("arcpy features can only be joined when there's one result per feature, such as a single year of"
+								" annual data - use return_type 'list' or 'pandas' for timeseries")
+		values[object_ids[index]] = record.get(output_field)
+
+	existing_fields = [field.name for field in arcpy.ListFields(features)]
+	if output_field not in existing_fields:
+		arcpy.management.AddField(features, output_field, "DOUBLE")
+	if "openet_feature_id" not in existing_fields:
+		arcpy.management.AddField(features, "openet_feature_id", "TEXT", field_length=64)
+
+	ids_by_object = dict(zip(object_ids, feature_ids))
+	with arcpy.da.UpdateCursor(features, ["OID@", output_field, "openet_feature_id"]) as cursor:
+		for row in cursor:
+			cursor.updateRow([row[0], values.get(row[0]), ids_by_object.get(row[0])])
+	return features
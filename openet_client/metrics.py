@@ -0,0 +1,229 @@
+"""
+	Lightweight metrics for the client - request counts and latencies per endpoint, response sizes, errors, cache
+	effectiveness and time spent sleeping. Every OpenETClient has one at :code:`client.metrics`.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # seconds
+
+REQUESTS = "openet_requests_total"
+REQUEST_ERRORS = "openet_request_errors_total"
+RETRIES = "openet_retries_total"
+DEDUPLICATED_REQUESTS = "openet_deduplicated_requests_total"
+REQUEST_SECONDS = "openet_request_seconds"
+RESPONSE_BYTES = "openet_response_bytes_total"
+CACHE_HITS = "openet_cache_hits_total"
+CACHE_MISSES = "openet_cache_misses_total"
+SLEEP_SECONDS = "openet_sleep_seconds_total"
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+
+class Histogram(object):
+	__slots__ = ("buckets", "counts", "sum", "count")
+
+	def __init__(self, buckets=DEFAULT_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * len(buckets)
+		self.sum = 0
+		self.count = 0
+
+	def observe(self, value):
+		self.sum += value
+		self.count += 1
+		for index, bound in enumerate(self.buckets):
+			if value <= bound:
+				self.counts[index] += 1
+				break
+
+	def cumulative(self):
+		"""
+			Returns (upper bound, count of observations at or below it) pairs, ending with +Inf, as Prometheus expects
+		"""
+		total = 0
+		pairs = []
+		for bound, count in zip(self.buckets, self.counts):
+			total += count
+			pairs.append((bound, total))
+		pairs.append((float("inf"), self.count))
+		return pairs
+
+
+class Metrics(object):
+	"""
+		Collects the client's metrics. Read them with :code:`snapshot()` (a dictionary) or :code:`to_prometheus()` (the
+		Prometheus text exposition format), or register a function with :code:`add_exporter` to receive each
+		measurement as it's recorded - e.g. to forward them to StatsD or your own logging. Exporters are called as
+		:code:`exporter(name, value, labels)` and should be quick, since they run on the thread making the request.
+	"""
+
+	def __init__(self, buckets=DEFAULT_BUCKETS):
+		self.buckets = buckets
+		self._lock = threading.Lock()
+		self._counters = {}
+		self._histograms = {}
+		self._exporters = []
+
+	def add_exporter(self, exporter):
+		self._exporters.append(exporter)
+		return exporter
+
+	def remove_exporter(self, exporter):
+		self._exporters.remove(exporter)
+
+	def reset(self):
+		with self._lock:
+			self._counters = {}
+			self._histograms = {}
+
+	def drain(self):
+		"""
+			Returns everything recorded so far, in the form :code:`merge` takes, and resets - e.g. for a worker process
+			to send its metrics back to the process that started it
+		"""
+		with self._lock:
+			state = (self._counters, self._histograms)
+			self._counters = {}
+			self._histograms = {}
+		return state
+
+	def merge(self, state):
+		"""
+			Adds metrics from :code:`drain()` on another Metrics object into this one. Exporters aren't called for them,
+			since they were recorded elsewhere
+		"""
+		counters, histograms = state
+		with self._lock:
+			for key, value in counters.items():
+				self._counters[key] = self._counters.get(key, 0) + value
+			for key, other in histograms.items():
+				histogram = self._histograms.setdefault(key, Histogram(other.buckets))
+				histogram.counts = [count + other_count for count, other_count in zip(histogram.counts, other.counts)]
+				histogram.sum += other.sum
+				histogram.count += other.count
+
+	def increment(self, name, value=1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0) + value
+		self._export(name, value, labels)
+
+	def observe(self, name, value, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			if key not in self._histograms:
+				self._histograms[key] = Histogram(self.buckets)
+			self._histograms[key].observe(value)
+		self._export(name, value, labels)
+
+	@contextmanager
+	def timer(self, name, **labels):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(name, time.perf_counter() - start, **labels)
+
+	def record_sleep(self, seconds, reason):
+		if seconds > 0:
+			self.increment(SLEEP_SECONDS, seconds, reason=reason)
+
+	def sleep(self, seconds, reason):
+		"""
+			Sleeps, and records the time spent sleeping under the given reason
+		"""
+		time.sleep(seconds)
+		self.record_sleep(seconds, reason)
+
+	def cache_lookup(self, cache, hit, count=1):
+		self.increment(CACHE_HITS if hit else CACHE_MISSES, count, cache=cache)
+
+	def counter_value(self, name, **labels):
+		"""
+			The value of a counter, summed across every label set that matches the labels provided
+		"""
+		with self._lock:
+			return sum(value for (counter_name, counter_labels), value in self._counters.items()
+						if counter_name == name and set(labels.items()) <= set(counter_labels))
+
+	def snapshot(self):
+		"""
+			Returns all metrics as a dictionary, plus a summary comparing time spent in requests with time spent sleeping
+		:return: {"counters": {name: [{"labels": {...}, "value": ...}]},
+				 "histograms": {name: [{"labels": {...}, "count": ..., "sum": ..., "buckets": {upper bound: count}}]},
+				 "summary": {...}}
+		"""
+		with self._lock:
+			counters = {}
+			for (name, labels), value in self._counters.items():
+				counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+			histograms = {}
+			for (name, labels), histogram in self._histograms.items():
+				histograms.setdefault(name, []).append({
+					"labels": dict(labels),
+					"count": histogram.count,
+					"sum": histogram.sum,
+					"buckets": dict(histogram.cumulative()),
+				})
+
+		hits = self.counter_value(CACHE_HITS)
+		misses = self.counter_value(CACHE_MISSES)
+		summary = {
+			"requests": self.counter_value(REQUESTS),
+			"errors": self.counter_value(REQUEST_ERRORS),
+			"retries": self.counter_value(RETRIES),
+			"deduplicated_requests": self.counter_value(DEDUPLICATED_REQUESTS),
+			"response_bytes": self.counter_value(RESPONSE_BYTES),
+			"request_seconds": sum(item["sum"] for item in histograms.get(REQUEST_SECONDS, [])),
+			"sleep_seconds": self.counter_value(SLEEP_SECONDS),
+			"cache_hit_rate": hits / (hits + misses) if hits + misses > 0 else None,
+		}
+		return {"counters": counters, "histograms": histograms, "summary": summary}
+
+	def to_prometheus(self):
+		"""
+			Renders all metrics in the Prometheus text exposition format
+		"""
+		lines = []
+		with self._lock:
+			counters = sorted(self._counters.items())
+			histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+		last_name = None
+		for (name, labels), value in counters:
+			if name != last_name:
+				lines.append(f"# TYPE {name} {COUNTER}")
+				last_name = name
+			lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+		last_name = None
+		for (name, labels), histogram in histograms:
+			if name != last_name:
+				lines.append(f"# TYPE {name} {HISTOGRAM}")
+				last_name = name
+			for bound, count in histogram.cumulative():
+				bucket_labels = labels + (("le", "+Inf" if bound == float("inf") else _format_value(bound)),)
+				lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+			lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+			lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+		return "\n".join(lines) + "\n"
+
+	def _export(self, name, value, labels):
+		for exporter in self._exporters:
+			exporter(name, value, labels)
+
+
+def _format_labels(labels):
+	if not labels:
+		return ""
+	escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+	return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+	return repr(float(value)) if isinstance(value, float) else str(value)
@@ -1,9 +1,15 @@
+import collections.abc
+import concurrent.futures
+import copy
+import math
+import os
 import uuid
 import tempfile
 import shutil
 import time
 import functools
 import logging
+import threading
 
 import requests
 
@@ -17,29 +23,226 @@ STATUS_AVAILABLE = 3
 STATUS_DOWNLOADED = 4
 STATUS_FAILED_OPENET = 5
 STATUS_FAILED_CLIENT = 6
+QUEUED_STATUSES = (STATUS_NONE, STATUS_SUBMITTED, STATUS_WAITING, STATUS_AVAILABLE)
+DONE_STATUSES = (STATUS_DOWNLOADED, STATUS_FAILED_OPENET, STATUS_FAILED_CLIENT)
+
+DEFAULT_TILE_SIZE = 0.5  # degrees
+
+
+def _load_shapely():
+    try:
+        import shapely.geometry
+        import shapely.wkt
+    except ImportError:
+        raise EnvironmentError("Tiled exports need shapely to split geometries - install it with pip install shapely")
+    return shapely
+
+
+def _load_rasterio():
+    try:
+        import rasterio
+        import rasterio.transform
+        import rasterio.windows
+    except ImportError:
+        raise EnvironmentError("Mosaicking tiles needs rasterio - install it with pip install rasterio")
+    return rasterio
+
+
+def _format_coordinate(value):
+    return repr(round(float(value), 10))
+
+
+def _geometry_to_string(geometry, transform=False):
+    """
+        Turns a geometry into the comma separated "lon,lat,lon,lat,..." string the raster endpoints expect, using the
+        exterior ring of polygons. Accepts strings (returned as they are), GEOS and OGR objects such as GeoDjango
+        geometries (optionally transforming them to WGS 84 first), shapely geometries or anything else with a
+        :code:`__geo_interface__`, and sequences of (lon, lat) pairs.
+    """
+    if isinstance(geometry, str):
+        return geometry
+
+    if hasattr(geometry, "transform") and hasattr(geometry, "coords"):  # GEOS/OGR
+        if transform:
+            geometry = geometry.transform(4326, clone=True)
+        coordinates = geometry.coords
+        if len(coordinates) > 0 and not isinstance(coordinates[0], (tuple, list)):  # a point
+            coordinates = [coordinates]
+        while len(coordinates) > 0 and isinstance(coordinates[0][0], (tuple, list)):  # polygons are nested in rings
+            coordinates = coordinates[0]
+    elif hasattr(geometry, "__geo_interface__"):
+        geo_interface = geometry.__geo_interface__
+        if geo_interface["type"] == "Polygon":
+            coordinates = geo_interface["coordinates"][0]
+        elif geo_interface["type"] in ("LineString", "MultiPoint"):
+            coordinates = geo_interface["coordinates"]
+        elif geo_interface["type"] == "Point":
+            coordinates = [geo_interface["coordinates"]]
+        else:
+            raise ValueError(f"Can't send a {geo_interface['type']} as a geometry - use a single polygon or point")
+    elif len(geometry) > 0 and not isinstance(geometry[0], (tuple, list)):
+        return geometry  # already a flat list of coordinate values - send it as it is
+    else:
+        coordinates = geometry
+
+    return ",".join(f"{_format_coordinate(point[0])},{_format_coordinate(point[1])}" for point in coordinates)
+
+
+def _string_to_polygon(geometry):
+    shapely = _load_shapely()
+    values = [float(value) for value in geometry.split(",")]
+    return shapely.geometry.Polygon(list(zip(values[::2], values[1::2])))
+
+
+def split_geometry(geometry, tile_size=DEFAULT_TILE_SIZE):
+    """
+        Splits a polygon into the pieces of it that fall in each cell of a grid of tile_size degree squares. Cells the
+        polygon doesn't touch are skipped. Needs shapely.
+    :param geometry: a polygon as a shapely geometry or any other form :code:`_geometry_to_string` accepts, in WGS 84
+    :param tile_size: width and height of each tile in degrees
+    :return: list of shapely polygons. Multipart pieces, where the polygon crosses a cell more than once, are
+            replaced by their convex hull so each tile can be sent as a single polygon
+    """
+    shapely = _load_shapely()
+    if not isinstance(geometry, shapely.geometry.base.BaseGeometry):
+        geometry = _string_to_polygon(_geometry_to_string(geometry))
+
+    min_x, min_y, max_x, max_y = geometry.bounds
+    tiles = []
+    for row in range(max(1, math.ceil((max_y - min_y) / tile_size))):
+        for column in range(max(1, math.ceil((max_x - min_x) / tile_size))):
+            cell = shapely.geometry.box(min_x + column * tile_size, min_y + row * tile_size,
+                                        min(max_x, min_x + (column + 1) * tile_size), min(max_y, min_y + (row + 1) * tile_size))
+            piece = geometry.intersection(cell)
+            if piece.is_empty or piece.area == 0:
+                continue
+            if piece.geom_type != "Polygon":
+                piece = piece.convex_hull
+            tiles.append(piece)
+    return tiles
+
+
+def mosaic_rasters(paths, output_path, nodata=None):
+    """
+        Mosaics tiles that share a coordinate system and resolution (such as the tiles from a tiled export) into a
+        single GeoTIFF. Reads and writes one block of one tile at a time, so memory use doesn't depend on the size of
+        the mosaic. Where tiles overlap, valid data from later tiles wins over earlier tiles. Needs rasterio.
+    :param paths: paths to the tiles
+    :param output_path: path to write the mosaic to
+    :param nodata: nodata value for the mosaic. Defaults to the first tile's nodata value, or 0 if it doesn't have one
+    :return: output_path
+    """
+    rasterio = _load_rasterio()
+    import numpy  # rasterio depends on numpy, so it's always available here
+
+    if len(paths) == 0:
+        raise ValueError("No tiles to mosaic")
+
+    bounds = []
+    for path in paths:
+        with rasterio.open(path) as tile:
+            bounds.append(tile.bounds)
+            if len(bounds) == 1:
+                profile = tile.profile.copy()
+                resolution = tile.res
+    left, bottom = min(b.left for b in bounds), min(b.bottom for b in bounds)
+    right, top = max(b.right for b in bounds), max(b.top for b in bounds)
+
+    nodata = nodata if nodata is not None else (profile.get("nodata") if profile.get("nodata") is not None else 0)
+    profile.update(
+        driver="GTiff",
+        width=int(round((right - left) / resolution[0])),
+        height=int(round((top - bottom) / resolution[1])),
+        transform=rasterio.transform.from_origin(left, top, resolution[0], resolution[1]),
+        nodata=nodata,
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        compress="deflate",
+        BIGTIFF="IF_SAFER",
+    )
+
+    with rasterio.open(output_path, "w+", **profile) as mosaic:  # w+ so we can read what earlier tiles wrote
+        for path in paths:
+            with rasterio.open(path) as tile:
+                column_offset = int(round((tile.bounds.left - left) / resolution[0]))
+                row_offset = int(round((top - tile.bounds.top) / resolution[1]))
+                for _, window in tile.block_windows(1):
+                    data = tile.read(window=window, masked=True)
+                    target = rasterio.windows.Window(window.col_off + column_offset, window.row_off + row_offset,
+                                                     window.width, window.height)
+                    existing = mosaic.read(window=target)
+                    mosaic.write(numpy.where(numpy.ma.getmaskarray(data), existing, data.data), window=target)
+    return output_path
 
 
 class Raster(object):
     """
         Internal object for managing raster exports - tracks current status, the remote URL and the local file path once
         it exists. Users of this package shouldn't need to instantiate this object directly in most cases.
+
+        Slotted and only keeps the fields it needs from the API's response, since a season of exports can mean tens
+        of thousands of them. Changing its status updates the indexes of the RasterRegistry it belongs to.
     """
+    __slots__ = ("_status", "params", "remote_url", "local_file", "uuid", "_registry", "_callbacks")
+
     def __init__(self, request_result):
-        self.status = STATUS_NONE
+        self._status = STATUS_NONE
+        self._registry = None
+        self._callbacks = None
         self.params = {}
         self.remote_url = None
         self.local_file = None
         self.uuid = uuid.uuid4()
 
-        self._request_result = request_result
-        self._set_values()
+        self._set_values(request_result)
 
-    def _set_values(self):
-        self.remote_url = self._request_result['destination'][0]
-        if self._request_result['state'] in ("READY", "UNSUBMITTED", "RUNNING"):
+    def _set_values(self, request_result):
+        self.remote_url = request_result['destination'][0]
+        if request_result['state'] in ("READY", "UNSUBMITTED", "RUNNING"):
             self.status = STATUS_SUBMITTED
 
-    def download_file(self, retry_interval=20, max_wait=600):
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        previous = self._status
+        self._status = status
+        if self._registry is not None and previous != status:
+            self._registry._move(self, previous, status)
+        if status in DONE_STATUSES and self._callbacks:
+            callbacks, self._callbacks = self._callbacks, None
+            for callback in callbacks:
+                self._run_callback(callback)
+
+    @property
+    def done(self):
+        """
+            Whether the raster has been downloaded or has failed
+        """
+        return self._status in DONE_STATUSES
+
+    def add_done_callback(self, callback):
+        """
+            Calls callback(raster) once this raster is downloaded or fails - right away if it already has. Callbacks run
+            on whichever thread finishes the raster, so they should hand off any long running work.
+        """
+        if self.done:
+            self._run_callback(callback)
+            return
+        if self._callbacks is None:
+            self._callbacks = []
+        self._callbacks.append(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            logging.exception(f"Callback for raster {self.remote_url} raised an exception")
+
+    def download_file(self, retry_interval=20, max_wait=600, metrics=None):
         """
             Attempts to download a raster, assuming it's ready for download.
             Will make multiple attempts over a few minutes because sometimes it takes a while for the permissions
@@ -50,6 +253,7 @@ class Raster(object):
             wish.
         :param retry_interval: time in seconds between repeated attempts
         :param max_wait: How long, in seconds should we wait for the correct permissions before stopping attempts to download.
+        :param metrics: Optional Metrics object (e.g. client.metrics) to record time spent waiting on permissions in
         :return:
         """
         # adapted from https://stackoverflow.com/a/39217788/587938
@@ -74,10 +278,119 @@ class Raster(object):
 
                 if not self.status == STATUS_DOWNLOADED:
                     logging.info(f"not yet available - trying again in {retry_interval}")
-                    time.sleep(retry_interval)
+                    if metrics is not None:
+                        metrics.sleep(retry_interval, reason="raster_download_wait")
+                    else:
+                        time.sleep(retry_interval)
                     wait_time += retry_interval
 
 
+class RasterRegistry(collections.abc.MutableMapping):
+    """
+        The RasterManager's registry of Raster objects by uuid. Works like a dictionary, but also keeps an index of
+        rasters by status that's updated whenever a raster's status changes, so finding the rasters in a given status
+        only touches those rasters rather than scanning every export.
+    """
+    def __init__(self):
+        self._rasters = {}
+        self._by_status = {}  # status -> {uuid: raster}, using dicts as insertion ordered sets
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return self._rasters[key]
+
+    def __setitem__(self, key, raster):
+        with self._lock:
+            if key in self._rasters:
+                self._remove(key)
+            self._rasters[key] = raster
+            self._by_status.setdefault(raster.status, {})[key] = raster
+            raster._registry = self
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        raster = self._rasters.pop(key)
+        self._by_status.get(raster.status, {}).pop(key, None)
+        raster._registry = None
+
+    def __iter__(self):
+        with self._lock:  # a snapshot, so other threads can add rasters while this is iterated
+            return iter(list(self._rasters))
+
+    def __len__(self):
+        return len(self._rasters)
+
+    def _move(self, raster, previous, status):
+        with self._lock:
+            if self._rasters.get(raster.uuid) is not raster:
+                return
+            self._by_status.get(previous, {}).pop(raster.uuid, None)
+            self._by_status.setdefault(status, {})[raster.uuid] = raster
+
+    def with_status(self, *statuses):
+        """
+            Returns the rasters that currently have any of the given statuses
+        """
+        with self._lock:
+            return [raster for status in statuses for raster in self._by_status.get(status, {}).values()]
+
+    def count(self, status):
+        with self._lock:
+            return len(self._by_status.get(status, {}))
+
+
+class TiledRaster(object):
+    """
+        A single logical raster that was exported as a grid of tiles with :code:`RasterManager.export_tiled`. Each tile
+        is a Raster in the manager's registry, so waiting for and downloading them works just like any other export,
+        and :code:`mosaic()` joins the downloaded tiles back into one GeoTIFF.
+    """
+    def __init__(self, tiles, params):
+        self.tiles = tiles
+        self.params = params
+        self.local_file = None
+        self.uuid = uuid.uuid4()
+
+    @property
+    def status(self):
+        """
+            The status of the least complete tile, or a failed status if any tile failed
+        """
+        statuses = [tile.status for tile in self.tiles]
+        failed = [status for status in statuses if status in (STATUS_FAILED_OPENET, STATUS_FAILED_CLIENT)]
+        if failed:
+            return failed[0]
+        return min(statuses) if statuses else STATUS_NONE
+
+    @property
+    def tile_paths(self):
+        return [tile.local_file for tile in self.tiles if tile.status == STATUS_DOWNLOADED]
+
+    def mosaic(self, output_path=None, remove_tiles=False):
+        """
+            Mosaics the downloaded tiles into a single GeoTIFF - see :code:`mosaic_rasters`. Needs rasterio.
+        :param output_path: where to write the mosaic. Defaults to a temporary file, like single raster downloads
+        :param remove_tiles: delete the tiles once the mosaic is written
+        :return: the path to the mosaic, which is also set as this object's local_file
+        """
+        missing = [tile.remote_url for tile in self.tiles if tile.status != STATUS_DOWNLOADED]
+        if missing:
+            raise FileRetrievalError(f"Can't mosaic until every tile is downloaded - still missing {missing}")
+
+        output_path = output_path if output_path is not None else tempfile.mktemp(suffix=".tif")
+        mosaic_rasters(self.tile_paths, output_path)
+        self.local_file = output_path
+
+        if remove_tiles:
+            for tile in self.tiles:
+                os.remove(tile.local_file)
+                tile.local_file = None
+        return output_path
+
+
 class RasterManager(object):
     """
         The manager that becomes the .raster attribute on the OpenETClient object.
@@ -92,12 +405,11 @@ class RasterManager(object):
         rasters.
     """
 
-    client = None
-    wait_interval = 30
-
     def __init__(self, client):
         self.client = client
-        self.registry = {}
+        self.wait_interval = 30
+        self.registry = RasterRegistry()
+        self.tiled_registry = {}
         self.timeseries = RasterTimeSeries(raster_manager=self)
 
     def export(self, params=None, synchronous=False, public=True, transform=False):
@@ -128,23 +440,17 @@ class RasterManager(object):
                         will have the status of the raster
         """
         endpoint = "raster/export"
-        params = {} if params is None else params
+        params = {} if params is None else dict(params)  # a copy, so callers can share one params dictionary between threads
 
         if "filename_suffix" in params and not "public" in params["filename_suffix"] and public is True:
             params["filename_suffix"] += "_public"
         elif "filename_suffix" not in params and public is True:
             params["filename_suffix"] = "_public"
 
-        # check that if they passed in an object for the geometry, see if we can get the correct coordinate strings.
-        if hasattr(params["geometry"], "transform") and hasattr(params["geometry"], "coords"):
-            geom = params["geometry"]
-            if transform:
-                geom = geom.transform(4326, clone=True)
-            params["geometry"] = str(geom.coords).replace("(", "").replace(")", "").replace(" ", "")[:-1]
-        #
-        # it checks if we have the ability to reproject the geometry data passed in and if we can get a coordinate string from it,
-        # such as from OGR and GEOS objects in GeoDjango. If it has those abilities, then it attempts to reproject, get the coordinates, and then
-        # stringifies them and removes parens, spaces, and the trailing comma.
+        # if they passed in an object for the geometry (GEOS/OGR objects from GeoDjango, shapely geometries, coordinate
+        # pairs), build the coordinate string the API needs from it
+        if "geometry" in params:
+            params["geometry"] = _geometry_to_string(params["geometry"], transform=transform)
 
         result = self.client.send_request(endpoint, method="post", **params)
 
@@ -159,14 +465,62 @@ class RasterManager(object):
 
         return raster
 
+    def export_tiled(self, params=None, tile_size=DEFAULT_TILE_SIZE, max_workers=4, synchronous=False, public=True,
+                     transform=False, output_path=None):
+        """
+            Exports a large area as a grid of smaller rasters, which export faster and more reliably than one large
+            job. The geometry is split into tile_size degree tiles with :code:`split_geometry`, the tiles are submitted
+            concurrently, and the returned TiledRaster tracks them as one raster. Needs shapely, and rasterio to mosaic.
+
+        :param params: parameters for the raster/export endpoint, as for :code:`export`. "geometry" can be a shapely
+                        polygon, a GEOS/OGR object, a list of (lon, lat) pairs or a coordinate string
+        :param tile_size: width and height of each tile in degrees
+        :param max_workers: how many tiles to submit at once. Requests still go through the client's rate limiter
+        :param synchronous: wait for every tile to export and download, then mosaic them into a single GeoTIFF
+        :param public: as for :code:`export`
+        :param transform: transform a GEOS/OGR geometry to WGS 84 first, as for :code:`export`
+        :param output_path: where to write the mosaic when synchronous. Defaults to a temporary file
+        :return: TiledRaster - when synchronous, its local_file attribute has the path to the mosaic. Otherwise, wait
+                for the tiles with :code:`wait_for_rasters` (or :code:`wait_for_rasters([tile.uuid for tile in tiled.tiles])`)
+                and then call its :code:`mosaic()` method
+        """
+        params = {} if params is None else params
+        if "geometry" not in params:
+            raise ValueError("A geometry is required to split into tiles")
+
+        geometry = params["geometry"]
+        if transform and hasattr(geometry, "transform") and hasattr(geometry, "coords"):
+            geometry = geometry.transform(4326, clone=True)
+        pieces = split_geometry(geometry, tile_size=tile_size)
+        tile_params = copy.deepcopy({key: value for key, value in params.items() if key != "geometry"})
+
+        def submit(index, piece):
+            piece_params = copy.deepcopy(tile_params)
+            piece_params["geometry"] = _geometry_to_string(piece)
+            piece_params["filename_suffix"] = f"{tile_params.get('filename_suffix', '')}_tile{index}"
+            raster = self.export(params=piece_params, public=public)
+            raster.params = piece_params
+            return raster
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            tiles = list(pool.map(submit, range(len(pieces)), pieces))
+
+        tiled = TiledRaster(tiles, params)
+        self.tiled_registry[tiled.uuid] = tiled
+
+        if synchronous:
+            self.wait_for_rasters([tile.uuid for tile in tiles])
+            tiled.mosaic(output_path)
+
+        return tiled
+
     @property
     def queued_rasters(self):
         """
             Which rasters are we still waiting for?
         :return:
         """
-
-        return [raster for raster in self.registry.values() if raster.status < STATUS_DOWNLOADED ]
+        return self.registry.with_status(*QUEUED_STATUSES)
 
     @property
     def available_rasters(self):
@@ -174,11 +528,11 @@ class RasterManager(object):
             Which rasters have we marked as ready to download, but haven't yet been retrieved?
         :return:
         """
-        return [raster for raster in self.registry.values() if raster.status == STATUS_AVAILABLE]
+        return self.registry.with_status(STATUS_AVAILABLE)
 
     @property
     def downloaded_raster_paths(self):
-        return [raster.local_file for raster in self.registry.values() if raster.status == STATUS_DOWNLOADED]
+        return [raster.local_file for raster in self.registry.with_status(STATUS_DOWNLOADED)]
 
     def download_available_rasters(self):
         """
@@ -188,7 +542,83 @@ class RasterManager(object):
         rasters = self.available_rasters
 
         for raster in rasters:
-            raster.download_file()
+            raster.download_file(metrics=self.client.metrics)
+
+    def as_completed(self, rasters=None, max_time=86400, download_workers=4, callback=None):
+        """
+            Yields each raster as soon as it's downloaded (or has failed), so work on the first rasters can start while
+            the rest are still exporting - like :code:`concurrent.futures.as_completed`:
+
+            .. code-block:: python
+
+                for raster in client.raster.as_completed(rasters):
+                    if raster.status == openet_client.raster.STATUS_DOWNLOADED:
+                        process(raster.local_file)
+
+            Polls the all_files endpoint every :code:`wait_interval` seconds, and downloads rasters in background
+            threads as they become available. Rasters whose download fails, or that never become downloadable
+            within the download's own max_wait, are yielded with the status STATUS_FAILED_CLIENT.
+        :param rasters: Raster objects or uuids to wait for. Defaults to every queued raster
+        :param max_time: Maximum time in seconds to wait for all of them. Raises TimeoutError after that
+        :param download_workers: How many rasters to download at the same time
+        :param callback: Optional function called with each raster as it finishes, before it's yielded. To attach
+                        callbacks to individual rasters instead, use :code:`Raster.add_done_callback`
+        :return: generator of Raster objects
+        """
+        if rasters is None:
+            rasters = self.queued_rasters
+        rasters = [self.registry[raster] if not isinstance(raster, Raster) else raster for raster in rasters]
+
+        start = time.monotonic()
+        next_poll = start + self.wait_interval
+        waiting = []
+        downloads = {}
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=download_workers)
+        try:
+            finished = []
+            for raster in rasters:
+                if raster.done:
+                    finished.append(raster)
+                elif raster.status == STATUS_AVAILABLE:
+                    downloads[pool.submit(self._download, raster)] = raster
+                else:
+                    waiting.append(raster)
+
+            while finished or waiting or downloads:
+                for raster in finished:
+                    if callback is not None:
+                        callback(raster)
+                    yield raster
+                finished = []
+
+                now = time.monotonic()
+                if now - start >= max_time:
+                    raise TimeoutError(f"{len(waiting) + len(downloads)} rasters didn't finish within {max_time} seconds")
+
+                if waiting and now >= next_poll:
+                    self.check_statuses(waiting)
+                    for raster in waiting:
+                        if raster.status == STATUS_AVAILABLE:
+                            downloads[pool.submit(self._download, raster)] = raster
+                    waiting = [raster for raster in waiting if raster.status < STATUS_AVAILABLE]
+                    next_poll = now + self.wait_interval
+
+                timeout = max(0, min(next_poll if waiting else math.inf, start + max_time) - time.monotonic())
+                if downloads:
+                    done, _ = concurrent.futures.wait(downloads, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                    finished = [downloads.pop(future) for future in done]
+                elif waiting:
+                    self.client.metrics.sleep(timeout, reason="raster_poll")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _download(self, raster):
+        try:
+            raster.download_file(metrics=self.client.metrics)
+        except (FileRetrievalError, requests.RequestException) as e:
+            logging.error(f"Couldn't download {raster.remote_url}: {e}")
+        if raster.status != STATUS_DOWNLOADED:
+            raster.status = STATUS_FAILED_CLIENT
 
     def wait_for_rasters(self, uuid=None, max_time=86400):
         """
@@ -203,19 +633,21 @@ class RasterManager(object):
             may be exporting all at the same time before waiting - it will wait until all are exported
             before returning flow control to the calling function. Running this after each raster export
             will result in much longer runtimes (because exports will not run in parallel).
-        :param uuid:
+        :param uuid: The uuid of a raster to wait for, or a list of uuids. Defaults to every queued raster
         :param max_time: Maximum time in seconds to wait for all rasters to complete - defaults to 86400 (a day)
         :return:
         """
 
         if uuid is None:
             rasters = self.queued_rasters
+        elif isinstance(uuid, (list, tuple, set)):
+            rasters = [self.registry[raster_uuid] for raster_uuid in uuid]
         else:
             rasters = [self.registry[uuid],]
 
         wait_time = 0
         while len(rasters) > 0 and wait_time < max_time:
-            time.sleep(self.wait_interval)
+            self.client.metrics.sleep(self.wait_interval, reason="raster_poll")
             wait_time += self.wait_interval  # we'll have some error in this approach because we won't account for the time we spend processing things. We could just check how long it's been since we started waiting too
 
             self.check_statuses(rasters)
@@ -236,7 +668,8 @@ class RasterManager(object):
             rasters = self.queued_rasters
 
         results = self.client.send_request(endpoint)
+        ready = set(results.json()["rasters"])
         for raster in rasters:
-            if raster.remote_url in results.json()["rasters"]:
+            if raster.status < STATUS_AVAILABLE and raster.remote_url in ready:
                 raster.status = STATUS_AVAILABLE
 
@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+        Spaces out the start of requests so that consecutive requests begin at least :code:`interval` milliseconds
+        apart. A single RateLimiter can be shared by many threads - each caller reserves the next open slot and then
+        sleeps until that slot arrives, so concurrent workers stay under the limit together instead of each
+        sleeping on their own. An interval of 0 (the default) disables limiting.
+
+        When the API says we're going too fast, :code:`slow_down()` adds a penalty on top of the interval that doubles
+        each time (up to max_penalty), and each successful request afterward shrinks it again, so throughput backs off
+        and then recovers on its own instead of a whole run failing.
+    """
+
+    def __init__(self, interval=0, min_penalty=1000, max_penalty=60000, recovery=0.8):
+        self.interval = interval  # ms
+        self.penalty = 0  # ms added to the interval after the API told us to slow down
+        self.min_penalty = min_penalty
+        self.max_penalty = max_penalty
+        self.recovery = recovery
+        self._lock = threading.Lock()
+        self._next_slot = 0
+
+    @property
+    def current_interval(self):
+        return self.interval + self.penalty
+
+    def slow_down(self):
+        with self._lock:
+            self.penalty = min(self.max_penalty, max(self.penalty * 2, self.min_penalty))
+
+    def speed_up(self):
+        if self.penalty == 0:
+            return
+        with self._lock:
+            self.penalty = self.penalty * self.recovery
+            if self.penalty < 1:
+                self.penalty = 0
+
+    def wait(self):
+        """
+            Blocks until the caller is allowed to send its request.
+        :return: The time in seconds that this call slept for
+        """
+        if not self.current_interval:
+            return 0
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.current_interval / 1000
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
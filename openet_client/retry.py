@@ -0,0 +1,147 @@
+import datetime
+import email.utils
+import random
+import threading
+
+import requests
+
+from .exceptions import RateLimitError
+
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+# for requests that start a job on the server, only failures that mean the server never took the request are retried -
+# a timeout or gateway error may come after the job already started, and retrying would start it again
+REJECTED_STATUSES = (429,)
+REJECTED_EXCEPTIONS = (requests.ConnectTimeout,)
+
+
+class RetryBudget(object):
+    """
+        Caps the total number of retries across a run so that a persistently failing API can't keep a job retrying
+        forever. Shared by every request that uses the same RetryPolicy. Call :code:`reset()` to start a new run.
+    :param max_retries: The number of retries allowed in total. None (the default) for no limit
+    """
+    def __init__(self, max_retries=None):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+            Uses one retry from the budget if there's one left
+        :return: True if the retry may go ahead, False if the budget is spent
+        """
+        with self._lock:
+            if self.max_retries is not None and self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+    def reset(self):
+        with self._lock:
+            self.used = 0
+
+    def __getstate__(self):
+        # a copy sent to another process (such as a chunk worker) keeps its own count, starting from this one's
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """
+        Decides which failed requests OpenETClient.send_request retries, and how long it waits before each retry.
+        Waits grow exponentially (backoff_base * 2 ** attempt, capped at backoff_max) with "full" jitter - a random
+        wait between zero and that value - so that many workers that failed together don't all retry together.
+        When the response has a Retry-After header, that wait is used instead.
+
+    :param max_attempts: The total number of attempts per request, including the first. 1 disables retries
+    :param statuses: HTTP status codes to retry
+    :param exceptions: Exception classes raised while sending the request (e.g. connection errors) to retry
+    :param retry_rate_limits: Whether to retry responses the API labels as exceeding the rate limit
+    :param backoff_base: The wait in seconds before the first retry, before jitter
+    :param backoff_max: The longest wait in seconds before any retry
+    :param jitter: Whether to randomize waits. Only turn this off for testing
+    :param respect_retry_after: Whether to use the wait from a Retry-After header when the server sends one
+    :param budget: A RetryBudget shared by all requests using this policy. Defaults to an unlimited budget
+    """
+    def __init__(self, max_attempts=4, statuses=RETRY_STATUSES, exceptions=RETRY_EXCEPTIONS, retry_rate_limits=True,
+                 backoff_base=1, backoff_max=60, jitter=True, respect_retry_after=True, budget=None):
+        self.max_attempts = max_attempts
+        self.statuses = statuses
+        self.exceptions = exceptions
+        self.retry_rate_limits = retry_rate_limits
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.respect_retry_after = respect_retry_after
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def should_retry(self, attempt, response=None, error=None, idempotent=True):
+        """
+            Whether a request that failed on this attempt (counting from 0) should be tried again. Uses a retry from
+            the budget when the answer is yes.
+        :param attempt: Which attempt just failed, counting from 0
+        :param response: The requests.Response, when the request got one
+        :param error: The exception raised, when there was one
+        :param idempotent: False for requests that start a job on the server, such as raster exports. Those are only
+                        retried when the server rejected them - rate limits, HTTP 429, 503 with a Retry-After header,
+                        or a timeout before connecting - since after a timeout or gateway error the job may already
+                        have started
+        """
+        if attempt + 1 >= self.max_attempts:
+            return False
+
+        if error is not None and isinstance(error, RateLimitError):
+            retryable = self.retry_rate_limits
+        elif error is not None:
+            retryable = isinstance(error, self.exceptions) and (idempotent or isinstance(error, REJECTED_EXCEPTIONS))
+        else:
+            retryable = response is not None and response.status_code in self.statuses and \
+                (idempotent or _rejected(response))
+
+        return retryable and self.budget.take()
+
+    def backoff(self, attempt, response=None):
+        """
+            How long to wait, in seconds, before retrying after the given attempt (counting from 0) failed
+        """
+        if self.respect_retry_after and response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+
+        wait = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, wait) if self.jitter else wait
+
+
+def _rejected(response):
+    """
+        Whether a response says the server turned the request away without acting on it
+    """
+    return response.status_code in REJECTED_STATUSES or \
+        (response.status_code == 503 and response.headers.get("Retry-After") is not None)
+
+
+def parse_retry_after(value):
+    """
+        Parses a Retry-After header, which may be a number of seconds or an HTTP date
+    :return: seconds to wait, or None if there was no usable value
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
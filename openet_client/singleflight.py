@@ -0,0 +1,59 @@
+import threading
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+        Collapses identical calls that are in progress at the same time into one. The first caller for a key runs the
+        function, and anyone else who asks for the same key before it finishes waits for it and receives the same
+        result - or the same exception. Once the call finishes, the next caller for that key runs the function again,
+        so nothing is cached beyond the calls that overlap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        """
+            Runs function, unless a call for key is already running, in which case it waits for that one instead
+        :param key: any hashable value identifying the call
+        :param function: called with no arguments
+        :return: tuple of (result, shared) - shared is True when the result came from another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -5,17 +5,101 @@
 import logging
 import copy
 import datetime
-import arrow
+import json
+import calendar
+import concurrent.futures
+import threading
+
+
+from .exceptions import RateLimitError, DataProcessingError
+from .cache import timeseries_period
+from .rate_limit import RateLimiter
 
 log = logging.getLogger(__name__)
 
+INTERVALS = ("daily", "monthly", "yearly")
+
+
+def _to_date(value):
+	"""
+		Converts a YYYY-MM-DD string, or a datetime.date or datetime.datetime object to a datetime.date. Other objects
+		with a datetime attribute and a .date() method (eg arrow.Arrow) work too, but arrow isn't a dependency.
+	"""
+	if isinstance(value, str):
+		return datetime.date.fromisoformat(value[:10])
+	if isinstance(value, datetime.datetime) or hasattr(value, "datetime"):  # datetimes and arrow.Arrow objects both have .date()
+		return value.date()
+	return value
+
+
+def _to_timestamps(times):
+	"""
+		Parses a pandas Series of API "time" values to datetime64. Only the date part is used (see
+		cache.timeseries_period), so this doesn't need pandas 2's format="ISO8601" to handle timestamps.
+	"""
+	import pandas
+
+	return pandas.to_datetime(times.astype(str).str[:10], format="%Y-%m-%d")
+
+
+def _shift_date(date, interval, add):
+	"""
+		Moves a datetime.date forward (or backward, with a negative add) by a number of intervals. Days past the end of
+		the resulting month are clamped to its last day.
+	"""
+	if interval == "daily":
+		return date + datetime.timedelta(days=add)
+	if interval == "monthly":
+		month_index = date.year * 12 + date.month - 1 + add
+		year, month = divmod(month_index, 12)
+		month += 1
+	elif interval == "yearly":
+		year, month = date.year + add, date.month
+	else:
+		return date
+	return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
+
+
+def results_to_pandas(results, variable=None):
+	"""
+		Converts the list of dictionaries the point sample endpoint returns into pandas in one pass. Times become a
+		datetime64 index and values are converted to numbers (anything that can't be converted becomes NaN).
+	:param results: list of dictionaries with a "time" key and one or more value keys
+	:param variable: When provided and it's the only value column, returns a Series named for the variable
+	:return: pandas.Series when there is a single value column, otherwise a pandas.DataFrame
+	"""
+	import pandas  # imported here so that workers that never ask for pandas output don't pay for importing it
+
+	frame = pandas.DataFrame.from_records(results)
+	if len(frame) == 0:
+		frame = pandas.DataFrame({"time": [], variable or "value": []})
+	frame.index = pandas.DatetimeIndex(_to_timestamps(frame.pop("time")), name="time")
+	frame = frame.apply(pandas.to_numeric, errors="coerce")
+	if len(frame.columns) == 1:
+		return frame.iloc[:, 0]
+	return frame
+
 
 class RasterTimeSeries(object):
 	def __init__(self, raster_manager):
 		self.raster_manager = raster_manager
 		self.client = raster_manager.client
+		self._local = threading.local()
 
-	def point_sample(self, longitude, latitude, start_date, end_date, interval="monthly", make_lookup=False, **params):
+	@property
+	def _coalescer(self):
+		"""
+			The coalesce() block open on this thread, if any - kept per thread so that samples taken on other threads
+			sharing the client aren't held back in it
+		"""
+		return getattr(self._local, "coalescer", None)
+
+	@_coalescer.setter
+	def _coalescer(self, coalescer):
+		self._local.coalescer = coalescer
+
+	def point_sample(self, longitude, latitude, start_date, end_date, interval="monthly", make_lookup=False, use_cache=True,
+					return_type="list", **params):
 		"""
 		A general function to retrieve the timeseries data from OpenET for a specific coordinate and date range. Uses the
 		Raster API endpoint at `raster/timeseries/point <https://open-et.github.io/docs/build/html/ras_timeseries.html#raster-timeseries-point>`_
@@ -35,8 +119,8 @@ class RasterTimeSeries(object):
 
 		:param longitude: Longitude portion of the coordinate to retrieve data from, in decimal degrees. See `OpenET API documentation <https://open-et.github.io/docs/build/html/ras_timeseries.html#raster-timeseries-point>`_ for any additional specifications for this item (param :code:`lon` to the OpenET API)
 		:param latitude: Latitude portion of the coordinate to retrieve data from, in decimal degrees
-		:param start_date: The date to start the sample. Can be a Python standard library datetime.datetime object, an arrow.Arrow object or a string in "YYYY-MM-DD" format.
-		:param end_date: The date to end the sample. Can be a Python standard library datetime.datetime object, an arrow.Arrow object or a string in "YYYY-MM-DD" format.
+		:param start_date: The date to start the sample. Can be a Python standard library datetime.date or datetime.datetime object or a string in "YYYY-MM-DD" format.
+		:param end_date: The date to end the sample. Can be a Python standard library datetime.date or datetime.datetime object or a string in "YYYY-MM-DD" format.
 		:param interval: The time step to use in the timeseries. The OpenET API documentation doesn't specify valid values here, but :code:`monthly: and :code:`daily` are both known allowed values
 						When using the :code:`monthly` timestep, the returned timeseries will use dates for the first of every month within the timeseries. See :code:`return` below
 						for more details
@@ -70,11 +154,24 @@ class RasterTimeSeries(object):
 								"2018-01-01": 30,
 								"2018-02-01": 52,
 							}
+
+						Equivalent to setting :code:`return_type` to :code:`"lookup"`.
+		:param use_cache: When True (the default), each timestep retrieved is saved in the local cache, keyed by the point,
+						interval and all other parameters. Later requests for the same point and parameters then only
+						send requests for the date ranges that aren't already cached (e.g. extending a 2016-2019 series
+						to 2020 only retrieves 2020) and merge the results. Timesteps in the current (incomplete) interval
+						are never cached. Set to False to always retrieve the full date range from the API.
+		:param return_type: What form to return the data in. :code:`"list"` (the default) returns the list of dictionaries
+						from the API, :code:`"lookup"` returns the dictionary described under :code:`make_lookup`, and
+						:code:`"pandas"` returns a pandas Series named for the variable, with a datetime64 index named
+						:code:`time` and a numeric dtype - ready for array math without converting it yourself. If the API
+						returns more than one value per timestep, a DataFrame with one column per value is returned instead.
 		:param params: Additional keyword arguments that the OpenET API allows can be provided to this function and
 						they will be passed along to the API. Do not provide a keyword :code:`params` to this function.
 						Instead, provide keyword arguments that match the OpenET API's parameter names
-		:return: See :code:`make_lookup` above for return behavior, which is dependent on the value of :code:`make_lookup`.
-					Either a list of dictionaries (loaded from JSON) by default, or a dictionary when :code:`make_lookup == True`
+		:return: See :code:`make_lookup` and :code:`return_type` above for return behavior.
+					Either a list of dictionaries (loaded from JSON) by default, a dictionary when :code:`make_lookup == True`
+					or a pandas Series or DataFrame when :code:`return_type == "pandas"`
 		"""
 		send_params = copy.copy(params)
 		send_params["start_date"] = self._date_to_string(start_date)
@@ -88,10 +185,203 @@ class RasterTimeSeries(object):
 		else:
 			send_params["variable"] = send_params["variable"].lower()
 
-		results = self._raw_point_sample(params=send_params)
+		if use_cache:
+			results = self._cached_point_sample(send_params)
+		else:
+			results = self._raw_point_sample(**send_params)
 
 		if make_lookup:
-			results = [{r["time"]: r[send_params["variable"]]} for r in results]
+			return_type = "lookup"
+		if return_type not in ("list", "lookup", "pandas"):
+			raise ValueError("return_type must be one of ('list', 'lookup', 'pandas')")
+
+		if return_type == "lookup":
+			results = {r["time"]: r[send_params["variable"]] for r in results}
+		elif return_type == "pandas":
+			results = results_to_pandas(results, variable=send_params["variable"])
+
+		return results
+
+	def _cached_point_sample(self, send_params):
+		"""
+			Fills in a point sample from the timeseries cache, only sending requests for the runs of timesteps that
+			aren't cached yet, then caches whatever came back and returns the merged series
+		"""
+		start = send_params["start_date"]
+		end = send_params["end_date"]
+		interval = send_params["interval"]
+		last_day = end[:10]  # timesteps are compared by date - see cache.timeseries_period
+		series_key = self._series_key(send_params)
+
+		periods = self._periods(start, end, interval)
+		if len(periods) == 0:
+			return self._raw_point_sample(**send_params)
+
+		cached = self.client.cache.check_timeseries_cache(series_key, periods[0], last_day)
+		missing = [period for period in periods if period not in cached]
+		self.client.metrics.cache_lookup("timeseries", hit=True, count=len(periods) - len(missing))
+		self.client.metrics.cache_lookup("timeseries", hit=False, count=len(missing))
+
+		current_period = self._period_start(datetime.datetime.now(), interval)
+		for run in self._contiguous_runs(missing, interval):
+			run_params = copy.copy(send_params)
+			run_params["start_date"] = max(run[0], start)
+			run_params["end_date"] = min(self._interval_date(start=run[-1], interval=interval, add=1)["end"], end)
+			fetched = self._raw_point_sample(**run_params)
+
+			cached.update({timeseries_period(item): item for item in fetched})
+			self.client.cache.cache_timeseries_items(series_key, [item for item in fetched if timeseries_period(item) < current_period])
+
+		return [cached[period] for period in sorted(cached) if periods[0] <= period <= last_day]
+
+	def _series_key(self, send_params):
+		"""
+			The cache key for a series - every parameter that changes the values returned, but not the date range
+		"""
+		key_params = {key: value for key, value in send_params.items() if key not in ("start_date", "end_date")}
+		key_params["lon"] = round(float(key_params["lon"]), 7)
+		key_params["lat"] = round(float(key_params["lat"]), 7)
+		return json.dumps(key_params, sort_keys=True, default=str)
+
+	def _periods(self, start, end, interval):
+		"""
+			Lists the start of each timestep between start and end (inclusive) as YYYY-MM-DD strings
+		"""
+		period = _to_date(self._period_start(start, interval))
+		if interval not in INTERVALS:  # an interval we don't know how to step through
+			return [period.isoformat()]
+
+		end = _to_date(end)
+		periods = []
+		while period <= end:
+			periods.append(period.isoformat())
+			period = _shift_date(period, interval, 1)
+		return periods
+
+	def _contiguous_runs(self, periods, interval, max_gap=0):
+		"""
+			Splits a sorted list of period start strings into runs where each period is within max_gap
+			timesteps of the one before it
+		"""
+		runs = []
+		for period in periods:
+			if runs:
+				reach = self._interval_date(start=runs[-1][-1], interval=interval, add=max_gap + 1)["end"]
+				if period <= reach:  # YYYY-MM-DD strings sort the same as the dates
+					runs[-1].append(period)
+					continue
+			runs.append([period])
+		return runs
+
+	def point_sample_many(self, points, start_date, end_date, interval="monthly", max_workers=4, wait_time=None,
+							precision=7, longitude_field="longitude", latitude_field="latitude",
+							progress_callback=None, **params):
+		"""
+		Retrieves the same timeseries as :code:`point_sample` for many coordinates at once. Coordinates are rounded to
+		:code:`precision` decimal places and de-duplicated before sending anything, so repeated locations only cost a
+		single request. Requests are spread across a pool of :code:`max_workers` threads, but all of them still go
+		through the client's rate limiter, so the request rate doesn't grow with the number of workers.
+
+		Results come back as a single "tidy" pandas DataFrame with one row per input point and timestep and the columns
+		:code:`point_index`, :code:`longitude`, :code:`latitude`, :code:`time` (as datetime64) and the variable
+		requested (e.g. :code:`et`, as a numeric column).
+		:code:`point_index` is the index label of the point in the input DataFrame, or its position for other inputs.
+
+		If some points fail, the rest are still returned and the failed points are listed, with their errors, in
+		:code:`result.attrs["failed_points"]`. If the API reports that we hit the rate limit, no further requests are
+		started and a RateLimitError is raised with the DataFrame of everything retrieved so far as its :code:`.data`
+		attribute.
+
+		:param points: The coordinates to sample. May be a pandas DataFrame with longitude and latitude columns (see
+						:code:`longitude_field` and :code:`latitude_field`), a two-column array-like of longitude, latitude
+						pairs (e.g. a numpy array with shape (n, 2)), or a list of (longitude, latitude) tuples.
+		:param start_date: The date to start the sample. Same options as for :code:`point_sample`
+		:param end_date: The date to end the sample. Same options as for :code:`point_sample`
+		:param interval: The time step to use in the timeseries. Same options as for :code:`point_sample`
+		:param max_workers: How many requests may be in flight at the same time. Defaults to 4
+		:param wait_time: Optional time in ms between the start of consecutive requests for this call only. When not
+						provided, the client's own rate limiter (:code:`client.rate_limiter`) is used.
+		:param precision: How many decimal places to round coordinates to before de-duplicating them. Defaults to 7,
+						matching the precision used for caching in the geodatabase API.
+		:param longitude_field: The column name holding longitudes when :code:`points` is a DataFrame
+		:param latitude_field: The column name holding latitudes when :code:`points` is a DataFrame
+		:param progress_callback: An optional function called as :code:`progress_callback(completed, total)` each time a
+						unique location finishes (whether or not it succeeded)
+		:param params: Additional keyword arguments for the OpenET API, as with :code:`point_sample`
+		:return: pandas DataFrame - see above
+		"""
+		import pandas
+
+		if isinstance(points, pandas.DataFrame):
+			point_index = points.index
+			longitudes = points[longitude_field]
+			latitudes = points[latitude_field]
+		else:
+			frame = pandas.DataFrame(list(points) if not hasattr(points, "shape") else points)
+			if frame.shape[1] != 2:
+				raise ValueError("points must be a DataFrame or a list/array of (longitude, latitude) pairs")
+			point_index = pandas.RangeIndex(len(frame))
+			longitudes = frame.iloc[:, 0]
+			latitudes = frame.iloc[:, 1]
+
+		inputs = pandas.DataFrame({
+			"point_index": point_index,
+			"longitude": longitudes.to_numpy(dtype=float).round(precision),
+			"latitude": latitudes.to_numpy(dtype=float).round(precision),
+		})
+		unique_points = list(inputs[["longitude", "latitude"]].drop_duplicates().itertuples(index=False, name=None))
+
+		variable = params.get("variable", "et").lower()
+		params["variable"] = variable
+		rate_limiter = RateLimiter(wait_time) if wait_time is not None else None
+
+		def sample(point):
+			if rate_limiter is not None:
+				rate_limiter.wait()
+			return self.point_sample(point[0], point[1], start_date, end_date, interval=interval, **params)
+
+		results = {}
+		failed_points = {}
+		rate_limit_error = None
+		executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+		try:
+			futures = {executor.submit(sample, point): point for point in unique_points}
+			for future in concurrent.futures.as_completed(futures):
+				point = futures[future]
+				try:
+					results[point] = future.result()
+				except concurrent.futures.CancelledError:
+					continue
+				except RateLimitError as e:
+					rate_limit_error = e
+					failed_points[point] = e
+					for pending in futures:  # stop sending anything else - it'll only fail too
+						pending.cancel()
+				except Exception as e:
+					log.warning(f"Failed to retrieve timeseries for point {point}: {e}")
+					failed_points[point] = e
+
+				if progress_callback is not None:
+					progress_callback(len(results) + len(failed_points), len(unique_points))
+		finally:
+			executor.shutdown(wait=True, cancel_futures=True)
+
+		records = [{"longitude": point[0], "latitude": point[1], "time": item["time"], variable: item.get(variable)}
+					for point, items in results.items() for item in items]
+		output = pandas.DataFrame(records, columns=["longitude", "latitude", "time", variable])
+		output["time"] = _to_timestamps(output["time"])
+		output[variable] = pandas.to_numeric(output[variable], errors="coerce")
+		output = inputs.merge(output, on=["longitude", "latitude"], how="inner")
+		output.attrs["failed_points"] = failed_points
+
+		self.client.cache.save_shelf(output)  # hold onto what we've got in case processing it further breaks
+
+		if rate_limit_error is not None:
+			raise RateLimitError(
+				str(rate_limit_error) + ". The retrieved data is available as an attribute '.data' on this exception, but is incomplete.",
+				data=output)
+
+		return output
 
 	def single_day_point_sample(self, longitude, latitude, date, **params):
 		"""
@@ -105,7 +395,7 @@ class RasterTimeSeries(object):
 
 		:param longitude: Longitude portion of the coordinate to retrieve data from, in decimal degrees. See `OpenET API documentation <https://open-et.github.io/docs/build/html/ras_timeseries.html#raster-timeseries-point>`_ for any additional specifications for this item (param :code:`lon` to the OpenET API)
 		:param latitude: Latitude portion of the coordinate to retrieve data from, in decimal degrees
-		:param date: The day to obtain the sample for. The date may be a Python standard library datetime.datetime object, an arrow.Arrow object or a string in "YYYY-MM-DD" format.
+		:param date: The day to obtain the sample for. The date may be a Python standard library datetime.date or datetime.datetime object or a string in "YYYY-MM-DD" format.
 		:param params: Additional keyword arguments that the OpenET API allows can be provided to this function and
 						they will be passed along to the API. Do not provide a keyword :code:`params` to this function.
 						Instead, provide keyword arguments that match the OpenET API's parameter names. Note that in this
@@ -120,7 +410,9 @@ class RasterTimeSeries(object):
 		if "interval" in params:
 			log.warning("Ignoring 'interval' parameter specified - function sets interval to a single day on its own")
 
-		return self._single_point_sample(longitude=longitude, latitude=latitude, date=date, interval="daily")
+			del params["interval"]
+
+		return self._single_point_sample(longitude=longitude, latitude=latitude, date=date, interval="daily", **params)
 
 	def single_month_point_sample(self, longitude, latitude, date, **params):
 		"""
@@ -134,7 +426,7 @@ class RasterTimeSeries(object):
 
 		:param longitude: Longitude portion of the coordinate to retrieve data from, in decimal degrees. See `OpenET API documentation <https://open-et.github.io/docs/build/html/ras_timeseries.html#raster-timeseries-point>`_ for any additional specifications for this item (param :code:`lon` to the OpenET API)
 		:param latitude: Latitude portion of the coordinate to retrieve data from, in decimal degrees
-		:param date: The month to obtain the sample for. The date may be a Python standard library datetime.datetime object, an arrow.Arrow object or a string in "YYYY-MM-DD" format.
+		:param date: The month to obtain the sample for. The date may be a Python standard library datetime.date or datetime.datetime object or a string in "YYYY-MM-DD" format.
 		:param params: Additional keyword arguments that the OpenET API allows can be provided to this function and
 						they will be passed along to the API. Do not provide a keyword :code:`params` to this function.
 						Instead, provide keyword arguments that match the OpenET API's parameter names. Note that in this
@@ -149,17 +441,21 @@ class RasterTimeSeries(object):
 		if "interval" in params:
 			log.warning("Ignoring 'interval' parameter specified - function sets interval to a single month on its own")
 
-		return self._single_point_sample(longitude=longitude, latitude=latitude, date=date, interval="monthly")
+			del params["interval"]
+
+		return self._single_point_sample(longitude=longitude, latitude=latitude, date=date, interval="monthly", **params)
 
 	def _single_point_sample(self, longitude, latitude, date, interval, **params):
+		if self._coalescer is not None:  # inside a coalesce() block - hand back a placeholder and send it later with its neighbors
+			return self._coalescer.add(longitude, latitude, date, interval, **params)
 
 		dates = self._interval_date(start=date, interval=interval, add=1)
 
 		send_params = copy.copy(params)
-		if "variable" not in params:
-			params["variable"] = "et"  # this is the default, but we'll be explicit to avoid surprises since we'll use this below
+		if "variable" not in send_params:
+			send_params["variable"] = "et"  # this is the default, but we'll be explicit to avoid surprises since we'll use this below
 		else:
-			params["variable"] = params["variable"].lower()  # just ensure it's lowercase so we make sure have consistent values
+			send_params["variable"] = send_params["variable"].lower()  # just ensure it's lowercase so we make sure have consistent values
 
 		send_params["interval"] = interval
 		send_params["lon"] = longitude
@@ -168,39 +464,154 @@ class RasterTimeSeries(object):
 		send_params["end_date"] = dates['end']
 
 		result = self._raw_point_sample(**send_params)
-		return result[0][params["variable"]]  # since we'll just be asking for one value in the timeseries, get the first item in the list, and return the value for the variable we requested
+		return result[0][send_params["variable"]]  # since we'll just be asking for one value in the timeseries, get the first item in the list, and return the value for the variable we requested
 
-	def _date_to_string(self, date):
+	def coalesce(self, max_gap=0):
 		"""
-			Handles date parsing to give support for arrow and datetime objects. If it's not one of those, it's assumed to be a string in YYYY-MM-DD format
+		Returns a context manager that gathers up single-date samples and sends them as the smallest number of
+		:code:`point_sample` range requests it can. Inside the :code:`with` block, :code:`single_day_point_sample` and
+		:code:`single_month_point_sample` return a :code:`PendingSample` instead of a value. Nothing is sent until
+		the first time any pending sample's :code:`.value` is read, or the block exits - at that point, every
+		pending sample for the same point, interval and parameters is merged into contiguous date ranges and
+		each range is requested once.
+
+		.. code-block:: python
+
+			with client.raster.timeseries.coalesce():
+				samples = [client.raster.timeseries.single_month_point_sample(-114.6, 42.8, f"2016-{month:02d}-01")
+							for month in range(1, 13)]
+			values = [sample.value for sample in samples]  # sent as a single request for all of 2016
+
+		:param max_gap: How many missing timesteps may sit between two requested dates and still have them merged
+						into one request. Defaults to 0 (only merge dates that are directly adjacent). Larger values
+						retrieve (and discard) some extra data in exchange for fewer requests.
+		:return: SampleCoalescer
 		"""
-		if isinstance(date, arrow.arrow.Arrow):
-			date = date.datetime
-		if isinstance(date, datetime.datetime):
-			date_value = date.strftime("%Y-%m-%d")
-		else:
-			date_value = date
+		return SampleCoalescer(self, max_gap=max_gap)
 
-		return date_value
+	def single_point_samples(self, samples, interval="monthly", max_gap=0, **params):
+		"""
+		The batch form of :code:`single_day_point_sample` and :code:`single_month_point_sample`. Takes a list of
+		(longitude, latitude, date) tuples and returns a list with the value for each one, in the same order,
+		merging requests for the same point into as few range requests as possible (see :code:`coalesce`).
+
+		:param samples: list of (longitude, latitude, date) tuples. Dates may be any format :code:`point_sample` accepts
+		:param interval: "daily" or "monthly" (or any other interval the API supports). Defaults to "monthly"
+		:param max_gap: See :code:`coalesce`
+		:param params: Additional keyword arguments for the OpenET API, sent with every request
+		:return: list of values for the variable requested
+		"""
+		coalescer = SampleCoalescer(self, max_gap=max_gap)
+		pending = [coalescer.add(longitude, latitude, date, interval, **params) for longitude, latitude, date in samples]
+		coalescer.flush()
+		return [item.value for item in pending]
 
-	def _interval_date(self, start, interval, add=1):
-		start_date = start
-		if isinstance(start, datetime.datetime):
-			start_date = arrow.Arrow.fromdatetime(start)
-		elif type(start) is str:
-			# assume start is in YYYY-MM-DD format
-			parts = start.split("-")
-			start_date = arrow.Arrow(year=int(parts[0]), month=int(parts[1]), day=int(parts[2]))
-
-		end_date = start_date
-		if interval == "daily":
-			end_date = start_date.shift(days=add)
-		elif interval == "monthly":
-			end_date = start_date.shift(months=add)
+	def _period_start(self, date, interval):
+		"""
+			Returns the start of the interval the date falls in as a YYYY-MM-DD string - e.g. the first of the month
+			for monthly data - which is how the API labels each timestep
+		"""
+		date = _to_date(date)
+		if interval == "monthly":
+			date = date.replace(day=1)
 		elif interval == "yearly":
-			end_date = start_date.shift(years=add)
+			date = date.replace(month=1, day=1)
+		return date.isoformat()
+
+	def _date_to_string(self, date):
+		"""
+			Handles date parsing to give support for date and datetime objects. If it's not one of those, it's assumed to be a string in YYYY-MM-DD format
+		"""
+		if isinstance(date, str):
+			return date
+		date = _to_date(date)
+		return date.isoformat() if isinstance(date, datetime.date) else date
 
-		return {'start': start_date.strftime("%Y-%m-%d"), 'end': end_date.strftime("%Y-%m-%d")}
+	def _interval_date(self, start, interval, add=1):
+		start_date = _to_date(start)
+		end_date = _shift_date(start_date, interval, add)
+		return {'start': start_date.isoformat(), 'end': end_date.isoformat()}
 
 	def _raw_point_sample(self, **params):
-		return self.client.send_request('raster/timeseries/point', method="get", disable_encoding=False, **params).json()
\ No newline at end of file
+		return self.client.send_request('raster/timeseries/point', method="get", disable_encoding=False, **params).json()
+
+class PendingSample(object):
+	"""
+		A placeholder for a single-date sample that hasn't been sent yet - returned by the single sample functions
+		when they're called inside :code:`RasterTimeSeries.coalesce`. Reading :code:`.value` sends every pending
+		request in the batch (if they haven't been sent already) and returns this sample's value, or raises the
+		error its request hit.
+	"""
+	def __init__(self, coalescer, period):
+		self.period = period
+		self._coalescer = coalescer
+		self._resolved = False
+		self._value = None
+		self._error = None
+
+	def _resolve(self, value=None, error=None):
+		self._value = value
+		self._error = error
+		self._resolved = True
+
+	@property
+	def value(self):
+		if not self._resolved:
+			self._coalescer.flush()
+		if self._error is not None:
+			raise self._error
+		return self._value
+
+
+class SampleCoalescer(object):
+	"""
+		Collects single-date point samples and merges the ones that share a point, interval and parameters into
+		contiguous date range requests. Usually created through :code:`RasterTimeSeries.coalesce` or
+		:code:`RasterTimeSeries.single_point_samples` rather than directly.
+	"""
+	def __init__(self, timeseries, max_gap=0):
+		self.timeseries = timeseries
+		self.max_gap = max_gap
+		self._pending = {}
+		self._previous = None
+
+	def __enter__(self):
+		self._previous = self.timeseries._coalescer
+		self.timeseries._coalescer = self
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.timeseries._coalescer = self._previous
+		if exc_type is None:
+			self.flush()
+
+	def add(self, longitude, latitude, date, interval, **params):
+		params["variable"] = params.get("variable", "et").lower()
+		key = (longitude, latitude, interval, tuple(sorted(params.items())))
+		sample = PendingSample(self, self.timeseries._period_start(date, interval))
+		self._pending.setdefault(key, []).append(sample)
+		return sample
+
+	def flush(self):
+		"""
+			Sends every pending request as merged date ranges and resolves the pending samples with their values
+		"""
+		pending, self._pending = self._pending, {}
+		for (longitude, latitude, interval, params), samples in pending.items():
+			params = dict(params)
+			for run in self.timeseries._contiguous_runs(sorted(set(sample.period for sample in samples)), interval, self.max_gap):
+				run_samples = [sample for sample in samples if sample.period in run]
+				end = self.timeseries._interval_date(start=run[-1], interval=interval, add=1)["end"]
+				try:
+					results = self.timeseries.point_sample(longitude, latitude, run[0], end, interval=interval, **params)
+				except Exception as e:
+					for sample in run_samples:
+						sample._resolve(error=e)
+					continue
+
+				values = {timeseries_period(item): item[params["variable"]] for item in results}
+				for sample in run_samples:
+					if sample.period in values:
+						sample._resolve(value=values[sample.period])
+					else:
+						sample._resolve(error=DataProcessingError(f"The API didn't return a value for {sample.period} at {longitude}, {latitude}"))
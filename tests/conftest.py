@@ -0,0 +1,24 @@
+import pathlib
+
+import pytest
+
+import openet_client
+from benchmarks.mock_server import MockOpenETServer
+
+
+@pytest.fixture
+def mock_server():
+	with MockOpenETServer() as server:
+		yield server
+
+
+@pytest.fixture
+def mock_client(mock_server, monkeypatch, tmp_path):
+	"""
+		A client pointed at the local mock OpenET server, with its cache in a temporary folder
+	"""
+	monkeypatch.setattr(pathlib.Path, "home", lambda: tmp_path)
+	client = openet_client.OpenETClient(token="not_a_real_token")
+	client._base_url = mock_server.base_url
+	client.raster.wait_interval = 0.01
+	return client
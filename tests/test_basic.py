@@ -62,3 +62,112 @@ def test_basic():
     print(client.raster.downloaded_raster_paths)
 
 
+
+
+def test_export_against_mock_server(mock_client, mock_server):
+    rasters = [mock_client.raster.export(params=dict(raster_params, filename_suffix=f"mock_{index}")) for index in range(3)]
+    mock_client.raster.wait_for_rasters()
+
+    assert all(raster.status == openet_client.raster.STATUS_DOWNLOADED for raster in rasters)
+    assert len(mock_client.raster.downloaded_raster_paths) == 3
+    assert all(os.path.exists(path) for path in mock_client.raster.downloaded_raster_paths)
+
+
+def test_geometry_to_string():
+    shapely_geometry = pytest.importorskip("shapely.geometry")
+    from openet_client.raster import _geometry_to_string
+
+    square = shapely_geometry.box(-120.5, 37.0, -120.0, 37.5)
+    assert _geometry_to_string(square) == "-120.0,37.0,-120.0,37.5,-120.5,37.5,-120.5,37.0,-120.0,37.0"
+    assert _geometry_to_string([(-120.5, 37.0), (-120.0, 37.5)]) == "-120.5,37.0,-120.0,37.5"
+    assert _geometry_to_string(raster_params["geometry"]) == raster_params["geometry"]
+
+
+def test_tiled_export_against_mock_server(mock_client, mock_server):
+    shapely_geometry = pytest.importorskip("shapely.geometry")
+    params = dict(raster_params, geometry=shapely_geometry.box(-120.9, 37.0, -120.0, 37.4))
+    tiled = mock_client.raster.export_tiled(params=params, tile_size=0.25)
+
+    exports = [request[2] for request in mock_server.request_log if request[1] == "raster/export"]
+    assert len(tiled.tiles) == len(exports) == 8  # 4 columns by 2 rows
+    assert len(set(export["filename_suffix"] for export in exports)) == 8
+
+    mock_client.raster.wait_for_rasters([tile.uuid for tile in tiled.tiles])
+    assert tiled.status == openet_client.raster.STATUS_DOWNLOADED
+    assert len(tiled.tile_paths) == 8
+
+
+def test_mosaic_rasters(tmp_path):
+    rasterio = pytest.importorskip("rasterio")
+    import numpy
+    from rasterio.transform import from_origin
+    from openet_client.raster import mosaic_rasters
+
+    paths = []
+    for index, (left, top) in enumerate([(0, 10), (5, 10), (0, 5)]):  # three 5x5 tiles of an L shape, leaving one corner empty
+        path = str(tmp_path / f"tile_{index}.tif")
+        with rasterio.open(path, "w", driver="GTiff", width=5, height=5, count=1, dtype="int16", crs="EPSG:4326",
+                           transform=from_origin(left, top, 1, 1), nodata=-1) as tile:
+            tile.write(numpy.full((1, 5, 5), index + 1, dtype="int16"))
+        paths.append(path)
+
+    output = mosaic_rasters(paths, str(tmp_path / "mosaic.tif"))
+    with rasterio.open(output) as mosaic:
+        data = mosaic.read(1)
+        assert data.shape == (10, 10)
+        assert mosaic.bounds == (0, 0, 10, 10)
+        assert (data[:5, :5] == 1).all() and (data[:5, 5:] == 2).all() and (data[5:, :5] == 3).all()
+        assert (data[5:, 5:] == -1).all()
+
+
+def test_registry_indexes_by_status():
+    from openet_client.raster import Raster, RasterRegistry, STATUS_SUBMITTED, STATUS_AVAILABLE, STATUS_DOWNLOADED
+
+    registry = RasterRegistry()
+    rasters = [Raster({"destination": [f"https://example.com/{index}.tif"], "state": "READY"}) for index in range(20000)]
+    for raster in rasters:
+        registry[raster.uuid] = raster
+    assert not hasattr(rasters[0], "__dict__")
+    assert registry.count(STATUS_SUBMITTED) == 20000
+
+    for raster in rasters[:300]:
+        raster.status = STATUS_AVAILABLE
+    rasters[0].status = STATUS_DOWNLOADED
+    assert len(registry.with_status(STATUS_AVAILABLE)) == 299
+    assert registry.with_status(STATUS_DOWNLOADED) == [rasters[0]]
+    assert registry.count(STATUS_SUBMITTED) == 19700
+
+    del registry[rasters[1].uuid]
+    rasters[1].status = STATUS_DOWNLOADED  # no longer tracked
+    assert len(registry) == 19999
+    assert registry.with_status(STATUS_DOWNLOADED) == [rasters[0]]
+
+
+def test_as_completed_streams_rasters(mock_client, mock_server):
+    mock_server.export_delay = 60  # nothing is ready until the test marks it ready
+    first = mock_client.raster.export(params=dict(raster_params, filename_suffix="first"))
+    second = mock_client.raster.export(params=dict(raster_params, filename_suffix="second"))
+    mock_server.mark_ready("first")
+
+    finished = []
+    first.add_done_callback(lambda raster: finished.append(raster.uuid))
+    completed = []
+    for raster in mock_client.raster.as_completed([first, second], callback=lambda raster: completed.append(raster)):
+        if raster is first:
+            assert second.status < openet_client.raster.STATUS_AVAILABLE  # the first is ready before the second
+            mock_server.mark_ready("second")
+        assert raster.status == openet_client.raster.STATUS_DOWNLOADED
+
+    assert completed == [first, second]
+    assert finished == [first.uuid]
+
+    called = []
+    first.add_done_callback(called.append)  # already done, so called right away
+    assert called == [first]
+
+
+def test_as_completed_times_out(mock_client, mock_server):
+    mock_server.export_delay = 60
+    raster = mock_client.raster.export(params=raster_params)
+    with pytest.raises(TimeoutError):
+        list(mock_client.raster.as_completed([raster], max_time=0.1))
@@ -0,0 +1,44 @@
+from openet_client.batching import BatchSizer, batch_shape_key
+from openet_client.cache import MemoryCache
+
+
+def test_sizer_grows_when_fast_and_shrinks_when_slow_or_failing():
+	sizer = BatchSizer(initial=40, maximum=200, target_seconds=10)
+	sizer.record_success(40, seconds=2)
+	assert sizer.size == 60  # grows by at most 1.5 times
+	sizer.record_success(60, seconds=20)
+	assert sizer.size == 30  # scaled to land on the target
+	sizer.record_success(10, seconds=1)
+	assert sizer.size == 30  # short batches don't grow it
+
+	sizer.record_failure(30)
+	assert sizer.size == 15
+	for _ in range(10):
+		sizer.record_success(sizer.size, seconds=0.1)
+	assert sizer.size == 29  # won't grow back to a size that failed
+
+
+def test_shape_key_groups_similar_requests():
+	annual = {"variable": "et", "start_date": 2018, "end_date": 2018, "field_ids": '["A"]'}
+	assert batch_shape_key("timeseries/features/stats/annual", annual) == \
+		batch_shape_key("timeseries/features/stats/annual", dict(annual, start_date=2019, end_date=2019, field_ids='["B"]'))
+	assert batch_shape_key("timeseries/features/stats/annual", annual) != \
+		batch_shape_key("timeseries/features/stats/annual", dict(annual, end_date=2022))
+
+
+def test_adaptive_batches_against_mock_server(mock_client, mock_server):
+	mock_server.max_batch = 10  # larger requests fail, like a server side timeout
+	mock_client.cache = MemoryCache()
+	feature_ids = [f"MOCK{index:05d}" for index in range(60)]
+	params = {"aggregation": "mean", "variable": "et", "start_date": 2018, "end_date": 2018}
+
+	results = mock_client.geodatabase.get_et_for_openet_feature_list(feature_ids, "timeseries/features/stats/annual", dict(params), wait_time=0)
+	assert sorted(result["feature_unique_id"] for result in results) == feature_ids
+	remembered = mock_client.cache.check_batch_size(batch_shape_key("timeseries/features/stats/annual", params))
+	assert 1 <= remembered <= 10
+
+	first_run = mock_server.request_count
+	mock_client.geodatabase.get_et_for_openet_feature_list(feature_ids, "timeseries/features/stats/annual", dict(params), wait_time=0, use_cache=False)
+	second_run = mock_server.request_log[first_run:]
+	assert len(second_run[0][2]["field_ids"].split(",")) == remembered  # started from the remembered size
+	assert len(second_run) < first_run
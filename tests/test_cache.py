@@ -0,0 +1,188 @@
+import concurrent.futures
+import gc
+import sqlite3
+import time
+
+import pytest
+
+from benchmarks.kv_server import KeyValueStoreServer
+from openet_client import OpenETClient
+from openet_client.cache import (CacheBackend, Cacher, MemoryCache, FilesystemCache, KeyValueStoreCache, open_cache,
+									CACHE_PATH_ENVIRONMENT_VARIABLE)
+from openet_client.exceptions import CacheError
+
+
+@pytest.fixture
+def kv_server():
+	with KeyValueStoreServer() as server:
+		yield server
+
+
+@pytest.fixture(params=["sqlite", "memory", "filesystem", "key_value"])
+def backend(request, tmp_path):
+	if request.param == "sqlite":
+		yield Cacher(path=tmp_path / "cache.db")
+	elif request.param == "memory":
+		yield MemoryCache()
+	elif request.param == "filesystem":
+		yield FilesystemCache(path=tmp_path / "fs_cache")
+	else:
+		with KeyValueStoreServer() as server:
+			cache = KeyValueStoreCache(host=server.host, port=server.port)
+			yield cache
+			cache.close()
+
+
+def _write_items(path, worker, count):
+	cache = Cacher(path=path)
+	for index in range(count):
+		cache.cache_gdb_item(f"{worker} {index}", f"ID{worker}_{index}")
+		cache.cache_timeseries_items(f"series_{worker}", [{"time": f"2020-01-{index + 1:02d}", "et": index}])
+	cache.close()
+	return count
+
+
+def _count(path, table):
+	connection = sqlite3.connect(str(path))
+	try:
+		return connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+	finally:
+		connection.close()
+
+
+def test_cache_path_is_configurable(tmp_path, monkeypatch):
+	path = tmp_path / "nested" / "cache.db"
+	cache = Cacher(path=path)
+	cache.cache_gdb_item("-114.6 42.8", "ID1")
+	assert path.exists()
+	assert cache.check_gdb_cache("-114.6 42.8") == "ID1"
+	assert cache.check_gdb_cache("0 0") is False
+
+	monkeypatch.setenv(CACHE_PATH_ENVIRONMENT_VARIABLE, str(path))
+	assert Cacher().check_gdb_cache("-114.6 42.8") == "ID1"
+
+
+def test_threads_share_a_cache(tmp_path):
+	cache = Cacher(path=tmp_path / "cache.db")
+
+	def write(worker):
+		for index in range(20):
+			cache.cache_gdb_item(f"{worker} {index}", f"ID{worker}_{index}")
+			assert cache.check_gdb_cache(f"{worker} {index}") == f"ID{worker}_{index}"
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+		list(pool.map(write, range(8)))
+	assert _count(tmp_path / "cache.db", "geodatabase") == 160
+
+
+def test_connections_close_when_their_threads_exit(tmp_path):
+	cache = Cacher(path=tmp_path / "cache.db")
+	for run in range(20):
+		with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+			list(pool.map(lambda index: cache.cache_gdb_item(f"{run} {index}", "ID"), range(8)))
+	gc.collect()
+	assert len(cache._connections) <= 4
+	assert _count(tmp_path / "cache.db", "geodatabase") == 160
+
+
+def test_processes_share_a_cache(tmp_path):
+	path = str(tmp_path / "cache.db")
+	with concurrent.futures.ProcessPoolExecutor(max_workers=4) as pool:
+		results = list(pool.map(_write_items, [path] * 4, range(4), [25] * 4))
+
+	assert sum(results) == 100
+	assert _count(path, "geodatabase") == 100
+	assert _count(path, "timeseries") == 100
+
+
+def test_backends_behave_the_same(backend):
+	assert backend.check_gdb_cache("-114.6 42.8") is False
+	backend.cache_gdb_item("-114.6 42.8", "ID1")
+	backend.cache_gdb_item("0 0", None)  # a location with no field
+	assert backend.check_gdb_cache("-114.6 42.8") == "ID1"
+	assert backend.check_gdb_cache("0 0") is None
+
+	assert backend.check_timeseries_cache("series", "2020-01-01", "2020-12-31") == {}
+	backend.cache_timeseries_items("series", [{"time": "2020-01-01", "et": 1}, {"time": "2020-02-01", "et": 2}])
+	backend.cache_timeseries_items("series", [{"time": "2020-02-01", "et": 3}, {"time": "2021-01-01", "et": 4}])
+	assert backend.check_timeseries_cache("series", "2020-01-01", "2020-12-31") == {
+		"2020-01-01": {"time": "2020-01-01", "et": 1},
+		"2020-02-01": {"time": "2020-02-01", "et": 3},
+	}
+	assert backend.check_timeseries_cache("other", "2020-01-01", "2021-12-31") == {}
+	backend.check_timeseries_cache("series", "2020-01-01", "2020-01-31")["2020-01-01"]["et"] = 10  # changing a result doesn't change the cache
+	assert backend.check_timeseries_cache("series", "2020-01-01", "2020-01-31")["2020-01-01"]["et"] == 1
+
+	backend.cache_request("https://example.com/", {"a": 1}, 200, "[]")
+
+	assert backend.check_feature_results("stats|{}", ["F1", "F2"]) == {}
+	backend.cache_feature_results("stats|{}", {"F1": [{"feature_unique_id": "F1", "time": "2020-01-01", "et": 5}], "F2": []})
+	assert backend.check_feature_results("stats|{}", ["F1", "F2", "F3"]) == {"F1": [{"feature_unique_id": "F1", "time": "2020-01-01", "et": 5}], "F2": []}
+	assert backend.check_feature_results("other|{}", ["F1"]) == {}
+	time.sleep(0.01)
+	assert backend.check_feature_results("stats|{}", ["F1"], max_age=0) == {}
+
+
+def test_custom_backends_must_implement_the_interface():
+	class FeatureIDsOnly(CacheBackend):
+		def check_gdb_cache(self, key):
+			return False
+
+		def cache_gdb_item(self, key, value):
+			pass
+
+	with pytest.raises(TypeError, match="check_timeseries_cache"):
+		FeatureIDsOnly()
+
+
+def test_memory_cache_drops_least_recently_used():
+	cache = MemoryCache(max_items=2)
+	cache.cache_gdb_item("a", "1")
+	cache.cache_gdb_item("b", "2")
+	cache.check_gdb_cache("a")
+	cache.cache_gdb_item("c", "3")
+	assert cache.check_gdb_cache("b") is False
+	assert cache.check_gdb_cache("a") == "1"
+
+
+def test_key_value_store_options(kv_server):
+	kv_server.password = "secret"
+	with pytest.raises(CacheError):
+		KeyValueStoreCache(host=kv_server.host, port=kv_server.port).check_gdb_cache("a")
+
+	cache = KeyValueStoreCache(host=kv_server.host, port=kv_server.port, password="secret", ttl=60, max_requests=2)
+	cache.cache_gdb_item("a", "1")
+	for index in range(3):
+		cache.cache_request(f"https://example.com/{index}", {}, 200, "[]")
+	assert cache.command("LLEN", "openet_client:requests") == 2
+	assert b"openet_client:gdb:a" in kv_server.expires
+
+	# a second client, like another node in a cluster, sees the same cache
+	assert open_cache(f"redis://:secret@{kv_server.host}:{kv_server.port}/0").check_gdb_cache("a") == "1"
+
+
+def test_key_value_store_reconnects(kv_server):
+	cache = KeyValueStoreCache(host=kv_server.host, port=kv_server.port)
+	cache.cache_gdb_item("a", "1")
+	kv_server.drop_replies = 1
+	assert cache.check_gdb_cache("a") == "1"  # sent again on a new connection
+
+	kv_server.drop_replies = 1
+	with pytest.raises(ConnectionError):
+		cache.cache_request("https://example.com/", {}, 200, "[]")
+	assert cache.command("LLEN", "openet_client:requests") == 1  # RPUSH isn't sent twice
+
+
+def test_open_cache(tmp_path):
+	assert isinstance(open_cache("memory://"), MemoryCache)
+	assert open_cache(f"file://{tmp_path}/fs").path == tmp_path / "fs"
+	assert open_cache(str(tmp_path / "cache.db")).cache_db_path == tmp_path / "cache.db"
+
+
+def test_client_uses_provided_cache(mock_server, kv_server):
+	cache = KeyValueStoreCache(host=kv_server.host, port=kv_server.port)
+	for _ in range(2):
+		client = OpenETClient(token="not_a_real_token", cache=cache)
+		client._base_url = mock_server.base_url
+		client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30")
+	assert mock_server.request_count == 1  # the second client was served from the shared cache
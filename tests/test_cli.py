@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+from openet_client import cli
+
+
+MANIFEST = {
+	"defaults": {"endpoint": "timeseries/features/stats/monthly"},
+	"jobs": [
+		{"name": "fields", "type": "features", "input": "fields.gpkg", "output": "fields.csv", "params": {"variable": "et"},
+			"date_ranges": [["2018-01-01", "2018-12-31"], ["2019-01-01", "2019-12-31"]]},
+		{"type": "raster", "params": {}},
+	]
+}
+
+
+def test_expand_jobs():
+	jobs = cli.expand_jobs(MANIFEST)
+	assert [job["name"] for job in jobs] == ["fields_2018-01-01_2018-12-31", "fields_2019-01-01_2019-12-31", "job_1"]
+	assert jobs[1]["params"] == {"variable": "et", "start_date": "2019-01-01", "end_date": "2019-12-31"}
+	assert jobs[1]["output"] == "fields_2019-01-01_2019-12-31.csv"
+	assert jobs[0]["endpoint"] == "timeseries/features/stats/monthly"
+
+	with pytest.raises(ValueError):
+		cli.expand_jobs({"jobs": [{"type": "not_a_type"}]})
+	with pytest.raises(ValueError):
+		cli.run_manifest(MANIFEST, "token", "state.jsonl", executor="process", cache_location="memory://")
+
+
+def test_run_manifest_resumes(monkeypatch, tmp_path):
+	ran = []
+	interrupted = []
+
+	def fake_run_job(job, client):
+		ran.append(job["name"])
+		if job["name"] == "job_1" and not interrupted:
+			interrupted.append(job["name"])
+			raise RuntimeError("interrupted")
+		return job["name"] + ".out"
+
+	monkeypatch.setattr(cli, "run_job", fake_run_job)
+	state_path = str(tmp_path / "state.jsonl")
+
+	failures = cli.run_manifest(MANIFEST, "token", state_path, workers=2, wait_time=0, progress_stream=io.StringIO())
+	assert list(failures) == ["job_1"]
+
+	ran.clear()
+	failures = cli.run_manifest(MANIFEST, "token", state_path, workers=2, wait_time=0, progress_stream=io.StringIO())
+	assert failures == {}
+	assert ran == ["job_1"]  # only the job that failed the first time runs again
@@ -0,0 +1,35 @@
+import concurrent.futures
+
+import pytest
+
+import openet_client
+from openet_client.exceptions import BadRequestError
+from openet_client.retry import RetryPolicy
+
+
+def test_threads_sharing_a_client_get_their_own_errors(mock_client, mock_server):
+	mock_client.retry_policy = RetryPolicy(max_attempts=1)
+
+	def lookup(index):
+		if index % 2:
+			with pytest.raises(BadRequestError):
+				mock_client.send_request("not/an/endpoint", method="post", index=index)
+			return mock_client._last_request.status_code
+		response = mock_client.send_request("metadata/openet/region_of_interest/feature_ids_list", method="post",
+											coordinates=f"-120.{index} 38.5")
+		assert mock_client._last_request is response
+		return response.status_code
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+		statuses = list(pool.map(lookup, range(40)))
+
+	assert statuses == [404 if index % 2 else 200 for index in range(40)]
+	assert len(mock_client._sessions) <= 8  # one session per thread, reused for all of its requests
+
+
+def test_settings_belong_to_each_client(mock_client):
+	other = openet_client.OpenETClient(token="not_a_real_token")
+	mock_client.force_raise_request_errors = False
+	assert mock_client.raster.wait_interval != other.raster.wait_interval
+	assert other.force_raise_request_errors is True
+	assert openet_client.OpenETClient(token="not_a_real_token").raster.wait_interval == 30
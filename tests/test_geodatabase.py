@@ -1,12 +1,18 @@
+import datetime
 import os
+import pickle
 import pytest
 
 FOLDER = os.path.dirname(os.path.abspath(__file__))
 TEST_DATA = os.path.join(FOLDER, "test_data")
 
 import openet_client
+import openet_client.cache
+from openet_client.batching import batch_shape_key
+from benchmarks.mock_server import _field_id
 
 import geopandas
+import pandas
 
 
 # need to make this use a smaller subset of features before we enable it in CI
@@ -31,4 +37,271 @@ def disable_test_simple_feature_retrieval(features=os.path.join(TEST_DATA, "vw_l
 	)
 
 	result.to_file(os.path.join(TEST_DATA, "results.gpkg"), layer='et_vw_results', driver="GPKG")
-	print(result)
\ No newline at end of file
+	print(result)
+
+def test_feature_retrieval_against_mock_server(mock_client, mock_server):
+	df = geopandas.read_file(os.path.join(TEST_DATA, "simple_features.geojson"))
+	result = mock_client.geodatabase.get_et_for_features(
+		params={"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2018, "end_date": 2018},
+		features=df,
+		feature_type=openet_client.geodatabase.FEATURE_TYPE_GEOPANDAS,
+		output_field="et_2018",
+		wait_time=0,
+	)
+
+	assert set(result["OBJECTID"]) == set(df["OBJECTID"])
+	assert result["et_2018"].notnull().all()
+	lookups = [request for request in mock_server.request_log if request[1].endswith("feature_ids_list")]
+	assert len(lookups) == len(set(result["centroid"]))
+
+
+def test_dry_run_plan(mock_client, mock_server):
+	df = geopandas.read_file(os.path.join(TEST_DATA, "simple_features.geojson"))
+	params = {"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2018, "end_date": 2018}
+
+	plan = mock_client.geodatabase.get_et_for_features(params=params, features=df, feature_type="geopandas",
+														output_field="et", wait_time=1000, batch_size=4, dry_run=True)
+	assert mock_server.request_count == 0
+	assert plan["features"] == len(df)
+	assert plan["cache_hits"] == 0
+	assert plan["lookup_requests"] == plan["unique_keys"]
+	assert plan["et_requests"] == 2  # 6 features in batches of 4
+
+	mock_client.geodatabase.get_et_for_features(params=params, features=df, feature_type="geopandas", output_field="et", wait_time=0)
+	plan = mock_client.geodatabase.get_et_for_features(params=params, features=df, feature_type="geopandas",
+														output_field="et", wait_time=0, dry_run=True)
+	assert plan["cache_hits"] == plan["unique_keys"]
+	assert plan["result_cache_hits"] > 0
+	request_count = mock_server.request_count
+	mock_client.geodatabase.get_et_for_features(params=params, features=df, feature_type="geopandas", output_field="et", wait_time=0)
+	assert plan["total_requests"] == plan["et_requests"] == mock_server.request_count - request_count == 0
+
+	# the same features many times over, with one field's results dropped from the cache
+	many = pandas.concat([df] * 20, ignore_index=True)
+	mock_client.cache._write("DELETE FROM feature_results WHERE rowid IN (SELECT rowid FROM feature_results LIMIT 1)", ())
+	plan = mock_client.geodatabase.get_et_for_features(params=params, features=many, feature_type="geopandas",
+														output_field="et", wait_time=0, batch_size=10, dry_run=True)
+	request_count = mock_server.request_count
+	mock_client.geodatabase.get_et_for_features(params=params, features=many, feature_type="geopandas", output_field="et", wait_time=0, batch_size=10)
+	assert plan["total_requests"] == mock_server.request_count - request_count == 1
+
+
+def test_plan_suggests_batch_size_from_history(mock_client):
+	features = pandas.DataFrame({"openet_feature_id": [f"MOCK{index}" for index in range(1000)]})
+	endpoint = "timeseries/features/stats/annual"
+	params = {"aggregation": "mean", "variable": "et", "start_date": 2018, "end_date": 2018}
+
+	def suggestion(**kwargs):
+		plan = mock_client.geodatabase.plan_et_for_features(features, endpoint=endpoint, params=params, **kwargs)
+		return plan["suggested_batch_size"]
+
+	assert suggestion(wait_time=1000, request_seconds=1) == 60  # fast requests grow the default of 40
+	assert suggestion(wait_time=1000, request_seconds=30) == 20  # slow ones shrink it
+	mock_client.cache.cache_batch_size(batch_shape_key(endpoint, params), 200)
+	assert suggestion(wait_time=1000, request_seconds=1) == 300
+	assert suggestion(wait_time=0, request_seconds=1) == 250  # split between the suggested workers
+
+
+def test_chunked_matches_in_memory(mock_client, mock_server, tmp_path):
+	path = os.path.join(TEST_DATA, "simple_features.geojson")
+	params = {"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2018, "end_date": 2018}
+	expected = mock_client.geodatabase.get_et_for_features(params=params, features=geopandas.read_file(path),
+															feature_type="geopandas", output_field="et", wait_time=0)
+
+	progress = []
+	summary = mock_client.geodatabase.get_et_for_features_chunked(
+		params=params, features=path, output=str(tmp_path / "results.csv"), output_field="et", chunk_size=4,
+		wait_time=0, progress_callback=lambda chunks, features: progress.append((chunks, features)))
+	assert summary["chunks"] == 2
+	assert progress == [(1, 4), (2, 6)]
+
+	result = pandas.read_csv(tmp_path / "results.csv")
+	assert dict(zip(result["OBJECTID"], result["et"])) == dict(zip(expected["OBJECTID"], expected["et"]))
+
+
+def test_chunked_across_processes(mock_client, mock_server, tmp_path):
+	features = geopandas.read_file(os.path.join(TEST_DATA, "simple_features.geojson"))
+	params = {"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2018, "end_date": 2018}
+	summary = mock_client.geodatabase.get_et_for_features_chunked(
+		params=params, features=features, output=str(tmp_path / "results.gpkg"), output_field="et", chunk_size=2,
+		wait_time=0, workers=2)
+
+	result = geopandas.read_file(tmp_path / "results.gpkg")
+	assert summary["chunks"] == 3
+	assert set(result["OBJECTID"]) == set(features["OBJECTID"])
+	assert result["et"].notnull().all()
+	# the worker processes cached the feature IDs they looked up in the client's cache
+	assert mock_client.cache.check_gdb_cache(result["centroid"].iloc[0]) is not False
+	# and their requests were counted in the client's metrics
+	assert mock_client.metrics.counter_value(openet_client.metrics.REQUESTS) == mock_server.request_count
+
+
+def test_chunk_workers_copy_client_settings(mock_client):
+	from openet_client.retry import RetryPolicy
+	mock_client.retry_policy = RetryPolicy(max_attempts=7)
+	mock_client.force_raise_request_errors = False
+	mock_client.deduplicate_requests = False
+	mock_client.geodatabase.prefetch_tile_size = 0.1
+	settings = pickle.loads(pickle.dumps(openet_client.geodatabase._chunk_worker_settings(mock_client, workers=2)))
+
+	openet_client.geodatabase._init_chunk_worker(settings)
+	worker = openet_client.geodatabase._chunk_worker_client
+	assert worker.retry_policy.max_attempts == 7
+	assert worker.force_raise_request_errors is False
+	assert worker.deduplicate_requests is False
+	assert worker.geodatabase.prefetch_tile_size == 0.1
+	assert worker._base_url == mock_client._base_url
+
+
+def test_native_inputs_join_in_their_own_format(mock_client, mock_server, tmp_path):
+	import json
+	path = os.path.join(TEST_DATA, "simple_features.geojson")
+	params = {"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2018, "end_date": 2018}
+	df = geopandas.read_file(path)
+	expected = mock_client.geodatabase.get_et_for_features(params=params, features=df, feature_type="geopandas",
+															output_field="et", wait_time=0)
+	expected_et = dict(zip(expected["OBJECTID"], expected["et"]))
+	requests_before = mock_server.request_count
+
+	with open(path) as geojson_file:
+		collection = json.load(geojson_file)
+	joined = mock_client.geodatabase.get_et_for_features(params=params, features=collection, feature_type="geojson",
+															output_field="et", wait_time=0)
+	assert joined["type"] == "FeatureCollection"
+	assert {feature["properties"]["OBJECTID"]: feature["properties"]["et"] for feature in joined["features"]} == expected_et
+	# the feature IDs were all cached by the geopandas run, since the centroid keys match
+	assert not any(request[1].endswith("feature_ids_list") for request in mock_server.request_log[requests_before:])
+
+	records = mock_client.geodatabase.get_et_for_features(params=params, features=list(df.geometry), feature_type="shapely",
+															output_field="et", wait_time=0)
+	assert {df["OBJECTID"][record["input_index"]]: record["et"] for record in records} == expected_et
+
+	pytest.importorskip("pyarrow")
+	df.to_crs(3310).to_parquet(tmp_path / "features.parquet")  # GeoParquet in California Albers
+	table = mock_client.geodatabase.get_et_for_features(params=params, features=str(tmp_path / "features.parquet"),
+														feature_type="arrow", output_field="et", wait_time=0)
+	assert dict(zip(table.column("OBJECTID").to_pylist(), table.column("et").to_pylist())) == expected_et
+
+
+def test_no_results_return_empty_output(mock_client, mock_server):
+	import json
+	path = os.path.join(TEST_DATA, "simple_features.geojson")
+	params = {"aggregation": "mean", "feature_collection_name": "CA", "model": "ensemble_mean", "variable": "et",
+				"start_date": 2019, "end_date": 2018}  # no periods, so the stats come back empty
+	df = geopandas.read_file(path)
+	assert mock_client.geodatabase.get_et_for_features(params=dict(params), features=df, feature_type="geopandas",
+														output_field="et", wait_time=0, return_type="list") == []
+	with open(path) as geojson_file:
+		frame = mock_client.geodatabase.get_et_for_features(params=dict(params), features=json.load(geojson_file),
+															feature_type="geojson", output_field="et", wait_time=0,
+															return_type="pandas")
+	assert len(frame) == 0
+	joined = mock_client.geodatabase.get_et_for_features(params=dict(params), features=df, feature_type="geopandas",
+														output_field="et", wait_time=0, return_type="joined")
+	assert len(joined) == len(df)
+
+
+def test_rerun_only_fetches_missing_features(mock_client, mock_server):
+	endpoint = "timeseries/features/stats/annual"
+	params = {"aggregation": "mean", "variable": "et", "start_date": 2018, "end_date": 2019}
+	first = mock_client.geodatabase.get_et_for_openet_feature_list(["MOCK1", "MOCK2"], endpoint, dict(params), wait_time=0, batch_size=10)
+
+	request_count = mock_server.request_count
+	results = mock_client.geodatabase.get_et_for_openet_feature_list(["MOCK3", "MOCK1", "MOCK2"], endpoint, dict(params), wait_time=0, batch_size=10)
+	assert [request[2]["field_ids"] for request in mock_server.request_log[request_count:]] == ['["MOCK3"]']
+	assert [result["feature_unique_id"] for result in results] == ["MOCK3", "MOCK3", "MOCK1", "MOCK1", "MOCK2", "MOCK2"]
+	assert results[2:] == first
+
+	# different params, a max_age the cache can't meet, or dates that reach today all request everything again
+	for rerun_params, max_age in ((dict(params, variable="ndvi"), None), (params, 0), (dict(params, end_date=datetime.date.today().year), None)):
+		request_count = mock_server.request_count
+		mock_client.geodatabase.get_et_for_openet_feature_list(["MOCK1"], endpoint, dict(rerun_params), wait_time=0, batch_size=10, max_age=max_age)
+		mock_client.geodatabase.get_et_for_openet_feature_list(["MOCK1"], endpoint, dict(rerun_params), wait_time=0, batch_size=10, max_age=max_age)
+		assert mock_server.request_count - request_count == (1 if rerun_params["variable"] == "ndvi" else 2)
+
+
+def test_refresh_requests_only_new_periods(mock_client, mock_server):
+	endpoint = "timeseries/features/stats/monthly"
+	params = {"aggregation": "mean", "variable": "et", "start_date": "2018-01-01", "end_date": "2018-06-30"}
+	previous = mock_client.geodatabase.get_et_for_openet_feature_list(["MOCK1", "MOCK2"], endpoint, dict(params), wait_time=0)
+	previous.append({"feature_unique_id": "MOCK3", "time": "2018-07-01", "mean": 1})  # a field that's already ahead
+
+	request_count = mock_server.request_count
+	refreshed = mock_client.geodatabase.refresh_et(previous, dict(params, end_date="2018-08-31"), endpoint, wait_time=0)
+	windows = [request[2]["start_date"] for request in mock_server.request_log[request_count:]]
+	assert windows == ["2018-07-01", "2018-08-01"]
+
+	full = mock_client.geodatabase.get_et_for_openet_feature_list(["MOCK1", "MOCK2"], endpoint, dict(params, end_date="2018-08-31"), wait_time=0, use_cache=False)
+	key = lambda record: (record["feature_unique_id"], record["time"])
+	assert sorted((record for record in refreshed if record["feature_unique_id"] != "MOCK3"), key=key) == sorted(full, key=key)
+	assert [record["time"] for record in refreshed if record["feature_unique_id"] == "MOCK3"] == ["2018-07-01", "2018-08-01"]
+
+
+def test_refresh_joined_results_and_parquet(mock_client, mock_server, tmp_path):
+	df = geopandas.read_file(os.path.join(TEST_DATA, "simple_features.geojson"))
+	params = {"aggregation": "mean", "variable": "et", "start_date": "2018-01-01", "end_date": "2018-03-31"}
+	options = {"endpoint": "timeseries/features/stats/monthly", "output_field": "et", "wait_time": 0}
+	joined = mock_client.geodatabase.get_et_for_features(params=dict(params), features=df, feature_type="geopandas", **options)
+
+	refreshed = mock_client.geodatabase.refresh_et(joined, dict(params, end_date="2018-05-31"), **options)
+	full = mock_client.geodatabase.get_et_for_features(params=dict(params, end_date="2018-05-31"), features=df, feature_type="geopandas", **options)
+	assert isinstance(refreshed, geopandas.GeoDataFrame)
+	assert list(refreshed.columns) == list(joined.columns)
+	columns = ["OBJECTID", "openet_feature_id", "time", "et"]
+	pandas.testing.assert_frame_equal(refreshed[columns].sort_values(columns).reset_index(drop=True),
+										full[columns].sort_values(columns).reset_index(drop=True))
+
+	output = tmp_path / "results.parquet"
+	mock_client.geodatabase.get_et_for_features_chunked(params=dict(params), features=df, output=str(output), chunk_size=3, **options)
+	summary = mock_client.geodatabase.refresh_et(str(output), dict(params, end_date="2018-05-31"), **options)
+	assert summary["rows"] == len(full) - len(joined)
+	assert len(geopandas.read_parquet(output)) == len(full)
+	assert mock_client.geodatabase.refresh_et(str(output), dict(params, end_date="2018-05-31"), **options)["rows"] == 0
+
+
+def test_prefetch_feature_ids_by_region(mock_client, mock_server):
+	# 200 parcels in a small area, plus one on its own
+	locations = [f"{round(-120.5123 + (index % 20) * 0.0017, 7)} {round(38.5031 + (index // 20) * 0.0023, 7)}" for index in range(200)]
+	locations.append("-119.00512 37.00431")
+
+	ids = mock_client.geodatabase.get_feature_ids(locations, wait_time=0, prefetch_tile_size=0.05)
+	lookups = [request for request in mock_server.request_log if request[1].endswith("feature_ids_list")]
+	assert len(lookups) < 10
+	assert ["," not in request[2]["coordinates"] for request in lookups].count(True) == 1  # just the lone parcel
+
+	expected = {location: _field_id(*location.split(" ")) for location in locations}
+	assert dict(ids) == expected
+
+	mock_server.region_geometries = False
+	mock_client.cache = openet_client.cache.MemoryCache()
+	request_count = mock_server.request_count
+	assert mock_client.geodatabase.prefetch_feature_ids(locations[:50], wait_time=0) == 0
+	assert dict(mock_client.geodatabase.get_feature_ids(locations[:50], wait_time=0)) == {location: expected[location] for location in locations[:50]}
+	assert mock_server.request_count - request_count > 50  # fell back to a lookup per location
+
+	# an empty list of geometries alongside field IDs can't be trusted to mean there are no fields
+	mock_client.cache = openet_client.cache.MemoryCache()
+	mock_server.fail_next(status=200, body={"feature_unique_ids": ["MOCK1"], "features": []})
+	assert mock_client.geodatabase.prefetch_feature_ids(locations[:5], wait_time=0) == 0  # all in one tile
+	assert mock_client.cache.check_gdb_cache(locations[0]) is False
+	mock_server.fail_next(status=200, body={"feature_unique_ids": [], "features": []})  # a tile with no fields at all
+	assert mock_client.geodatabase.prefetch_feature_ids(locations[:5], wait_time=0) == 5
+	assert mock_client.cache.check_gdb_cache(locations[0]) is None
+
+	# geometries for only some of the listed fields - locations outside them are left for individual lookups
+	mock_client.cache = openet_client.cache.MemoryCache()
+	first_field = expected[locations[0]]
+	column, row = int(first_field[4:11]), int(first_field[11:])
+	ring = [[column * 0.01, row * 0.01], [(column + 1) * 0.01, row * 0.01], [(column + 1) * 0.01, (row + 1) * 0.01], [column * 0.01, (row + 1) * 0.01], [column * 0.01, row * 0.01]]
+	partial = {"feature_unique_ids": [first_field, "MOCK_ELSEWHERE"],
+				"features": [{"type": "Feature", "properties": {"feature_unique_id": first_field}, "geometry": {"type": "Polygon", "coordinates": [ring]}}]}
+	mock_server.fail_next(status=200, body=partial)
+	in_first_field = [location for location in locations[:5] if expected[location] == first_field]
+	assert mock_client.geodatabase.prefetch_feature_ids(locations[:5], wait_time=0) == len(in_first_field) < 5
+	for location in locations[:5]:
+		assert mock_client.cache.check_gdb_cache(location) == (first_field if location in in_first_field else False)
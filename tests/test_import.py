@@ -0,0 +1,8 @@
+from benchmarks.bench_import import measure_startup
+
+
+def test_startup_is_lazy():
+	# importing the package and creating a client shouldn't load geospatial/dataframe stacks or open the cache
+	result = measure_startup(runs=1)
+	assert result["heavy_modules_loaded"] == []
+	assert result["cache_created"] is False
@@ -0,0 +1,51 @@
+import pytest
+
+from openet_client import metrics
+from openet_client.exceptions import BadRequestError
+
+
+def test_request_and_cache_metrics(mock_client, mock_server):
+	recorded = []
+	mock_client.metrics.add_exporter(lambda name, value, labels: recorded.append(name))
+
+	timeseries = mock_client.raster.timeseries
+	timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30")
+	timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30")  # entirely from the cache
+
+	snapshot = mock_client.metrics.snapshot()
+	assert snapshot["summary"]["requests"] == 1
+	assert snapshot["summary"]["cache_hit_rate"] == 0.5
+	assert snapshot["summary"]["response_bytes"] > 0
+	assert snapshot["histograms"][metrics.REQUEST_SECONDS][0]["labels"] == {"endpoint": "raster/timeseries/point"}
+	assert metrics.REQUESTS in recorded
+
+	text = mock_client.metrics.to_prometheus()
+	assert 'openet_requests_total{endpoint="raster/timeseries/point",status="200"} 1' in text
+	assert 'openet_request_seconds_bucket{endpoint="raster/timeseries/point",le="+Inf"} 1' in text
+
+
+def test_error_metrics(mock_client, mock_server):
+	mock_server.fail_next(status=400)
+	with pytest.raises(BadRequestError):
+		mock_client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30")
+	assert mock_client.metrics.counter_value(metrics.REQUEST_ERRORS, error="BadRequestError") == 1
+
+
+def test_timestamped_timeseries_come_from_the_cache(mock_client, mock_server):
+	mock_server.time_suffix = "T00:00:00"
+	timeseries = mock_client.raster.timeseries
+	first = timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30")
+	second = timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30")
+
+	assert mock_server.request_count == 1
+	assert len(first) == len(second) == 6
+	assert second[-1]["time"] == "2016-06-01T00:00:00"
+	assert timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-01") == first  # ends on the last timestep
+	assert mock_server.request_count == 1
+
+
+def test_timestamped_timeseries_as_pandas(mock_client, mock_server):
+	pytest.importorskip("pandas")
+	mock_server.time_suffix = "T00:00:00"
+	series = mock_client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-06-30", return_type="pandas")
+	assert [str(time.date()) for time in series.index] == [f"2016-0{month}-01" for month in range(1, 7)]
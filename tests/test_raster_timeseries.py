@@ -1,5 +1,6 @@
 import pytest
 import os
+import pathlib
 
 import openet_client
 
@@ -64,3 +65,97 @@ def test_single_point_sample_monthly_september():
 													   date="2016-09-01", params={"model": "ensemble", "et_ref_source":"gridmet"})
 
 	assert september_result == TRUE_2016_ET_TS_ENSEMBLE[8]["et"]
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+	"""
+		A client with a fake token whose cache lives in a temporary folder so tests don't share cached data
+	"""
+	monkeypatch.setattr(pathlib.Path, "home", lambda: tmp_path)
+	return openet_client.OpenETClient(token="not_a_real_token")
+
+
+class FakeResponse(object):
+	def __init__(self, data):
+		self.data = data
+
+	def json(self):
+		return self.data
+
+
+def test_point_sample_many_deduplicates(monkeypatch, client):
+	sent = []
+
+	def fake_send_request(endpoint, method="get", disable_encoding=False, **kwargs):
+		sent.append((kwargs["lon"], kwargs["lat"]))
+		return FakeResponse([{"time": item["time"], "et": item["et"] + kwargs["lon"]} for item in TRUE_2016_ET_TS_ENSEMBLE])
+
+	monkeypatch.setattr(client, "send_request", fake_send_request)
+
+	points = [(1, 2), (1.000000001, 2), (3, 4)]
+	result = client.raster.timeseries.point_sample_many(points, "2016-01-01", "2016-12-31", max_workers=2)
+
+	assert sorted(sent) == [(1, 2), (3, 4)]  # the first two points round to the same location
+	assert len(result) == 3 * len(TRUE_2016_ET_TS_ENSEMBLE)
+	assert list(result.columns) == ["point_index", "longitude", "latitude", "time", "et"]
+	assert result[result["point_index"] == 2]["et"].tolist() == [item["et"] + 3 for item in TRUE_2016_ET_TS_ENSEMBLE]
+
+
+def test_coalesced_single_month_samples(monkeypatch, client):
+	sent = []
+
+	def fake_send_request(endpoint, method="get", disable_encoding=False, **kwargs):
+		sent.append((kwargs["start_date"], kwargs["end_date"]))
+		return FakeResponse([item for item in TRUE_2016_ET_TS_ENSEMBLE if kwargs["start_date"] <= item["time"] < kwargs["end_date"]])
+
+	monkeypatch.setattr(client, "send_request", fake_send_request)
+
+	timeseries = client.raster.timeseries
+	with timeseries.coalesce():
+		samples = [timeseries.single_month_point_sample(-114.601811, 42.806546, f"2016-{month:02d}-01") for month in (1, 2, 3, 9)]
+
+	assert [sample.value for sample in samples] == [16, 32, 57, 45]
+	assert sent == [("2016-01-01", "2016-04-01"), ("2016-09-01", "2016-10-01")]
+
+	sent.clear()
+	values = timeseries.single_point_samples([(-114.601811, 42.806546, "2016-09-15"), (-114.601811, 42.806546, "2016-11-01")], max_gap=1)
+	assert values == [45, 16]
+	assert len(sent) == 1
+
+
+def test_point_sample_only_fetches_missing_range(monkeypatch, client):
+	sent = []
+
+	def fake_send_request(endpoint, method="get", disable_encoding=False, **kwargs):
+		sent.append((kwargs["start_date"], kwargs["end_date"]))
+		return FakeResponse([item for item in TRUE_2016_ET_TS_ENSEMBLE if kwargs["start_date"] <= item["time"] <= kwargs["end_date"]])
+
+	monkeypatch.setattr(client, "send_request", fake_send_request)
+
+	first_half = client.raster.timeseries.point_sample(-114.601811, 42.806546, "2016-01-01", "2016-06-30")
+	full_year = client.raster.timeseries.point_sample(-114.601811, 42.806546, "2016-01-01", "2016-12-31")
+
+	assert first_half == TRUE_2016_ET_TS_ENSEMBLE[:6]
+	assert full_year == TRUE_2016_ET_TS_ENSEMBLE
+	assert sent == [("2016-01-01", "2016-06-30"), ("2016-07-01", "2016-12-31")]
+
+
+def test_point_sample_return_types(monkeypatch, client):
+	monkeypatch.setattr(client, "send_request", lambda endpoint, **kwargs: FakeResponse(TRUE_2016_ET_TS_ENSEMBLE))
+
+	lookup = client.raster.timeseries.point_sample(-114.601811, 42.806546, "2016-01-01", "2016-12-31", make_lookup=True, use_cache=False)
+	assert lookup["2016-09-01"] == 45
+
+	series = client.raster.timeseries.point_sample(-114.601811, 42.806546, "2016-01-01", "2016-12-31", return_type="pandas", use_cache=False)
+	assert series.name == "et"
+	assert str(series.index.dtype).startswith("datetime64")
+	assert series.dtype.kind in "if"
+	assert series["2016-09-01"] == 45
+
+
+def test_interval_dates_clamp_month_end(client):
+	timeseries = client.raster.timeseries
+	assert timeseries._interval_date("2016-01-31", "monthly", add=1) == {"start": "2016-01-31", "end": "2016-02-29"}
+	assert timeseries._interval_date("2016-02-29", "yearly", add=1)["end"] == "2017-02-28"
+	assert timeseries._periods("2016-01-15", "2016-04-01", "monthly") == ["2016-01-01", "2016-02-01", "2016-03-01", "2016-04-01"]
@@ -0,0 +1,61 @@
+import pytest
+
+from openet_client import metrics
+from openet_client.exceptions import BadRequestError
+from openet_client.retry import RetryPolicy, RetryBudget, parse_retry_after
+
+
+def test_transient_errors_are_retried(mock_client, mock_server):
+	mock_client.retry_policy = RetryPolicy(backoff_base=0.01, jitter=False)
+	mock_server.fail_next(count=2, status=502)
+
+	result = mock_client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-03-01", use_cache=False)
+
+	assert len(result) == 3
+	assert mock_server.request_count == 3
+	assert mock_client.metrics.counter_value(metrics.RETRIES, reason="502") == 2
+
+
+def test_rate_limits_slow_down_and_honor_retry_after(mock_client, mock_server):
+	mock_client.retry_policy = RetryPolicy(backoff_base=5, jitter=False)
+	mock_server.fail_next(count=1, status=500, body={"description": "You have reached your maximum rate limit"}, headers={"Retry-After": "0"})
+
+	mock_client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-03-01", use_cache=False)
+	assert mock_client.metrics.counter_value(metrics.RETRIES, reason="RateLimitError") == 1
+	assert 0 < mock_client.rate_limiter.penalty < mock_client.rate_limiter.min_penalty  # slowed down, then recovering
+
+	assert parse_retry_after("2") == 2.0
+	assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+	assert RetryPolicy(jitter=False).backoff(3) == 8
+
+
+def test_retry_limits(mock_client, mock_server):
+	mock_client.retry_policy = RetryPolicy(max_attempts=2, backoff_base=0.01, jitter=False)
+	mock_server.fail_next(count=2, status=503)
+	with pytest.raises(BadRequestError):
+		mock_client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-03-01", use_cache=False)
+	assert mock_server.request_count == 2
+
+	mock_client.retry_policy = RetryPolicy(backoff_base=0.01, jitter=False, budget=RetryBudget(max_retries=1))
+	mock_server.fail_next(count=2, status=503)
+	with pytest.raises(BadRequestError):
+		mock_client.raster.timeseries.point_sample(-114.6, 42.8, "2016-01-01", "2016-03-01", use_cache=False)
+	assert mock_client.retry_policy.budget.used == 1
+
+
+def test_exports_only_retry_rejected_requests(mock_client, mock_server):
+	mock_client.retry_policy = RetryPolicy(backoff_base=0.01, jitter=False)
+	params = {"start_date": "2018-01-01", "end_date": "2018-12-31", "geometry": "-120.1,38.1,-120.0,38.1,-120.0,38.0"}
+
+	for status in (502, 504, 503):  # the job may have started - don't start another
+		mock_server.fail_next(count=1, status=status)
+		with pytest.raises(BadRequestError):
+			mock_client.raster.export(params=params)
+	assert mock_server.request_count == 3
+	assert mock_client.metrics.counter_value(metrics.RETRIES) == 0
+
+	mock_server.fail_next(count=1, status=429)
+	mock_server.fail_next(count=1, status=503, headers={"Retry-After": "0"})
+	mock_client.raster.export(params=params)
+	assert mock_server.request_count == 6
+	assert len(mock_server.exports) == 1
@@ -0,0 +1,65 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from openet_client import metrics
+from openet_client.singleflight import SingleFlight
+
+
+def test_overlapping_calls_share_a_result():
+	flight = SingleFlight()
+	calls = []
+	release = threading.Event()
+
+	def slow():
+		calls.append(1)
+		release.wait()
+		return "value"
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+		futures = [pool.submit(flight.do, "key", slow) for _ in range(4)]
+		while flight.in_flight == 0:
+			time.sleep(0.01)
+		time.sleep(0.05)  # give the followers time to start waiting
+		release.set()
+		results = [future.result() for future in futures]
+
+	assert len(calls) == 1
+	assert sorted(shared for _, shared in results) == [False, True, True, True]
+	assert flight.do("key", lambda: "again") == ("again", False)  # nothing is kept once the call finishes
+
+
+def test_errors_are_shared():
+	flight = SingleFlight()
+	release = threading.Event()
+
+	def failing():
+		release.wait()
+		raise ValueError("failed")
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+		futures = [pool.submit(flight.do, "key", failing) for _ in range(2)]
+		time.sleep(0.05)
+		release.set()
+		for future in futures:
+			with pytest.raises(ValueError):
+				future.result()
+
+
+def test_client_deduplicates_concurrent_requests(mock_client, mock_server):
+	mock_server.latency = 0.2
+	params = {"lon": -114.6, "lat": 42.8, "start_date": "2016-01-01", "end_date": "2016-06-30", "interval": "monthly"}
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=6) as pool:
+		responses = list(pool.map(lambda _: mock_client.send_request("raster/timeseries/point", method="post", **params), range(6)))
+
+	assert mock_server.request_count == 1
+	assert all(response.json() == responses[0].json() for response in responses)
+	assert mock_client.metrics.counter_value(metrics.DEDUPLICATED_REQUESTS) == 5
+
+	mock_client.deduplicate_requests = False
+	with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+		list(pool.map(lambda _: mock_client.send_request("raster/timeseries/point", method="post", **params), range(3)))
+	assert mock_server.request_count == 4